@@ -1,13 +1,14 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import func, select
 from app.db.session import get_db, engine, Base
 from app.db import models
-from app.schemas.base import UploadResponse, DocumentOut, AskRequest, Answer, HealthResponse
+from app.schemas.base import UploadResponse, DocumentOut, AskRequest, Answer, SummarizeResponse, HealthResponse
 from app.core.config import get_settings
-from app.core import runtime_state
-from app.services.storage import store_file
-from app.services import retrieval, rag
+from app.core import runtime_state, executors, http_client, metrics
+from app.services import retrieval, rag, uploads, answer_cache, lexical_sync, summaries, tenants, vector_sync
+from app.services.jobs import ingest_queue
 from app.services.retrieval import delete_document_vectors
 from app.services.storage import _client as minio_client, settings as storage_settings
 from app.core import runtime_state as rt_state
@@ -15,7 +16,6 @@ from app.core import runtime_state
 from app.services import embeddings as emb_mod
 from app.services import rag as rag_mod
 import time
-import io
 from app.utils.logging import setup_logging
 
 logger = setup_logging()
@@ -29,12 +29,66 @@ def require_api_key(x_api_key: str | None = Header(None)):
         raise HTTPException(status_code=401, detail="Invalid or missing API key")
 
 
+def current_owner(x_owner_id: str | None = Header(None)) -> str | None:
+    """Tenant of the request with `multi_tenant` (None = unowned documents); ignored otherwise.
+
+    The header is trusted as is: put the API behind a gateway that sets it
+    from the authenticated user (together with API_KEY).
+    """
+    if not settings.multi_tenant:
+        return None
+    try:
+        return tenants.parse_owner(x_owner_id)
+    except tenants.InvalidOwner:
+        raise HTTPException(status_code=400, detail="Invalid X-Owner-Id")
+
+
+async def _owned_document(db: AsyncSession, document_id: int, owner: str | None, detail: str = "Not found") -> models.Document:
+    doc = await db.get(models.Document, document_id)
+    if not doc or (settings.multi_tenant and doc.owner_id != owner):
+        raise HTTPException(status_code=404, detail=detail)
+    return doc
+
+
 @router.on_event("startup")
 async def startup():
     # Create tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-    retrieval.ensure_collection()
+        await conn.run_sync(models.upgrade_schema)
+    executors.start()
+    await http_client.start()
+    if settings.multi_tenant:
+        await tenants.load()
+    try:
+        await lexical_sync.restore(retrieval._LEX_INDEX)
+    except Exception as e:
+        logger.warning(f"Lexical index restore failed; keyword search starts empty: {e}")
+    lexical_sync.start_refresh(retrieval._LEX_INDEX)
+    try:
+        await vector_sync.restore(retrieval._MEM_INDEX)
+    except Exception as e:
+        logger.warning(f"Vector index restore failed; the fallback index starts empty: {e}")
+    vector_sync.start_snapshots(retrieval._MEM_INDEX)
+    await retrieval.ensure_collection()
+    await ingest_queue.start()
+
+
+@router.on_event("shutdown")
+async def shutdown():
+    await ingest_queue.stop()
+    await lexical_sync.stop_refresh()
+    await vector_sync.stop_snapshots(retrieval._MEM_INDEX)
+    executors.shutdown()
+    await http_client.aclose()
+    await retrieval.client.close()
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 @router.get("/health", response_model=HealthResponse)
@@ -49,20 +103,21 @@ async def health():
         components["postgres"] = f"error: {e}"  # noqa: E501
     # Qdrant
     try:
-        retrieval.ensure_collection()
+        await retrieval.ensure_collection()
         components["qdrant"] = "ok"
     except Exception as e:  # pragma: no cover
         components["qdrant"] = f"error: {e}"
     # MinIO
     try:
         from app.services.storage import _client, settings as s
-        # list_objects in minio-py doesn't accept max_keys param; fetch one safely
-        iterator = _client.list_objects(s.minio_bucket, recursive=False)
-        # Advance at most one item to validate access without loading everything
-        try:
+
+        def probe():
+            # list_objects in minio-py doesn't accept max_keys param; fetch one safely
+            iterator = _client.list_objects(s.minio_bucket, recursive=False)
+            # Advance at most one item to validate access without loading everything
             next(iterator, None)
-        except StopIteration:
-            pass
+
+        await executors.run_io(probe)
         components["minio"] = "ok"
     except Exception as e:  # pragma: no cover
         components["minio"] = f"error: {e}"
@@ -155,64 +210,176 @@ async def gemini_test_generate(q: str = "What is a test?", ctx: str = "A test ch
 
 @router.get("/diagnostics")
 async def diagnostics(db: AsyncSession = Depends(get_db)):
-    # Aggregate document ingestion states
-    res = await db.execute(select(models.Document.status, models.Document.id))
-    rows = res.fetchall()
-    total = len(rows)
-    by_status: dict[str,int] = {}
-    for st, _id in rows:  # type: ignore
-        by_status[st] = by_status.get(st, 0) + 1
+    # Aggregate document ingestion states in the database (answered from the status index)
+    res = await db.execute(select(models.Document.status, func.count()).group_by(models.Document.status))
+    by_status: dict[str, int] = {st: n for st, n in res.all()}
     gem = runtime_state.gemini_status()
     return {
-        "documents_total": total,
+        "documents_total": sum(by_status.values()),
         "documents_by_status": by_status,
-        "any_processing": any(st not in ("ingested", "error") for st,_ in rows),
+        "any_processing": any(st not in ("ingested", "error") for st in by_status),
         "gemini": gem,
+        "embedding_cache": emb_mod.cache_stats(),
+        "gemini_http_pool": http_client.pool_stats(),
+        "answer_cache": answer_cache.get_cache().stats(),
+        "lexical_index": {
+            "chunks": len(retrieval._LEX_INDEX),
+            "snapshot": retrieval._LEX_INDEX.snapshot.version if retrieval._LEX_INDEX.snapshot else None,
+            "changes_since_snapshot": retrieval._LEX_INDEX.changes_since_snapshot,
+        },
     }
 
 
 
-@router.post("/upload", response_model=UploadResponse)
-async def upload(file: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
-    if not file.content_type:
-        raise HTTPException(status_code=400, detail="Unknown content type")
-    content = await file.read()
-    if len(content) > 50 * 1024 * 1024:
+async def _receive_upload(request: Request) -> uploads.StoredUpload:
+    # The multipart body is streamed straight into MinIO (form field "file").
+    max_bytes = settings.upload_max_mb * 1024 * 1024
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes + 64 * 1024:  # allow for multipart framing
         raise HTTPException(status_code=413, detail="File too large")
-    buffer = io.BytesIO(content)
-    object_name = store_file(buffer, file.filename)
+    try:
+        return await uploads.stream_upload(
+            request.headers.get("content-type", ""), request.stream(), max_bytes
+        )
+    except uploads.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    except uploads.UploadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _remove_object(object_name: str | None):
+    try:
+        if object_name:
+            await executors.run_io(minio_client.remove_object, storage_settings.minio_bucket, object_name)
+    except Exception:  # pragma: no cover
+        logger.warning("Failed removing object from MinIO")
+
+
+@router.post("/upload", response_model=UploadResponse)
+async def upload(request: Request, db: AsyncSession = Depends(get_db), owner: str | None = Depends(current_owner)):
+    stored = await _receive_upload(request)
     doc = models.Document(
-        filename=file.filename,
-        content_type=file.content_type,
-        original_path=object_name,
-        status="uploaded",
+        filename=stored.filename,
+        content_type=stored.content_type,
+        original_path=stored.object_name,
+        size_bytes=stored.size,
+        sha256=stored.sha256,
+        status="queued",
+        owner_id=owner,
     )
     db.add(doc)
     await db.commit()
     await db.refresh(doc)
-    logger.info(f"Stored file {file.filename} as {object_name} (doc_id={doc.id})")
-    # Always inline ingest now (Celery removed)
+    logger.info(f"Stored file {stored.filename} as {stored.object_name} ({stored.size} bytes, sha256={stored.sha256[:12]}, doc_id={doc.id})")
+    # Ingestion runs on the background queue; SYNC_INGEST keeps it inside this request.
     try:
-        from app.services.tasks import ingest_document
-        current_key = runtime_state.get_gemini_key("") or None
-        await ingest_document(doc.id, object_name, file.content_type, current_key)
+        task_id = await ingest_queue.submit(doc.id, stored.object_name, stored.content_type, run_inline=settings.sync_ingest)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+    if settings.sync_ingest:
         await db.refresh(doc)
-        return UploadResponse(document_id=doc.id, task_id="inline", status=doc.status)
+    return UploadResponse(document_id=doc.id, task_id=task_id, status=doc.status)
+
+
+@router.put("/documents/{document_id}", response_model=UploadResponse)
+async def reupload_document(document_id: int, request: Request, db: AsyncSession = Depends(get_db),
+                            owner: str | None = Depends(current_owner)):
+    """Replace a document's file and re-ingest it incrementally.
+
+    Chunks whose text is unchanged keep their point ids and are neither
+    re-embedded nor re-upserted; an identical file is a no-op.
+    """
+    doc = await _owned_document(db, document_id, owner)
+    stored = await _receive_upload(request)
+    if doc.sha256 == stored.sha256 and doc.status == "ingested":
+        await _remove_object(stored.object_name)
+        return UploadResponse(document_id=doc.id, task_id="", status="unchanged")
+    # The old job must be done before its file is deleted and a new job diffs against the chunk rows it may drop.
+    if not await ingest_queue.cancel_for_document(document_id, wait_s=settings.ingest_cancel_wait_s):
+        await _remove_object(stored.object_name)
+        raise HTTPException(status_code=409, detail="The previous ingestion of this document is still stopping; retry shortly")
+    old_object = doc.original_path
+    doc.filename = stored.filename
+    doc.content_type = stored.content_type
+    doc.original_path = stored.object_name
+    doc.size_bytes = stored.size
+    doc.sha256 = stored.sha256
+    doc.status = "queued"
+    await db.commit()
+    await _remove_object(old_object)
+    logger.info(f"Replaced file of doc {doc.id} with {stored.object_name} ({stored.size} bytes)")
+    try:
+        task_id = await ingest_queue.submit(doc.id, stored.object_name, stored.content_type, run_inline=settings.sync_ingest)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ingestion failed: {e}")
+    if settings.sync_ingest:
+        await db.refresh(doc)
+    return UploadResponse(document_id=doc.id, task_id=task_id, status=doc.status)
 
 
 @router.get("/documents", response_model=list[DocumentOut])
-async def list_documents(db: AsyncSession = Depends(get_db)):
-    res = await db.execute(select(models.Document).order_by(models.Document.created_at.desc()))
-    return res.scalars().all()
+async def list_documents(
+    response: Response,
+    status: str | None = None,
+    before: int | None = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int | None = Query(None, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    owner: str | None = Depends(current_owner),
+):
+    """Newest documents first, one page at a time.
+
+    Keyset pagination on the id (ids grow with upload time), so a deep page
+    costs the same as the first. When the page is full the `X-Next-Cursor`
+    header holds the `before` value for the next one.
+    """
+    limit = limit or settings.documents_page_size
+    stmt = select(models.Document.id, models.Document.filename, models.Document.status).order_by(models.Document.id.desc()).limit(limit)
+    if status:
+        stmt = stmt.where(models.Document.status == status)
+    if settings.multi_tenant:
+        stmt = stmt.where(models.Document.owner_id == owner if owner else models.Document.owner_id.is_(None))
+    if before is not None:
+        stmt = stmt.where(models.Document.id < before)
+    rows = (await db.execute(stmt)).all()
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = str(rows[-1].id)
+    return [row._asdict() for row in rows]
 
 
 @router.post("/ask", response_model=Answer)
-async def ask(req: AskRequest):
+async def ask(req: AskRequest, owner: str | None = Depends(current_owner)):
+    answer = await _ask(req, owner)
+    metrics.observe_timings(metrics.ASK_SECONDS, answer.get("timings"))
+    return answer
+
+
+async def _ask(req: AskRequest, owner: str | None = None) -> dict:
     start = time.time()
+    # Answers retrieved with overridden fusion settings are neither served from nor stored in the cache.
+    cache = answer_cache.get_cache() if settings.answer_cache_enabled and req.default_retrieval else None
+    # Per-stage wall time in ms, returned as `timings` (embed / retrieve / generate, or cache).
+    timings: dict = {}
+    if cache:
+        cached = cache.get_exact(req.question, req.document_ids, owner_id=owner)
+        if cached:
+            cached["latency_ms"] = int((time.time() - start) * 1000)
+            cached["timings"] = {"cache_ms": (time.time() - start) * 1000}
+            return cached
+        epoch = cache.epoch
     try:
-        results = await retrieval.search(req.question, settings.top_k, document_ids=req.document_ids)
+        t0 = time.time()
+        qvecs = await emb_mod.embed_texts([req.question])
+        timings["embed_ms"] = (time.time() - t0) * 1000
+        if cache:
+            cached = cache.get_similar(qvecs[0], req.document_ids, (time.time() - start) * 1000, owner_id=owner)
+            if cached:
+                cached["latency_ms"] = int((time.time() - start) * 1000)
+                cached["timings"] = {**timings, "cache_ms": (time.time() - start) * 1000 - timings["embed_ms"]}
+                return cached
+        t0 = time.time()
+        results = await retrieval.search(req.question, settings.top_k, document_ids=req.document_ids, query_vectors=qvecs,
+                                         hybrid_weight=req.hybrid_weight, fusion_strategy=req.fusion, owner_id=owner)
+        timings["retrieve_ms"] = (time.time() - t0) * 1000
     except Exception as e:  # broad catch to prevent 500 surface
         logger.error(f"Retrieval failure: {e}")
         return {
@@ -224,8 +391,9 @@ async def ask(req: AskRequest):
             "generation_mode": "not_started",
             "embed_mode": None,
             "fallback_reason": "retrieval_error",
+            "timings": timings,
         }
-    filtered = [r for r in results if r.get("hybrid_score", r.get("score", 0)) >= settings.similarity_threshold]
+    filtered = [r for r in results if r.get("relevance", r.get("score", 0)) >= settings.similarity_threshold]
     if not filtered:
         return {
             "answer": "I'm sorry, that appears to be outside the scope of the provided documents or they are still ingesting.",
@@ -236,8 +404,11 @@ async def ask(req: AskRequest):
             "generation_mode": "none",
             "embed_mode": filtered[0].get("_embed_mode") if filtered else None,
             "fallback_reason": "no_results",
+            "timings": timings,
         }
+    t0 = time.time()
     answer = await rag.generate_answer(req.question, filtered)
+    timings["generate_ms"] = (time.time() - t0) * 1000
     # Determine embedding mode from vector list attribute if present on retrieval internals
     # retrieval.add_documents stores vectors but we can infer from generation context: attach from answer if missing
     answer.setdefault("embed_mode", filtered[0].get("_embed_mode") if filtered and filtered[0].get("_embed_mode") else None)
@@ -246,35 +417,32 @@ async def ask(req: AskRequest):
     answer["source_snippets"] = [c.get("text", "")[:220] for c in filtered]
     # Include document ids used so UI can highlight
     answer["document_ids_used"] = list({c.get("document_id") for c in filtered if c.get("document_id") is not None})
+    answer["chunk_ids"] = [c["chunk_id"] for c in filtered if c.get("chunk_id")]
+    answer["timings"] = timings
     answer["latency_ms"] = int((time.time() - start) * 1000)
     answer.setdefault("retrieved", len(filtered))
+    if cache and answer_cache.cacheable(answer):
+        cache.put(req.question, req.document_ids, qvecs[0], answer, answer["latency_ms"], answer["document_ids_used"], epoch, owner_id=owner)
     return answer
 
 
-@router.get("/summarize/{document_id}", response_model=Answer)
-async def summarize(document_id: int, db: AsyncSession = Depends(get_db)):
-    doc = await db.get(models.Document, document_id)
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
-    if not doc.aggregated_text:
+@router.get("/summarize/{document_id}", response_model=SummarizeResponse)
+async def summarize(document_id: int, db: AsyncSession = Depends(get_db), owner: str | None = Depends(current_owner)):
+    await _owned_document(db, document_id, owner, "Document not found")
+    try:
+        return await summaries.summarize_document(document_id)
+    except summaries.SummaryUnavailable:
         raise HTTPException(status_code=400, detail="Document not ingested yet")
-    result = await rag.summarize(doc.aggregated_text)
-    return result
 
 
 @router.delete("/documents/{document_id}")
-async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
-    doc = await db.get(models.Document, document_id)
-    if not doc:
-        raise HTTPException(status_code=404, detail="Not found")
-    # Delete vectors first
-    delete_document_vectors(document_id)
+async def delete_document(document_id: int, db: AsyncSession = Depends(get_db), owner: str | None = Depends(current_owner)):
+    doc = await _owned_document(db, document_id, owner)
+    # Stop any ingestion still running for it, then delete vectors
+    await ingest_queue.cancel_for_document(document_id)
+    await delete_document_vectors(document_id, doc.owner_id)
     # Delete object in MinIO
-    try:
-        if doc.original_path:
-            minio_client.remove_object(storage_settings.minio_bucket, doc.original_path)
-    except Exception:  # pragma: no cover
-        logger.warning("Failed removing object from MinIO")
+    await _remove_object(doc.original_path)
     await db.delete(doc)
     await db.commit()
     return {"status": "deleted", "document_id": document_id}
@@ -282,12 +450,20 @@ async def delete_document(document_id: int, db: AsyncSession = Depends(get_db)):
 
 @router.get("/tasks/{task_id}")
 async def task_status(task_id: str):
-    """Legacy endpoint kept for frontend backward compatibility.
-    Since ingestion is now inline (no Celery), we just echo that the task is done.
-    Frontend should stop polling this and rely on /documents list instead."""
-    if task_id == "inline":
-        return {"task_id": task_id, "status": "done", "result": None}
-    return {"task_id": task_id, "status": "unknown", "result": None}
+    """Ingestion job status with per-stage progress (pages parsed, chunks embedded)."""
+    job = await ingest_queue.get(task_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return job
+
+
+@router.post("/tasks/{task_id}/cancel")
+async def task_cancel(task_id: str):
+    status = await ingest_queue.cancel(task_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    # A running job stops at its next stage boundary
+    return {"task_id": task_id, "status": "CANCELLING" if status == "STARTED" else status}
 
 
 @router.post("/admin/reset")
@@ -300,18 +476,25 @@ async def admin_reset(token: str):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
-    # Qdrant collection wipe
+    # Qdrant collection wipe (including per-owner collections)
     try:
-        retrieval.client.delete_collection(settings.qdrant_collection)
+        for c in (await retrieval.client.get_collections()).collections:
+            if tenants.is_tenant_collection(c.name):
+                await retrieval.client.delete_collection(c.name)
     except Exception:
         pass
+    retrieval.reset_collection_state()
+    tenants.owners.clear()
+    answer_cache.get_cache().clear()
     # MinIO bucket wipe (objects only)
-    try:
+    def wipe_bucket():
         for obj in minio_client.list_objects(storage_settings.minio_bucket, recursive=True):
             try:
                 minio_client.remove_object(storage_settings.minio_bucket, obj.object_name)
             except Exception:  # noqa: E722
                 pass
+    try:
+        await executors.run_io(wipe_bucket)
     except Exception:
         pass
     # Redis purge skipped (redis removed)
@@ -319,10 +502,7 @@ async def admin_reset(token: str):
     try:
         from app.services import retrieval as rmod
         rmod._MEM_INDEX.clear()  # type: ignore
-        rmod._LEX_CHUNKS.clear()  # type: ignore
-        rmod._LEX_TERM_FREQS.clear()  # type: ignore
-        rmod._LEX_DOC_FREQ.clear()  # type: ignore
-        rmod._LEX_TOTAL = 0  # type: ignore
+        rmod._LEX_INDEX.clear()  # type: ignore
     except Exception:
         pass
     return {"status": "reset", "message": "All stores cleared"}
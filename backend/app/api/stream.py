@@ -2,39 +2,75 @@ from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
 from app.schemas.base import AskRequest
 from app.core.config import get_settings
-from app.services import retrieval, rag
-import asyncio, json, time
-from .routes import require_api_key
+from app.core import metrics
+from app.services import retrieval, rag, answer_cache
+from app.services.embeddings import embed_texts
+import json, time
+from loguru import logger
+from .routes import current_owner, require_api_key
 
 router_stream = APIRouter()
 settings = get_settings()
 
 
 @router_stream.post("/ask/stream")
-async def ask_stream(req: AskRequest, _: None = Depends(require_api_key)):
+async def ask_stream(req: AskRequest, _: None = Depends(require_api_key), owner: str | None = Depends(current_owner)):
     start = time.time()
-    results = await retrieval.search(req.question, settings.top_k, document_ids=req.document_ids)
-    filtered = [r for r in results if r.get("hybrid_score", r.get("score", 0)) >= settings.similarity_threshold]
+    # Answers retrieved with overridden fusion settings are neither served from nor stored in the cache.
+    cache = answer_cache.get_cache() if settings.answer_cache_enabled and req.default_retrieval else None
+    cached = cache.get_exact(req.question, req.document_ids, owner_id=owner) if cache else None
+    epoch = cache.epoch if cache else 0
+    filtered: list = []
+    if cached is None:
+        with metrics.timer(metrics.ASK_SECONDS, stage="embed"):
+            qvecs = await embed_texts([req.question])
+        if cache:
+            cached = cache.get_similar(qvecs[0], req.document_ids, (time.time() - start) * 1000, owner_id=owner)
+        if cached is None:
+            with metrics.timer(metrics.ASK_SECONDS, stage="retrieve"):
+                results = await retrieval.search(req.question, settings.top_k, document_ids=req.document_ids, query_vectors=qvecs,
+                                                 hybrid_weight=req.hybrid_weight, fusion_strategy=req.fusion, owner_id=owner)
+            filtered = [r for r in results if r.get("relevance", r.get("score", 0)) >= settings.similarity_threshold]
 
     async def gen():
+        if cached is not None:
+            # Served whole: one delta with the cached text, then the final event.
+            text = cached.get("answer", "")
+            yield f"data: {json.dumps({'delta': text})}\n\n"
+            cached["latency_ms"] = cached["ttft_ms"] = int((time.time() - start) * 1000)
+            yield f"data: {json.dumps(cached)}\n\n"
+            yield "event: end\ndata: {}\n\n"
+            return
         if not filtered:
             yield f"data: {json.dumps({'answer': 'OUT_OF_SCOPE', 'answer_type': 'out_of_scope', 'sources': []})}\n\n"
             yield "event: end\ndata: {}\n\n"
             return
-        answer = await rag.generate_answer(req.question, filtered)
+        answer: dict = {}
+        ttft_ms = None
+        # Tokens are forwarded as Gemini produces them, each event carrying only
+        # its own delta (clients concatenate them); the final event has the full text.
+        async for event in rag.stream_answer(req.question, filtered):
+            if "delta" in event:
+                if ttft_ms is None:
+                    ttft_ms = int((time.time() - start) * 1000)
+                yield f"data: {json.dumps({'delta': event['delta']})}\n\n"
+            else:
+                answer = event["final"]
         # Propagate embedding mode from first chunk if present
         if not answer.get("embed_mode"):
             answer["embed_mode"] = filtered[0].get("_embed_mode") if filtered and filtered[0].get("_embed_mode") else None
         answer.setdefault("generation_mode", "unknown")
         answer.setdefault("fallback_reason", None)
-        full = answer.get("answer", "")
-        sentences = [s.strip() for s in full.replace('\n', ' ').split('.') if s.strip()]
-        acc = ""
-        for s in sentences:
-            acc += s + '. '
-            yield f"data: {json.dumps({'partial': acc.strip()})}\n\n"
-            await asyncio.sleep(0.05)
+        answer["document_ids_used"] = list({c.get("document_id") for c in filtered if c.get("document_id") is not None})
         answer["latency_ms"] = int((time.time() - start) * 1000)
+        answer["ttft_ms"] = ttft_ms if ttft_ms is not None else answer["latency_ms"]
+        metrics.ASK_SECONDS.observe(answer["ttft_ms"] / 1000.0, stage="ttft")
+        logger.info(
+            f"ask_stream ttft_ms={answer['ttft_ms']} total_ms={answer['latency_ms']} "
+            f"mode={answer['generation_mode']} chars={len(answer.get('answer', ''))}"
+        )
+        if cache and answer_cache.cacheable(answer):
+            cache.put(req.question, req.document_ids, qvecs[0], answer, answer["latency_ms"], answer["document_ids_used"], epoch, owner_id=owner)
         yield f"data: {json.dumps(answer)}\n\n"
         yield "event: end\ndata: {}\n\n"
 
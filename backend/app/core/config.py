@@ -9,28 +9,125 @@ class Settings(BaseSettings):
     embedding_model: str = "text-embedding-004"
     # gemini-1.5-flash not available for this key; switch to gemini-flash-latest.
     generation_model: str = "gemini-flash-latest"
-    # Optional small delay (ms) between embedding API calls to reduce 429 rate-limit bursts.
-    embedding_rate_delay_ms: int = 150
+    # Base URL for the Gemini REST API (override to point at a local mock server).
+    gemini_api_base: str = "https://generativelanguage.googleapis.com/v1beta"
+    # Shared Gemini HTTP client: keep-alive pool limits, timeouts (seconds) and optional HTTP/2 (needs `h2`).
+    gemini_http2: bool = False
+    gemini_max_connections: int = 20
+    gemini_max_keepalive: int = 10
+    gemini_keepalive_expiry_s: float = 30.0
+    gemini_connect_timeout_s: float = 10.0
+    gemini_read_timeout_s: float = 120.0
+    gemini_pool_timeout_s: float = 30.0
+    # Texts per batchEmbedContents request (Gemini accepts at most 100).
+    embedding_batch_size: int = 100
+    # Maximum embedding batch requests in flight at once.
+    embedding_max_concurrency: int = 4
+    # Token-bucket rate limit for embedding requests; halved on 429 and recovered on success.
+    embedding_requests_per_second: float = 5.0
+    embedding_burst: int = 5
+    # Embedding cache keyed by (model, sha256(normalized text)); empty path disables the disk tier.
+    embedding_cache_path: str = "./embedding_cache.sqlite3"
+    embedding_cache_memory_mb: int = 64
+    embedding_cache_disk_max_mb: int = 1024
 
     database_url: str = "sqlite+aiosqlite:///./app.db"
+    # Default page size of GET /documents.
+    documents_page_size: int = 100
+    # Chunk rows per INSERT batch when persisting (Postgres uses COPY instead).
+    chunk_insert_batch_size: int = 1000
     qdrant_url: str
     qdrant_collection: str = "documents"
+    # Points per Qdrant upsert / payload-update / delete request.
+    qdrant_upsert_batch_size: int = 256
+    # Vector quantization for new Qdrant collections and the in-process fallback index: "none", "int8" (scalar) or
+    # "binary" (1 bit per dimension). Searches take rescore_factor x the wanted hits from the codes and rescore them exactly.
+    vector_quantization: str = "none"
+    vector_rescore_factor: int = 4
+    # Where the quantized fallback index memory-maps its full-precision vectors (None = system temp dir).
+    vector_spill_dir: str | None = None
+    # The fallback index partitions a dimension into IVF lists once it holds this many vectors (0 = always scan all).
+    vector_ann_min_rows: int = 50_000
+    # IVF lists (0 = about sqrt(vectors) when partitioning, at most 1024) and lists scanned per query (recall vs latency).
+    vector_ann_lists: int = 0
+    vector_ann_probes: int = 16
+    # Snapshots of the fallback index, memory-mapped at startup (None keeps it in memory only).
+    vector_index_dir: str | None = "./vector_index"
+    # Seconds between snapshots while the fallback index changes (0 = only at shutdown).
+    vector_snapshot_s: float = 0.0
+    # Scope documents, searches and cached answers by the X-Owner-Id header (requests without it see unowned documents).
+    multi_tenant: bool = False
+    # Qdrant layout with multi_tenant: "payload" (one collection, indexed owner_id filter) or "collection" (one per owner).
+    qdrant_tenant_layout: str = "payload"
 
     minio_endpoint: str
     minio_bucket: str = "documents"
     minio_root_user: str
     minio_root_password: str
+    # Uploads stream to MinIO as multipart uploads of this part size (MiB, minimum 5).
+    upload_part_size_mb: int = 8
+    upload_max_mb: int = 50
+    # Where ingestion spools downloaded objects for parsing (None = system temp dir).
+    ingest_tmp_dir: str | None = None
 
+    # Thread pool for blocking client calls (MinIO) and process pool for document parsing (0 = parse in a thread).
+    io_workers: int = 16
+    parse_workers: int = 2
+    # PDFs are split into page ranges of this size and parsed/OCRed in parallel on the parse pool.
+    parse_pages_per_task: int = 8
+    # Render resolution for OCR of pages without a text layer (Tesseract prefers 200-300).
+    ocr_dpi: int = 72
+
+    # Memory-mapped BM25 snapshots shared by all workers (None keeps the index in memory only).
+    lexical_index_dir: str | None = "./lexical_index"
+    # Rebuild the snapshot from the chunks table once changes exceed this fraction of it.
+    lexical_rebuild_ratio: float = 0.2
+    # Seconds between catch-ups with the chunks table (0 = only at startup; set for multi-worker).
+    lexical_refresh_s: float = 0.0
 
     chunk_size: int = 800
     chunk_overlap: int = 120
+    # Minimum `relevance` of a chunk used for an answer: its cosine or normalized BM25 score,
+    # whichever is higher (see services/fusion.py), independent of the fusion strategy.
     similarity_threshold: float = 0.55
     top_k: int = 5
-    sync_ingest: bool = False
+    # Answer prompts (services/context.py): estimated-token budget for the context passages,
+    # characters per token for the estimate, and word 3-gram Jaccard similarity treated as a duplicate.
+    context_token_budget: int = 1500
+    context_chars_per_token: float = 4.0
+    context_dedup_jaccard: float = 0.8
+    # Hybrid score fusion: "rrf", "zscore" or "convex" (see services/fusion.py); both can be
+    # overridden per request. hybrid_weight is the keyword share of the blend.
+    fusion_strategy: str = "rrf"
+    hybrid_weight: float = 0.4
+    fusion_rrf_k: int = 60
+    # Each retriever returns top_k * fusion_overfetch candidates before fusion.
+    fusion_overfetch: int = 4
+    # Answer cache for /ask and /ask/stream; similarity is the query-embedding
+    # cosine above which a differently worded question reuses a cached answer.
+    answer_cache_enabled: bool = True
+    answer_cache_max_entries: int = 1000
+    answer_cache_ttl_s: float = 3600.0
+    answer_cache_similarity: float = 0.95
+    # Map-reduce summaries (services/summaries.py): target section size in characters,
+    # summaries merged per reduce call and model calls in flight at once.
+    summary_section_chars: int = 12000
+    summary_reduce_fanin: int = 8
+    summary_max_concurrency: int = 4
+    sync_ingest: bool = False  # run ingestion inside the /upload request instead of the background queue
+    ingest_workers: int = 2
+    ingest_max_attempts: int = 3
+    ingest_retry_backoff_s: float = 5.0  # doubled after each failed attempt
+    ingest_lease_s: float = 60.0  # a STARTED job whose worker stopped renewing this long ago is run again
+    ingest_cancel_wait_s: float = 30.0  # PUT /documents/{id} waits this long for a running ingestion of it to stop
     api_key: str | None = None
     admin_reset_token: str | None = None  # protects /admin/reset endpoint
 
     log_level: str = "INFO"
+    # Prometheus text metrics at GET /metrics (see core/metrics.py).
+    metrics_enabled: bool = True
+    # Also emit OpenTelemetry spans for the timed stages (needs opentelemetry installed and configured).
+    tracing_enabled: bool = False
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,86 @@
+"""Bounded executors for blocking work reached from async handlers.
+
+Synchronous client calls (MinIO) run on a fixed-size thread pool and CPU-heavy
+parsing (PyMuPDF / Tesseract) runs on a process pool, so neither can stall the
+event loop serving concurrent requests. Pools are created on FastAPI startup
+and lazily on first use elsewhere (scripts, tests).
+"""
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from typing import Any, Callable, Optional
+import asyncio
+import multiprocessing
+import os
+from loguru import logger
+from app.core.config import get_settings
+
+settings = get_settings()
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_cpu_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=max(1, settings.io_workers), thread_name_prefix="blocking-io")
+    return _io_pool
+
+
+def _init_cpu_worker():
+    # Parallelism comes from the pool; keep Tesseract's OpenMP to one thread per worker.
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+
+def _get_cpu_pool() -> Optional[ProcessPoolExecutor]:
+    global _cpu_pool
+    if _cpu_pool is None and settings.parse_workers > 0:
+        # spawn: forking a process that already runs loguru/anyio threads is unsafe
+        _cpu_pool = ProcessPoolExecutor(
+            max_workers=settings.parse_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_cpu_worker,
+        )
+    return _cpu_pool
+
+
+def start():
+    _get_io_pool()
+    _get_cpu_pool()
+
+
+def shutdown():
+    global _io_pool, _cpu_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _cpu_pool is not None:
+        _cpu_pool.shutdown(wait=False, cancel_futures=True)
+        _cpu_pool = None
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking I/O call on the bounded thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_io_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_cpu(fn: Callable[..., Any], *args) -> Any:
+    """Run a picklable CPU-bound call on the process pool.
+
+    Falls back to the I/O thread pool when `parse_workers` is 0 or the pool
+    died (e.g. a worker was OOM-killed); the broken pool is replaced on the
+    next call.
+    """
+    global _cpu_pool
+    pool = _get_cpu_pool()
+    if pool is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            logger.warning("CPU process pool broken; recreating it and running this call in a thread")
+            _cpu_pool = None
+    return await run_io(fn, *args)
@@ -0,0 +1,112 @@
+"""Application-scoped HTTP client for Gemini calls.
+
+One `httpx.AsyncClient` is shared by embeddings, generation and
+summarization, so connections (and their TLS sessions) are kept alive and
+reused instead of being set up again for every call. Pool limits, timeouts
+and HTTP/2 come from settings; HTTP/2 needs the optional `h2` package and
+falls back to HTTP/1.1 without it. The client is opened on FastAPI startup
+and closed on shutdown; scripts and tests get it lazily on first use.
+"""
+from __future__ import annotations
+from typing import Dict, Optional
+import asyncio
+import importlib.util
+import httpx
+from loguru import logger
+from app.core.config import get_settings
+
+settings = get_settings()
+
+
+class _CountingTransport(httpx.AsyncBaseTransport):
+    """Counts requests, and requests that found every pooled connection busy."""
+
+    def __init__(self, inner: httpx.AsyncHTTPTransport, max_connections: int):
+        self.inner = inner
+        self.max_connections = max_connections
+        self.requests = 0
+        self.waits = 0
+
+    def _connections(self):
+        pool = getattr(self.inner, "_pool", None)
+        return list(getattr(pool, "connections", []) or [])
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        conns = self._connections()
+        if len(conns) >= self.max_connections and not any(c.is_available() for c in conns):
+            self.waits += 1
+        return await self.inner.handle_async_request(request)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[_CountingTransport] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_http2 = False
+
+
+def _build() -> httpx.AsyncClient:
+    global _transport, _http2
+    _http2 = settings.gemini_http2
+    if _http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("GEMINI_HTTP2 is set but the 'h2' package is not installed; using HTTP/1.1")
+        _http2 = False
+    limits = httpx.Limits(
+        max_connections=settings.gemini_max_connections,
+        max_keepalive_connections=settings.gemini_max_keepalive,
+        keepalive_expiry=settings.gemini_keepalive_expiry_s,
+    )
+    _transport = _CountingTransport(httpx.AsyncHTTPTransport(http2=_http2, limits=limits), settings.gemini_max_connections)
+    timeout = httpx.Timeout(
+        settings.gemini_read_timeout_s,
+        connect=settings.gemini_connect_timeout_s,
+        pool=settings.gemini_pool_timeout_s,
+    )
+    return httpx.AsyncClient(transport=_transport, timeout=timeout)
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client, _loop
+    loop = asyncio.get_running_loop()
+    # Pooled connections belong to the loop that opened them; scripts that call
+    # asyncio.run() repeatedly get a fresh client per loop.
+    if _client is None or _client.is_closed or _loop is not loop:
+        _client = _build()
+        _loop = loop
+    return _client
+
+
+async def start():
+    get_client()
+
+
+async def aclose():
+    global _client, _transport
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _transport = None
+
+
+def pool_stats() -> Dict:
+    if _transport is None:
+        return {"open": False}
+    conns = _transport._connections()
+    idle = sum(1 for c in conns if c.is_idle())
+    closed = sum(1 for c in conns if c.is_closed())
+    pool = getattr(_transport.inner, "_pool", None)
+    queued = sum(1 for r in getattr(pool, "_requests", []) if r.is_queued())
+    return {
+        "open": True,
+        "http2": _http2,
+        "max_connections": _transport.max_connections,
+        "connections": len(conns) - closed,
+        "in_use": len(conns) - idle - closed,
+        "idle": idle,
+        "queued": queued,
+        "requests": _transport.requests,
+        "waits": _transport.waits,
+    }
@@ -0,0 +1,211 @@
+"""Process-local counters and histograms, served in the Prometheus text format at /metrics.
+
+The metric types are small in-process objects with fixed label names, so no
+client library is needed. Updates take a lock because ingestion also runs on
+thread pools. Work done in the parse process pool is reported by the parent
+from what the pool returns. Every uvicorn worker keeps its own values, so with
+several workers each one has to be scraped (or run one worker per container).
+
+`timer(histogram, **labels)` times a block into a histogram. When
+`TRACING_ENABLED` is set and OpenTelemetry is installed it also opens a trace
+span (e.g. `ingest_stage.parse`), so one set of instrumentation points feeds
+both; exporters are configured the usual OpenTelemetry way (SDK setup or
+`opentelemetry-instrument`).
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+import bisect
+import importlib.util
+import math
+import threading
+import time
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Seconds; spans sub-millisecond index lookups up to long generations and OCR.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_REGISTRY: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_text(self, key: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{_escape(v)}"' for name, v in zip(self.labels, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        head = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+        return head + "".join(line + "\n" for line in self.samples())
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{self._label_text(k)} {_fmt(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    """Value read when scraped from `fn`, which returns {label values tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str], fn: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, documentation, labels)
+        self.fn = fn
+
+    def samples(self) -> List[str]:
+        try:
+            items = sorted(self.fn().items())
+        except Exception:  # a broken gauge must not break the scrape
+            return []
+        return [f"{self.name}{self._label_text(tuple(map(str, k)))} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def count(self, **labels: str) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        out = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                out.append(f"{self.name}_bucket{self._label_text(key, le)} {cumulative}")
+            out.append(f"{self.name}_sum{self._label_text(key)} {_fmt(total)}")
+            out.append(f"{self.name}_count{self._label_text(key)} {cumulative}")
+        return out
+
+
+def render() -> str:
+    return "".join(m.render() for m in _REGISTRY)
+
+
+_tracer = None
+
+
+def _get_tracer():
+    global _tracer
+    if _tracer is None and settings.tracing_enabled and importlib.util.find_spec("opentelemetry") is not None:
+        from opentelemetry import trace
+        _tracer = trace.get_tracer("chatwithdoc")
+    return _tracer
+
+
+@contextmanager
+def timer(histogram: Histogram, **labels: str) -> Iterator[None]:
+    tracer = _get_tracer()
+    span = None
+    if tracer is not None:
+        name = histogram.name.replace("_duration_seconds", "")
+        span = tracer.start_as_current_span(".".join([name, *map(str, labels.values())]), attributes=dict(labels))
+        span.__enter__()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, **labels)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+
+def _index_sizes() -> Dict[Tuple[str, ...], float]:
+    from app.services import retrieval
+    return {("lexical",): len(retrieval._LEX_INDEX), ("vector_fallback",): len(retrieval._MEM_INDEX)}
+
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "HTTP request time until the response starts.", ("method", "route", "status"))
+
+EMBED_REQUESTS = Counter("embedding_requests_total", "Gemini batchEmbedContents calls by outcome (ok, rate_limited, error).", ("outcome",))
+EMBED_REQUEST_SECONDS = Histogram("embedding_request_duration_seconds", "Time per batchEmbedContents call.")
+EMBED_BATCH_SIZE = Histogram("embedding_batch_size", "Texts per batchEmbedContents call.", buckets=(1, 2, 5, 10, 20, 50, 100))
+EMBED_TEXTS = Counter("embedding_texts_total", "Texts embedded, by where the vector came from (cache, api, hash).", ("source",))
+
+QDRANT_SECONDS = Histogram("qdrant_request_duration_seconds", "Qdrant calls by operation.", ("op",))
+QDRANT_ERRORS = Counter("qdrant_errors_total", "Failed Qdrant calls by operation.", ("op",))
+
+RETRIEVAL_SECONDS = Histogram("retrieval_stage_duration_seconds", "Hybrid retrieval stages (vector, lexical, fusion).", ("stage",))
+ASK_SECONDS = Histogram("ask_stage_duration_seconds", "/ask and /ask/stream stages (embed, retrieve, generate, cache; ttft for streams).", ("stage",))
+GENERATION_SECONDS = Histogram("generation_stage_duration_seconds", "Answer generation stages (prompt_build, generate, stream, summarize_map, summarize_reduce).", ("stage",))
+PROMPT_TOKENS = Histogram("generation_prompt_tokens", "Estimated tokens per answer prompt.", buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+GENERATION_REQUESTS = Counter("generation_requests_total", "Generated answers by mode (gemini, gemini-partial, fallback).", ("mode",))
+
+INGEST_SECONDS = Histogram("ingest_stage_duration_seconds", "Ingestion stages (download, parse, chunk, embed, index, persist).", ("stage",))
+INGEST_OCR_PAGE_SECONDS = Histogram("ingest_ocr_page_duration_seconds", "OCR time per page without a text layer.")
+INGEST_DOCUMENTS = Counter("ingest_documents_total", "Finished ingestions by outcome (ok, error).", ("outcome",))
+
+INDEX_CHUNKS = Gauge("index_chunks", "Chunks held by the in-process indexes.", ("index",), _index_sizes)
+
+
+def observe_timings(histogram: Histogram, timings: Optional[Dict[str, float]]):
+    """Record a `timings` dict of `<stage>_ms` values (as /ask returns) into a stage histogram."""
+    for key, ms in (timings or {}).items():
+        if key.endswith("_ms"):
+            histogram.observe(ms / 1000.0, stage=key[:-3])
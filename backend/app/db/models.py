@@ -1,28 +1,133 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, ForeignKey, Text, Float, Index, inspect, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from loguru import logger
 from app.db.session import Base
 
 
 class Document(Base):
     __tablename__ = "documents"
+    # Serve status-filtered and per-owner keyset pages (newest id first) and GROUP BY status from the index alone.
+    __table_args__ = (Index("ix_documents_status_id", "status", "id"), Index("ix_documents_owner_id_id", "owner_id", "id"))
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
     content_type = Column(String, index=True)
     original_path = Column(String)
-    aggregated_text = Column(Text, nullable=True)
-    status = Column(String, default="uploaded", index=True)
+    size_bytes = Column(Integer, nullable=True)
+    sha256 = Column(String(64), nullable=True, index=True)
+    status = Column(String, default="uploaded")
+    owner_id = Column(String(64), nullable=True)  # tenant (X-Owner-Id) with multi_tenant; None = unowned
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     chunks = relationship("Chunk", back_populates="document", cascade="all,delete-orphan")
+    jobs = relationship("IngestJob", cascade="all,delete-orphan")
+    text = relationship("DocumentText", uselist=False, cascade="all,delete-orphan")
+    summaries = relationship("SectionSummary", cascade="all,delete-orphan")
+
+
+class DocumentText(Base):
+    """Extracted text of a document, kept out of `documents` so listing rows stays cheap."""
+    __tablename__ = "document_texts"
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    text = Column(Text)
 
 
 class Chunk(Base):
     __tablename__ = "chunks"
+    # Ids are never reused, so the lexical snapshot watermark (max id) stays valid on SQLite too
+    # (for tables created with it; see `chunk_row_ids_reused`).
+    __table_args__ = {"sqlite_autoincrement": True}
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
-    page = Column(Integer, default=0)
+    chunk_id = Column(String(36), nullable=True, index=True)  # Qdrant point id, see retrieval.chunk_id
+    page = Column(Integer, default=0)  # first page the chunk covers
+    page_end = Column(Integer, nullable=True)
     position = Column(Integer, default=0)
+    char_start = Column(Integer, nullable=True)  # offsets into the pages joined by "\n"
+    char_end = Column(Integer, nullable=True)
     text = Column(Text)
     embedding_distance = Column(Float, nullable=True)
+    owner_id = Column(String(64), nullable=True)  # copy of documents.owner_id, stored in the Qdrant payload
+    # Set when the chunk's Qdrant point (or its payload) was not written; the next ingestion re-adds it.
+    vector_pending = Column(Boolean, nullable=True)
     document = relationship("Document", back_populates="chunks")
+
+
+class SectionSummary(Base):
+    """Cached node of a document's map-reduce summary, keyed by a hash of its input (see services/summaries.py)."""
+    __tablename__ = "section_summaries"
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    kind = Column(String, default="map")  # map, reduce or final
+    summary = Column(Text)
+    prompt_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class IngestJob(Base):
+    __tablename__ = "ingest_jobs"
+    id = Column(String, primary_key=True)
+    document_id = Column(Integer, ForeignKey("documents.id", ondelete="CASCADE"), index=True)
+    object_name = Column(String)
+    content_type = Column(String)
+    status = Column(String, default="PENDING", index=True)
+    stage = Column(String, default="queued")
+    pages_parsed = Column(Integer, default=0)
+    pages_total = Column(Integer, default=0)
+    chunks_embedded = Column(Integer, default=0)
+    chunks_total = Column(Integer, default=0)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(Float, nullable=True)  # epoch seconds, set while status == RETRY
+    # Epoch seconds until which a STARTED job belongs to the worker running it; renewed while it runs.
+    lease_until = Column(Float, nullable=True)
+    cancel_requested = Column(Boolean, nullable=True)  # set by a cancel while STARTED, seen by the running worker
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+def chunk_row_ids_reused(sync_conn) -> bool:
+    """Whether the chunks table may hand out the id of a deleted row again.
+
+    SQLite does unless the table was created with AUTOINCREMENT, which
+    `create_all` only adds to new tables, so databases created by older
+    versions keep reusing ids.
+    """
+    if sync_conn.dialect.name != "sqlite":
+        return False
+    ddl = sync_conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'chunks'")).scalar()
+    return bool(ddl) and "AUTOINCREMENT" not in ddl.upper()
+
+
+def upgrade_schema(sync_conn):
+    """Bring tables created by older versions up to date; run at startup after `create_all`.
+
+    `create_all` skips existing tables, so nullable columns and indexes added
+    since are created here. Text from the old `documents.aggregated_text`
+    column moves into `document_texts`; the emptied column is left in place.
+    A chunks table without AUTOINCREMENT is only reported: `lexical_sync`
+    checks every chunk id when catching up with it instead.
+    """
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.nullable and not column.primary_key:
+                sync_conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=sync_conn.dialect)}"
+                ))
+                columns.add(column.name)
+        for index in table.indexes:
+            # Skip indexes over columns an old table lacks rather than failing startup.
+            if {c.name for c in index.columns} <= columns:
+                index.create(sync_conn, checkfirst=True)
+    if chunk_row_ids_reused(sync_conn):
+        logger.warning("chunks table predates AUTOINCREMENT and may reuse row ids; keyword index catch-ups scan all chunk ids")
+    if "aggregated_text" not in {c["name"] for c in inspector.get_columns("documents")}:
+        return
+    sync_conn.execute(text(
+        "INSERT INTO document_texts (document_id, text) SELECT id, aggregated_text FROM documents "
+        "WHERE aggregated_text IS NOT NULL AND id NOT IN (SELECT document_id FROM document_texts)"
+    ))
+    sync_conn.execute(text("UPDATE documents SET aggregated_text = NULL WHERE aggregated_text IS NOT NULL"))
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional, Literal
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Literal
 
 
 class DocumentOut(BaseModel):
@@ -19,6 +19,13 @@ class UploadResponse(BaseModel):
 class AskRequest(BaseModel):
     question: str
     document_ids: Optional[List[int]] = None
+    # Per-request retrieval overrides (defaults: settings.fusion_strategy / settings.hybrid_weight).
+    fusion: Optional[Literal["rrf", "zscore", "convex"]] = None
+    hybrid_weight: Optional[float] = Field(None, ge=0.0, le=1.0)
+
+    @property
+    def default_retrieval(self) -> bool:
+        return self.fusion is None and self.hybrid_weight is None
 
 
 class Answer(BaseModel):
@@ -27,9 +34,17 @@ class Answer(BaseModel):
     sources: List[str] = []
     latency_ms: Optional[int] = None
     retrieved: int | None = None
+    # Chunks the answer was generated from, and per-stage wall time in ms (see /ask).
+    chunk_ids: List[str] = []
+    timings: Optional[Dict[str, float]] = None
+    cache: Optional[Literal["exact", "semantic"]] = None
+    # Context packing for the prompt (chunks, passages, merged, duplicates, dropped, truncated,
+    # context_tokens, prompt_tokens and Gemini's model_prompt_tokens; see services/context.py).
+    context: Optional[Dict[str, int]] = None
 
 class SummarizeResponse(Answer):
-    pass
+    # Map-reduce cost: sections, model_calls, cached_nodes, prompt_tokens, output_tokens.
+    usage: Optional[Dict[str, int]] = None
 
 
 class HealthResponse(BaseModel):
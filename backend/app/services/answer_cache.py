@@ -0,0 +1,196 @@
+"""Answer cache in front of /ask and /ask/stream.
+
+Lookups are scoped by the request's owner (with `multi_tenant`) and document
+filter (the set of `document_ids`, or "all documents"). An exact hit matches the normalized
+question text and costs nothing; a semantic hit matches a cached question
+whose query embedding has cosine >= `answer_cache_similarity` and saves the
+search and the generation. Entries expire after `answer_cache_ttl_s` and the
+least recently used are evicted beyond `answer_cache_max_entries`.
+
+Invalidation is driven by retrieval: whenever a document's indexed chunks
+change (ingest, re-ingest, delete), entries scoped to or citing that document
+are dropped, as are all unscoped entries, since a new document can change
+their answer. An answer computed while an invalidation happened is not stored.
+"""
+from __future__ import annotations
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import copy
+import re
+import threading
+import time
+import numpy as np
+from app.core.config import get_settings
+
+settings = get_settings()
+
+_SPACE_RE = re.compile(r"\s+")
+
+# (owner_id, sorted document ids or None for all of the owner's documents)
+Scope = Tuple[Optional[str], Optional[Tuple[int, ...]]]
+
+
+def normalize_question(question: str) -> str:
+    return _SPACE_RE.sub(" ", (question or "").lower()).strip().rstrip("?.! ")
+
+
+def cacheable(answer: Dict) -> bool:
+    """Only complete model answers are kept; fallbacks and partial streams are retried next time."""
+    return answer.get("generation_mode") == "gemini" and answer.get("answer_type") != "out_of_scope"
+
+
+def _scope(document_ids: Optional[Sequence[int]], owner_id: Optional[str] = None) -> Scope:
+    return owner_id, tuple(sorted(set(document_ids))) if document_ids else None
+
+
+class _Entry:
+    __slots__ = ("scope", "question", "vector", "answer", "cost_ms", "expires_at", "documents")
+
+    def __init__(self, scope: Scope, question: str, vector: Optional[np.ndarray], answer: Dict, cost_ms: float, expires_at: float, documents: Set[int]):
+        self.scope = scope
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.cost_ms = cost_ms
+        self.expires_at = expires_at
+        self.documents = documents
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 1000, ttl_s: float = 3600.0, similarity: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Scope, str], _Entry]" = OrderedDict()
+        self._by_document: Dict[int, Set[Tuple[Scope, str]]] = {}
+        self._epoch = 0
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    @property
+    def epoch(self) -> int:
+        """Changes on every invalidation; pass the value read before computing to `put`."""
+        return self._epoch
+
+    def _drop(self, key: Tuple[Scope, str]):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for doc in entry.documents | set(entry.scope[1] or ()):
+            keys = self._by_document.get(doc)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_document[doc]
+
+    def _hit(self, key: Tuple[Scope, str], entry: _Entry, kind: str, elapsed_ms: float) -> Dict:
+        self._entries.move_to_end(key)
+        if kind == "exact":
+            self.hits_exact += 1
+        else:
+            self.hits_semantic += 1
+        self.saved_ms += max(0.0, entry.cost_ms - elapsed_ms)
+        answer = copy.deepcopy(entry.answer)
+        answer["cache"] = kind
+        return answer
+
+    def get_exact(self, question: str, document_ids: Optional[Sequence[int]], elapsed_ms: float = 0.0,
+                  owner_id: Optional[str] = None) -> Optional[Dict]:
+        key = (_scope(document_ids, owner_id), normalize_question(question))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                self._drop(key)
+                return None
+            return self._hit(key, entry, "exact", elapsed_ms)
+
+    def get_similar(self, vector: Sequence[float], document_ids: Optional[Sequence[int]], elapsed_ms: float = 0.0,
+                    owner_id: Optional[str] = None) -> Optional[Dict]:
+        """Best cached answer in the same scope whose question embedding is close enough; counts a miss otherwise."""
+        scope = _scope(document_ids, owner_id)
+        q = np.asarray(vector, dtype=np.float32)
+        q /= float(np.linalg.norm(q)) or 1.0
+        now = time.monotonic()
+        with self._lock:
+            keys: List[Tuple[Scope, str]] = []
+            rows: List[np.ndarray] = []
+            for key, entry in list(self._entries.items()):
+                if entry.expires_at < now:
+                    self._drop(key)
+                elif entry.scope == scope and entry.vector is not None and entry.vector.shape == q.shape:
+                    keys.append(key)
+                    rows.append(entry.vector)
+            if rows:
+                scores = np.stack(rows) @ q
+                best = int(np.argmax(scores))
+                if float(scores[best]) >= self.similarity:
+                    return self._hit(keys[best], self._entries[keys[best]], "semantic", elapsed_ms)
+            self.misses += 1
+            return None
+
+    def put(self, question: str, document_ids: Optional[Sequence[int]], vector: Optional[Sequence[float]], answer: Dict,
+            cost_ms: float, documents: Iterable[int], epoch: int, owner_id: Optional[str] = None):
+        with self._lock:
+            if epoch != self._epoch:
+                return  # an invalidation ran while this answer was computed
+            scope = _scope(document_ids, owner_id)
+            key = (scope, normalize_question(question))
+            self._drop(key)
+            vec = None
+            if vector is not None:
+                vec = np.asarray(vector, dtype=np.float32)
+                vec /= float(np.linalg.norm(vec)) or 1.0
+            docs = {int(d) for d in documents if d is not None}
+            self._entries[key] = _Entry(scope, key[1], vec, copy.deepcopy(answer), cost_ms, time.monotonic() + self.ttl_s, docs)
+            for doc in docs | set(scope[1] or ()):
+                self._by_document.setdefault(doc, set()).add(key)
+            while len(self._entries) > max(1, self.max_entries):
+                self._drop(next(iter(self._entries)))
+
+    def invalidate_documents(self, document_ids: Iterable[int]):
+        with self._lock:
+            self._epoch += 1
+            doomed = {key for key in self._entries if key[0][1] is None}
+            for doc in document_ids:
+                doomed |= self._by_document.get(int(doc), set())
+            for key in doomed:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_document.clear()
+
+    def stats(self) -> Dict:
+        hits = self.hits_exact + self.hits_semantic
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "latency_saved_ms": int(self.saved_ms),
+            "avg_saved_ms": int(self.saved_ms / hits) if hits else 0,
+        }
+
+
+_cache: Optional[AnswerCache] = None
+
+
+def get_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        _cache = AnswerCache(settings.answer_cache_max_entries, settings.answer_cache_ttl_s, settings.answer_cache_similarity)
+    return _cache
+
+
+def invalidate_documents(document_ids: Iterable[int]):
+    if _cache is not None:
+        _cache.invalidate_documents(document_ids)
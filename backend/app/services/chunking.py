@@ -1,24 +1,102 @@
-from typing import List, Dict
+"""Page-aware streaming chunker.
+
+Pages are consumed one at a time and only the text not yet emitted (at most
+about one page plus one chunk) is kept in memory. Split points prefer
+paragraph, line, sentence and then word boundaries in the second half of the
+chunk window, like the recursive splitter used before; `chunk_overlap`
+characters (rounded to a word boundary) are carried into the next chunk,
+including across page boundaries.
+
+Character offsets refer to the document text as pages joined by "\n", so
+`text == full_text[char_start:char_end]` for every chunk.
+"""
+from bisect import bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional
 from app.core.config import get_settings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 settings = get_settings()
 
-def chunk_pages(pages: List[dict]) -> List[Dict]:
-    texts = []
-    meta = []
+_SEPARATORS = ("\n\n", "\n", ". ", "? ", "! ", "; ", " ")
+
+
+def _split_point(buf: str, start: int, limit: int) -> int:
+    """Best end offset for a chunk starting at `start` and ending by `limit`."""
+    floor = start + (limit - start) // 2
+    for sep in _SEPARATORS:
+        i = buf.rfind(sep, floor, limit)
+        if i != -1:
+            return i + len(sep)
+    return limit
+
+
+def iter_chunks(pages: Iterable[dict], chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None) -> Iterator[Dict]:
+    size = max(1, chunk_size or settings.chunk_size)
+    overlap = settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+    overlap = max(0, min(overlap, size // 2))
+    buf = ""          # text from document offset `base` onwards
+    base = 0
+    pos = 0           # start of the next chunk within buf
+    total = 0         # document length consumed so far
+    starts: List[int] = []  # document offsets where pages begin
+    numbers: List[int] = []
+    position = 0
+    emitted = 0       # document offset where the last emitted chunk's window ended
+
+    def page_at(offset: int) -> int:
+        return numbers[max(0, bisect_right(starts, offset) - 1)]
+
+    def emit(start: int, end: int) -> Optional[Dict]:
+        nonlocal position
+        raw = buf[start:end]
+        text = raw.strip()
+        if not text:
+            return None
+        char_start = base + start + (len(raw) - len(raw.lstrip()))
+        char_end = char_start + len(text)
+        chunk = {
+            "position": position,
+            "text": text,
+            "page": page_at(char_start),
+            "page_start": page_at(char_start),
+            "page_end": page_at(char_end - 1),
+            "char_start": char_start,
+            "char_end": char_end,
+        }
+        position += 1
+        return chunk
+
     for p in pages:
-        texts.append(p["text"])  # type: ignore
-        meta.append({"page": p["page"]})
-
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=settings.chunk_size,
-        chunk_overlap=settings.chunk_overlap,
-        separators=["\n\n", "\n", ". ", ".", "?", "!", " "]
-    )
-    joined = "\n".join(texts)
-    chunks = splitter.split_text(joined)
-    results = []
-    for idx, ch in enumerate(chunks):
-        results.append({"position": idx, "text": ch, "page": 0})
-    return results
+        text = p["text"] or ""
+        # Drop what has been fully emitted before appending the next page.
+        buf, base, pos = buf[pos:], base + pos, 0
+        if starts:
+            buf += "\n"
+            total += 1
+        starts.append(total)
+        numbers.append(p["page"])
+        buf += text
+        total += len(text)
+        while len(buf) - pos > size:
+            cut = _split_point(buf, pos, pos + size)
+            chunk = emit(pos, cut)
+            if chunk:
+                yield chunk
+            emitted = base + cut
+            nxt = cut - overlap
+            if overlap and nxt > pos:
+                space = buf.find(" ", nxt, cut)
+                nxt = space + 1 if space != -1 else nxt
+            pos = nxt if nxt > pos else cut
+        # Page boundaries before the pending text are no longer needed.
+        keep = max(0, bisect_right(starts, base + pos) - 1)
+        if keep:
+            del starts[:keep], numbers[:keep]
+    # Skip a tail that would only repeat the previous chunk's overlap.
+    if numbers and buf[max(pos, emitted - base):].strip():
+        chunk = emit(pos, len(buf))
+        if chunk:
+            yield chunk
+
+
+def chunk_pages(pages: List[dict]) -> List[Dict]:
+    return list(iter_chunks(pages))
@@ -0,0 +1,146 @@
+"""Context assembly for answer prompts: merge, deduplicate, then pack to a token budget.
+
+Retrieved chunks arrive in relevance order. Chunks of one document that
+overlap (the chunker repeats up to `chunk_overlap` characters) are stitched
+into a single passage, so the shared text is sent once. A chunk whose word
+3-gram set has Jaccard similarity of at least `context_dedup_jaccard` with a
+chunk already kept (the same passage in another document, a lightly edited or
+reformatted copy) is dropped. With a few dozen candidates the exact
+similarity is cheaper than MinHash or SimHash sketches, and short chunks are
+where SimHash distances get noisy.
+Passages are then added best-first while their estimated tokens fit
+`context_token_budget`; the first one that does not fit is cut at a word
+boundary when enough budget is left.
+
+Tokens are estimated as characters / `context_chars_per_token` (about 4 for
+Gemini on English text), which is close enough for budgeting without a
+tokenizer.
+"""
+from __future__ import annotations
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import re
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# Shortest shared text accepted as chunk overlap (shorter matches are coincidence).
+MIN_OVERLAP_CHARS = 20
+# Below this many tokens of remaining budget a passage is skipped rather than cut.
+MIN_PASSAGE_TOKENS = 48
+
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / max(0.1, settings.context_chars_per_token)) + 1 if text else 0
+
+
+def shingles(text: str) -> FrozenSet[str]:
+    """Lowercase word 3-grams (the whole text when it has fewer than three words)."""
+    words = _WORD.findall(text.lower())
+    return frozenset(" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2)))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def _stitch(first: str, second: str, max_overlap: int) -> Optional[str]:
+    """`first` followed by `second` without the text they share, or None if they do not overlap."""
+    probe = second[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return None
+    lo = max(0, len(first) - max_overlap)
+    i = first.find(probe, lo)
+    while i != -1:
+        if second.startswith(first[i:]):
+            return first + second[len(first) - i:]
+        i = first.find(probe, i + 1)
+    return None
+
+
+def _join(passage: Dict, item: Dict, max_overlap: int) -> Optional[Dict]:
+    """`item` stitched onto `passage` (either side) when both come from one document and overlap."""
+    if item["document_id"] is None or passage["document_id"] != item["document_id"]:
+        return None
+    text = _stitch(passage["text"], item["text"], max_overlap) or _stitch(item["text"], passage["text"], max_overlap)
+    if text is None:
+        return None
+    return {
+        "text": text, "document_id": item["document_id"],
+        "first_page": min(passage["first_page"], item["first_page"]),
+        "last_page": max(passage["last_page"], item["last_page"]),
+        "chunk_ids": passage["chunk_ids"] + item["chunk_ids"],
+        "rank": min(passage["rank"], item["rank"]),  # the merged passage keeps the better rank
+        "_from": passage,
+    }
+
+
+def _label(p: Dict) -> str:
+    first, last = p["first_page"], p["last_page"]
+    return f"[p{first}]" if first == last else f"[p{first}-{last}]"
+
+
+def _cut(text: str, max_chars: int) -> str:
+    cut = text[:max(0, max_chars - 2)]
+    space = cut.rfind(" ", max_chars // 2)
+    return (cut[:space] if space != -1 else cut).rstrip() + " …"
+
+
+def pack(chunks: List[Dict], budget_tokens: Optional[int] = None) -> Tuple[List[Dict], Dict[str, int]]:
+    """Assemble prompt passages from relevance-ordered chunks.
+
+    Returns passages ({"text", "page", "first_page", "last_page", "document_id",
+    "chunk_ids"}, best first) and stats: chunks, passages, merged,
+    duplicates, dropped, truncated and context_tokens.
+    """
+    budget = settings.context_token_budget if budget_tokens is None else budget_tokens
+    max_overlap = 2 * max(settings.chunk_overlap, MIN_OVERLAP_CHARS)
+    stats = {"chunks": len(chunks), "passages": 0, "merged": 0, "duplicates": 0, "dropped": 0, "truncated": 0, "context_tokens": 0}
+    passages: List[Dict] = []
+    kept_shingles: List[FrozenSet[str]] = []
+    for rank, ch in enumerate(chunks):
+        text = (ch.get("text") or "").strip()
+        if not text:
+            continue
+        grams = shingles(text)
+        if any(jaccard(grams, other) >= settings.context_dedup_jaccard for other in kept_shingles):
+            stats["duplicates"] += 1
+            continue
+        kept_shingles.append(grams)
+        page = ch.get("page", 0) or 0
+        item = {"text": text, "document_id": ch.get("document_id"), "first_page": page,
+                "last_page": ch.get("page_end") or page, "chunk_ids": [ch.get("chunk_id")], "rank": rank}
+        # Repeated because one chunk can bridge two passages.
+        while True:
+            joined = next((j for j in (_join(p, item, max_overlap) for p in passages) if j is not None), None)
+            if joined is None:
+                break
+            passages = [p for p in passages if p is not joined["_from"]]
+            item = joined
+            stats["merged"] += 1
+        item.pop("_from", None)
+        passages.append(item)
+    passages.sort(key=lambda p: p["rank"])
+    packed: List[Dict] = []
+    remaining = budget
+    for p in passages:
+        cost = estimate_tokens(_label(p)) + estimate_tokens(p["text"])
+        if cost > remaining:
+            if remaining - estimate_tokens(_label(p)) < MIN_PASSAGE_TOKENS:
+                stats["dropped"] += 1
+                continue
+            p["text"] = _cut(p["text"], int((remaining - estimate_tokens(_label(p))) * settings.context_chars_per_token))
+            stats["truncated"] += 1
+            cost = estimate_tokens(_label(p)) + estimate_tokens(p["text"])
+        remaining -= cost
+        p.pop("rank")
+        p["page"] = p["first_page"]
+        packed.append(p)
+    stats["passages"] = len(packed)
+    stats["context_tokens"] = budget - remaining
+    return packed, stats
+
+
+def render(passages: List[Dict]) -> str:
+    return "\n---\n".join(f"{_label(p)} {p['text']}" for p in passages)
@@ -1,10 +1,15 @@
 import httpx
 from app.core.config import get_settings
-from app.core import runtime_state
-from typing import List
+from app.core import runtime_state, http_client, metrics
+from typing import List, Optional, Dict, Iterable
 from tenacity import retry, wait_exponential, stop_after_attempt
+from collections import OrderedDict
+from array import array
 import hashlib
 import math
+import sqlite3
+import threading
+import time
 import asyncio
 from loguru import logger
 
@@ -18,69 +23,355 @@ class EmbeddingList(list):
 settings = get_settings()
 
 # Base endpoint; we'll prepend 'models/' exactly once.
-GEMINI_EMBED_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:embedContent?key={key}"
+GEMINI_BATCH_EMBED_URL = "{base}/models/{model}:batchEmbedContents?key={key}"
+
+# Gemini rejects batchEmbedContents calls with more than 100 requests.
+MAX_BATCH_SIZE = 100
+# Per-request read timeout for embedding calls (the shared client defaults to the generation timeout).
+EMBED_TIMEOUT_S = 60
+# 429 responses only slow the limiter down; give up on a batch after this many.
+MAX_RATE_LIMITED_ATTEMPTS = 6
+
+
+class TokenBucket:
+    """Async token bucket pacing embedding requests across concurrent batches.
+
+    A 429 halves the refill rate and pauses the bucket (honouring Retry-After
+    when present); each success recovers the rate additively towards the
+    configured ceiling. A rate <= 0 disables pacing but still honours pauses.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            if self.max_rate <= 0:
+                return
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        if self.max_rate > 0:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = 0.0
+        pause = retry_after if retry_after is not None else (1 / self.rate if self.rate > 0 else 1.0)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+
+    def on_success(self):
+        if 0 < self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+
+
+_limiter: Optional[TokenBucket] = None
+
+
+def _get_limiter() -> TokenBucket:
+    """Shared limiter; rebuilt when the rate settings change at runtime."""
+    global _limiter
+    rate, burst = settings.embedding_requests_per_second, settings.embedding_burst
+    if _limiter is None or (_limiter.max_rate, _limiter.capacity) != (rate, max(1, burst)):
+        _limiter = TokenBucket(rate, burst)
+    return _limiter
+
+
+class EmbeddingCache:
+    """Two-tier content-addressed cache of embedding vectors.
+
+    Entries are keyed by (embedding model, sha256 of whitespace-normalized text),
+    so a model switch can never serve vectors computed by another model. The
+    in-process tier is an LRU bounded by bytes; the optional on-disk tier is a
+    SQLite table of float32 blobs, evicted least-recently-used once it grows
+    past `disk_max_bytes`. Only provider vectors are stored, never hash fallbacks.
+    """
+
+    def __init__(self, path: str = "", memory_max_bytes: int = 64 << 20, disk_max_bytes: int = 1 << 30):
+        self.path = path
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._lru: "OrderedDict[tuple, array]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._disk_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings (model TEXT NOT NULL, text_hash TEXT NOT NULL, "
+                    "vector BLOB NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+                self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Embedding disk cache unavailable at {path} ({e}); using memory tier only")
+                self._db = None
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+    def _remember(self, k: tuple, vec: array):
+        old = self._lru.pop(k, None)
+        if old is not None:
+            self._memory_bytes -= old.itemsize * len(old)
+        self._lru[k] = vec
+        self._memory_bytes += vec.itemsize * len(vec)
+        while self._memory_bytes > self.memory_max_bytes and self._lru:
+            _, dropped = self._lru.popitem(last=False)
+            self._memory_bytes -= dropped.itemsize * len(dropped)
+            self.evictions += 1
+
+    def get_many(self, model: str, keys: Iterable[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for k in dict.fromkeys(keys):
+                vec = self._lru.get((model, k))
+                if vec is not None:
+                    self._lru.move_to_end((model, k))
+                    found[k] = vec.tolist()
+                    self.memory_hits += 1
+                else:
+                    missing.append(k)
+            if missing and self._db is not None:
+                now = time.time()
+                hits = []
+                for i in range(0, len(missing), 500):
+                    part = missing[i:i + 500]
+                    rows = self._db.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({','.join('?' * len(part))})",
+                        [model, *part],
+                    ).fetchall()
+                    for text_hash, blob in rows:
+                        vec = array("f")
+                        vec.frombytes(blob)
+                        self._remember((model, text_hash), vec)
+                        found[text_hash] = vec.tolist()
+                        hits.append((now, model, text_hash))
+                if hits:
+                    self._db.executemany("UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?", hits)
+                    self._db.commit()
+                self.disk_hits += len(hits)
+            self.misses += sum(1 for k in missing if k not in found)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        with self._lock:
+            for k, values in items.items():
+                vec = array("f", values)
+                self._remember((model, k), vec)
+                rows.append((model, k, vec.tobytes(), now))
+            if self._db is None:
+                return
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)", rows)
+            self._disk_bytes += sum(len(r[2]) for r in rows)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+            self._db.commit()
+
+    def _evict_disk(self):
+        assert self._db is not None
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()
+        target = int(self.disk_max_bytes * 0.9)
+        if total > target and count:
+            drop = max(1, int(count * (total - target) / total) + 1)
+            self._db.execute(
+                "DELETE FROM embeddings WHERE (model, text_hash) IN "
+                "(SELECT model, text_hash FROM embeddings ORDER BY last_used LIMIT ?)",
+                (drop,),
+            )
+            self.evictions += drop
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._lru.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
+                self._disk_bytes = 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "memory_entries": len(self._lru),
+                "memory_bytes": self._memory_bytes,
+                "disk_enabled": self._db is not None,
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_cache() -> EmbeddingCache:
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache(
+            settings.embedding_cache_path,
+            memory_max_bytes=settings.embedding_cache_memory_mb << 20,
+            disk_max_bytes=settings.embedding_cache_disk_max_mb << 20,
+        )
+    return _cache
+
+
+def cache_stats() -> Dict[str, object]:
+    return get_cache().stats()
+
+
+def hash_embed(t: str) -> List[float]:
+    """Deterministic offline embedding used when Gemini is unavailable."""
+    h = hashlib.sha256(t.encode()).digest()
+    raw = (h * (256 // len(h) + 1))[:256]
+    vec = [(b / 255.0) for b in raw]
+    norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+    return [x / norm for x in vec]
+
+
+def _model_name() -> str:
+    raw_model = settings.embedding_model or "embedding-001"
+    return raw_model.split('/')[-1] if raw_model.startswith('models/') else raw_model
+
+
+def _retry_after(r: httpx.Response) -> Optional[float]:
+    try:
+        return float(r.headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+async def _embed_batch(client: httpx.AsyncClient, url: str, model: str, batch: List[str], limiter: TokenBucket) -> Optional[List[List[float]]]:
+    """Embed one batch via batchEmbedContents. Returns None when the batch
+    should fall back to hash embeddings."""
+    payload = {"requests": [{"model": f"models/{model}", "content": {"parts": [{"text": t[:6000]}]}} for t in batch]}
+    failures = 0
+    rate_limited = 0
+    while True:
+        await limiter.acquire()
+        try:
+            metrics.EMBED_BATCH_SIZE.observe(len(batch))
+            with metrics.timer(metrics.EMBED_REQUEST_SECONDS):
+                r = await client.post(url, json=payload, timeout=EMBED_TIMEOUT_S)
+            if r.status_code == 429 and rate_limited + 1 < MAX_RATE_LIMITED_ATTEMPTS:
+                metrics.EMBED_REQUESTS.inc(outcome="rate_limited")
+                rate_limited += 1
+                limiter.on_rate_limited(_retry_after(r))
+                logger.warning(f"Embedding 429 rate-limit (attempt {rate_limited}); limiter now {limiter.rate:.2f} req/s")
+                continue
+            r.raise_for_status()
+            data = r.json()
+            try:
+                vecs = [e["values"] for e in data["embeddings"]]  # type: ignore[index]
+            except Exception:
+                raise ValueError(f"Unexpected embedding response shape: {str(data)[:200]}")
+            if len(vecs) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vecs)}")
+            limiter.on_success()
+            runtime_state.set_gemini_success()
+            metrics.EMBED_REQUESTS.inc(outcome="ok")
+            return vecs
+        except Exception as e:
+            metrics.EMBED_REQUESTS.inc(outcome="error")
+            failures += 1
+            if failures < 3:
+                await asyncio.sleep(0.2 * failures)
+                continue
+            logger.warning(f"Embedding batch of {len(batch)} failed ({e}); using hash fallback for these chunks")
+            runtime_state.set_gemini_failure(f"embed_error: {e}")
+            return None
 
 
 @retry(wait=wait_exponential(multiplier=1, min=1, max=10), stop=stop_after_attempt(3))
 async def embed_texts(texts: List[str]) -> List[List[float]]:
     """Return embeddings for texts.
     Annotates the returned list with attribute _embed_mode = 'hash' | 'gemini' | 'mixed'.
-    If Gemini key is missing OR any chunk call fails, a hash fallback is used per chunk.
+    If Gemini key is missing, every chunk is hash-embedded; if a batch call fails,
+    the hash fallback is used for the chunks of that batch only.
+    Cached vectors are served from `get_cache()`; only the remaining unique texts
+    are sent, in batches with at most `embedding_max_concurrency` requests in
+    flight, paced by a shared token bucket.
     """
     runtime_key = runtime_state.get_gemini_key(settings.gemini_api_key)
-    # Helper to hash-embed one text
-    def hash_embed(t: str) -> List[float]:
-        h = hashlib.sha256(t.encode()).digest()
-        raw = (h * (256 // len(h) + 1))[:256]
-        vec = [(b / 255.0) for b in raw]
-        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
-        return [x / norm for x in vec]
-
     if not runtime_key:
         vectors: EmbeddingList = EmbeddingList([hash_embed(t) for t in texts])
         setattr(vectors, "_embed_mode", "hash")
+        metrics.EMBED_TEXTS.inc(len(texts), source="hash")
         return vectors
 
-    raw_model = settings.embedding_model or "embedding-001"
-    cleaned_model = raw_model.split('/')[-1] if raw_model.startswith('models/') else raw_model
-    model_path = cleaned_model
-    url = GEMINI_EMBED_URL.format(model=model_path, key=runtime_key)
+    model_path = _model_name()
+    cache = get_cache()
+    keys = [cache.key(t) for t in texts]
+    cached = await asyncio.to_thread(cache.get_many, model_path, keys)
+    pending: Dict[str, str] = {}  # unique cache misses, key -> text
+    for k, t in zip(keys, texts):
+        if k not in cached and k not in pending:
+            pending[k] = t
+    fresh: Dict[str, List[float]] = {}
+    if pending:
+        url = GEMINI_BATCH_EMBED_URL.format(base=settings.gemini_api_base.rstrip('/'), model=model_path, key=runtime_key)
+        batch_size = max(1, min(MAX_BATCH_SIZE, settings.embedding_batch_size))
+        miss_keys = list(pending)
+        key_batches = [miss_keys[i:i + batch_size] for i in range(0, len(miss_keys), batch_size)]
+        limiter = _get_limiter()
+        sem = asyncio.Semaphore(max(1, settings.embedding_max_concurrency))
+        client = http_client.get_client()
+
+        async def run(batch_keys: List[str]):
+            async with sem:
+                vecs = await _embed_batch(client, url, model_path, [pending[k] for k in batch_keys], limiter)
+            if vecs is not None:
+                fresh.update(zip(batch_keys, vecs))
+        await asyncio.gather(*(run(b) for b in key_batches))
+        await asyncio.to_thread(cache.put_many, model_path, fresh)
     out: EmbeddingList = EmbeddingList()
-    used_hash = False
-    delay_ms = getattr(settings, "embedding_rate_delay_ms", 0)
-    async with httpx.AsyncClient(timeout=60) as client:
-        for t in texts:
-            success = False
-            for attempt in range(3):
-                try:
-                    payload = {"model": model_path, "content": {"parts": [{"text": t[:6000]}]}}
-                    r = await client.post(url, json=payload)
-                    if r.status_code == 429:
-                        # rate limited; backoff then retry
-                        wait_s = 0.4 * (attempt + 1)
-                        logger.warning(f"Embedding 429 rate-limit (attempt {attempt+1}); backing off {wait_s:.2f}s")
-                        await asyncio.sleep(wait_s)
-                        continue
-                    r.raise_for_status()
-                    data = r.json()
-                    try:
-                        vec = data["embedding"]["values"]  # type: ignore[index]
-                    except Exception:
-                        raise ValueError(f"Unexpected embedding response shape: {data}")
-                    out.append(vec)  # type: ignore[arg-type]
-                    runtime_state.set_gemini_success()
-                    success = True
-                    break
-                except Exception as e:
-                    if attempt < 2:
-                        await asyncio.sleep(0.2 * (attempt + 1))
-                        continue
-                    logger.warning(f"Embedding chunk failed ({e}); using hash fallback for this chunk")
-                    runtime_state.set_gemini_failure(f"embed_error: {e}")
-            if not success:
-                out.append(hash_embed(t))
-                used_hash = True
-            if delay_ms and success:
-                await asyncio.sleep(delay_ms / 1000.0)
+    sources = {"cache": 0, "api": 0, "hash": 0}
+    for k, t in zip(keys, texts):
+        vec = cached.get(k)
+        source = "cache"
+        if vec is None:
+            vec, source = fresh.get(k), "api"
+        if vec is None:
+            vec, source = hash_embed(t), "hash"
+        sources[source] += 1
+        out.append(vec)
+    for source, n in sources.items():
+        if n:
+            metrics.EMBED_TEXTS.inc(n, source=source)
+    used_hash = sources["hash"] > 0
     setattr(out, "_embed_mode", "mixed" if used_hash else "gemini")
     return out
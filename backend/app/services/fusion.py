@@ -0,0 +1,124 @@
+"""Score fusion for hybrid retrieval.
+
+`fuse` merges the vector and keyword candidate lists by chunk id and ranks the
+union with one of:
+
+- "rrf": reciprocal rank fusion, the sum of w / (rrf_k + rank). It only looks
+  at ranks, so it does not care how either retriever scales its scores.
+- "zscore": weighted sum of per-list standardized scores. A candidate missing
+  from a list gets that list's lowest z-score.
+- "convex": weighted sum of scores on fixed scales. Cosine similarity is
+  clipped to [0, 1], and BM25 is divided by the query's highest attainable
+  BM25 score (`max_score` on keyword results). Unlike min-max over the
+  returned lists, a lone keyword hit is not inflated to 1.0.
+
+`hybrid_weight` is the keyword share; vectors get 1 - hybrid_weight, and a
+list that returned nothing drops out of the weighting. Every result gets
+`hybrid_score` in [0, 1]. For rrf and convex it is the fused score divided by
+the best score attainable from the lists that returned anything; for zscore
+it is the logistic of the fused z-score. rrf and zscore are relative to the
+other candidates, so the top hit scores high however poor the match is.
+
+`similarity_threshold` is therefore compared with `relevance` instead: the
+higher of the clipped cosine and the BM25 score over the query's attainable
+maximum, the same fixed scales convex uses. It does not depend on the
+strategy, so a query unrelated to every document stays out of scope
+whichever one ranks the results. Results also carry `vector_rank`,
+`keyword_rank` and the raw `vector_score`/`keyword_score` when present.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, List, Optional
+import math
+
+STRATEGIES = ("rrf", "zscore", "convex")
+
+
+def _key(item: Dict):
+    # Chunks indexed before chunk ids existed fall back to their location.
+    return item.get("chunk_id") or (item.get("document_id"), item.get("page"), hash(item.get("text") or ""))
+
+
+def merge(vector: List[Dict], keyword: List[Dict]) -> List[Dict]:
+    """Union of both candidate lists, one entry per chunk, annotated with per-list rank and score."""
+    merged: Dict = {}
+    for rank, item in enumerate(vector, 1):
+        item["vector_rank"], item["vector_score"] = rank, item["score"]
+        merged.setdefault(_key(item), item)
+    for rank, item in enumerate(keyword, 1):
+        entry = merged.setdefault(_key(item), item)
+        entry["keyword_rank"], entry["keyword_score"] = rank, item["score"]
+        entry["keyword_max_score"] = item.get("max_score") or 0.0
+    return list(merged.values())
+
+
+def _scaled(e: Dict):
+    """The cosine and BM25 scores of an entry on [0, 1]; 0 for a list it is missing from."""
+    vec = min(1.0, max(0.0, e.get("vector_score", 0.0)))
+    bound = e.get("keyword_max_score") or 0.0
+    kw = min(1.0, e.get("keyword_score", 0.0) / bound) if bound > 0 else 0.0
+    return vec, kw
+
+
+def _rrf(entries: List[Dict], wv: float, wk: float, rrf_k: int):
+    best = (wv + wk) / (rrf_k + 1)
+    for e in entries:
+        score = 0.0
+        if "vector_rank" in e:
+            score += wv / (rrf_k + e["vector_rank"])
+        if "keyword_rank" in e:
+            score += wk / (rrf_k + e["keyword_rank"])
+        e["fusion_score"] = score
+        e["hybrid_score"] = score / best if best else 0.0
+
+
+def _zscores(entries: List[Dict], field: str) -> Dict[int, float]:
+    values = [e[field] for e in entries if field in e]
+    if not values:
+        return {}
+    mean = sum(values) / len(values)
+    std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+    # Equal scores carry no spread information; treat them all as top hits.
+    z = {id(e): ((e[field] - mean) / std if std > 0 else 1.0) for e in entries if field in e}
+    floor = min(z.values())
+    return {id(e): z.get(id(e), floor if std > 0 else 0.0) for e in entries}
+
+
+def _zscore(entries: List[Dict], wv: float, wk: float, rrf_k: int):
+    zv, zk = _zscores(entries, "vector_score"), _zscores(entries, "keyword_score")
+    total = (wv if zv else 0.0) + (wk if zk else 0.0)
+    for e in entries:
+        fused = (wv * zv.get(id(e), 0.0) + wk * zk.get(id(e), 0.0)) / total if total else 0.0
+        e["fusion_score"] = fused
+        e["hybrid_score"] = 1.0 / (1.0 + math.exp(-fused))
+
+
+def _convex(entries: List[Dict], wv: float, wk: float, rrf_k: int):
+    for e in entries:
+        vec, kw = _scaled(e)
+        e["fusion_score"] = wv * vec + wk * kw
+    total = wv + wk
+    for e in entries:
+        e["hybrid_score"] = e["fusion_score"] / total if total else 0.0
+
+
+_FUSERS: Dict[str, Callable] = {"rrf": _rrf, "zscore": _zscore, "convex": _convex}
+
+
+def fuse(vector: List[Dict], keyword: List[Dict], top_k: int, strategy: str = "rrf",
+         hybrid_weight: float = 0.4, rrf_k: int = 60) -> List[Dict]:
+    if strategy not in _FUSERS:
+        raise ValueError(f"unknown fusion strategy {strategy!r}; expected one of {', '.join(STRATEGIES)}")
+    hybrid_weight = min(1.0, max(0.0, hybrid_weight))
+    wv = (1.0 - hybrid_weight) if vector else 0.0
+    wk = hybrid_weight if keyword else 0.0
+    entries = merge(vector, keyword)
+    _FUSERS[strategy](entries, wv, wk, rrf_k)
+    for e in entries:
+        e["relevance"] = max(_scaled(e))
+    entries.sort(key=lambda e: e["fusion_score"], reverse=True)
+    return entries[:top_k]
+
+
+def parse_strategy(value: Optional[str], default: str) -> str:
+    value = (value or default).lower()
+    return value if value in _FUSERS else default
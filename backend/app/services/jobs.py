@@ -0,0 +1,359 @@
+"""In-process background ingestion queue.
+
+Jobs are rows in `ingest_jobs`, so they survive restarts: on startup every job
+left PENDING, RETRY or STARTED is queued again. `ingest_workers` asyncio
+workers pull job ids from the queue and run `tasks.ingest_document` with a
+DB-backed progress reporter. Failed attempts are retried with exponential
+backoff up to `ingest_max_attempts`; cancellation is cooperative and takes
+effect at the next stage or embedding-slice boundary.
+
+Several processes (uvicorn workers) may share the table. A job is claimed
+with a conditional UPDATE, so only one of them runs it, and the claim is a
+lease of `ingest_lease_s` that the running worker keeps renewing. A STARTED
+job is only taken over once its lease has run out, i.e. its worker died.
+Cancelling a running job sets `cancel_requested` on the row, which the
+worker running it picks up at its next renewal.
+
+Every attempt diffs the document against the chunk rows persisted by the
+last successful ingestion (see `tasks.ingest_document`), so what an attempt
+leaves behind matters. A failed attempt persists no chunk rows: whatever it
+upserted counts as new next time and is overwritten by its deterministic
+chunk id. A cancelled attempt, which may have indexed part of a re-upload
+while the rows still describe the old file, drops the document's vectors and
+chunk rows instead, so the next ingestion re-adds everything. That is why
+`cancel_for_document` waits for the job to stop before a re-upload submits
+its own job.
+
+Statuses mirror the Celery names the frontend and scripts already poll for.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Set, Tuple
+import asyncio
+import time
+import uuid
+from loguru import logger
+from sqlalchemy import and_, delete, func, or_, select, update
+from app.core.config import get_settings
+from app.db.session import SessionLocal
+from app.db import models
+from app.services import tasks, retrieval
+
+settings = get_settings()
+
+PENDING, STARTED, RETRY, SUCCESS, FAILURE, REVOKED = "PENDING", "STARTED", "RETRY", "SUCCESS", "FAILURE", "REVOKED"
+ACTIVE = (PENDING, STARTED, RETRY)
+# Errors that a retry cannot fix.
+PERMANENT_ERRORS = ("missing_doc",)
+# Seconds between checks while waiting for cancelled jobs to stop.
+CANCEL_POLL_S = 0.1
+# Longest interval between lease renewals (and cancel-request checks) of a running job.
+HEARTBEAT_S = 5.0
+
+
+async def _write_job(job_id: str, doc_status: Optional[Tuple[int, str]] = None, **fields):
+    """Update the job row and, with `doc_status=(document_id, status)`, the document in the same commit."""
+    async with SessionLocal() as session:  # type: ignore
+        if fields:
+            await session.execute(update(models.IngestJob).where(models.IngestJob.id == job_id).values(**fields))
+        if doc_status is not None:
+            await session.execute(tasks.status_update(*doc_status))
+        await session.commit()
+
+
+async def _drop_document_index(document_id: int):
+    # A cancelled run may have indexed part of the document; forget the old chunk
+    # rows too, so the next ingestion re-adds everything instead of diffing.
+    await retrieval.delete_document_vectors(document_id, await tasks.document_owner(document_id))
+    async with SessionLocal() as session:  # type: ignore
+        await session.execute(delete(models.Chunk).where(models.Chunk.document_id == document_id))
+        await session.commit()
+
+
+class JobProgress(tasks.ProgressReporter):
+    """Persists stage changes immediately and counters at most once per second.
+
+    A stage change, the pending counters and the document status go out in one commit.
+    """
+
+    def __init__(self, job_id: str, queue: "IngestQueue"):
+        self.job_id = job_id
+        self.queue = queue
+        self._pending: Dict[str, int] = {}
+        self._last_write = 0.0
+
+    async def stage(self, name: str, document_id: Optional[int] = None):
+        await self._flush(doc_status=(document_id, name) if document_id is not None else None, stage=name)
+
+    async def update(self, **counters: int):
+        # Pending counters are also flushed with the next stage change.
+        self._pending.update(counters)
+        if time.monotonic() - self._last_write >= 1.0:
+            await self._flush()
+
+    async def flush(self):
+        await self._flush()
+
+    async def _flush(self, doc_status: Optional[Tuple[int, str]] = None, **fields):
+        fields = {**self._pending, **fields}
+        self._pending = {}
+        self._last_write = time.monotonic()
+        if fields or doc_status:
+            await _write_job(self.job_id, doc_status, **fields)
+
+    def check_cancelled(self):
+        if self.job_id in self.queue._cancelled:
+            raise tasks.IngestCancelled()
+
+
+def job_to_dict(job: models.IngestJob) -> Dict:
+    return {
+        "task_id": job.id,
+        "document_id": job.document_id,
+        "status": job.status,
+        "stage": job.stage,
+        "progress": {
+            "pages_parsed": job.pages_parsed or 0,
+            "pages_total": job.pages_total or 0,
+            "chunks_embedded": job.chunks_embedded or 0,
+            "chunks_total": job.chunks_total or 0,
+        },
+        "attempts": job.attempts or 0,
+        "next_attempt_at": job.next_attempt_at,
+        "error": job.error,
+        "result": None,
+    }
+
+
+class IngestQueue:
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._timers: Set[asyncio.TimerHandle] = set()
+        self._cancelled: Set[str] = set()
+        self._running: Set[str] = set()  # jobs claimed by this process
+
+    @property
+    def started(self) -> bool:
+        return self._queue is not None
+
+    async def start(self, workers: Optional[int] = None):
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        for i in range(max(1, workers or settings.ingest_workers)):
+            self._workers.append(asyncio.create_task(self._worker(), name=f"ingest-worker-{i}"))
+        await self._recover()
+
+    async def stop(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        for w in self._workers:
+            w.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def _recover(self):
+        """Re-queue jobs interrupted by a restart.
+
+        STARTED jobs are tried once their lease runs out; the claim in `_run`
+        skips those another live process is still running or already took.
+        """
+        async with SessionLocal() as session:  # type: ignore
+            res = await session.execute(
+                select(models.IngestJob.id, models.IngestJob.status, models.IngestJob.next_attempt_at, models.IngestJob.lease_until)
+                .where(models.IngestJob.status.in_(ACTIVE))
+                .order_by(models.IngestJob.created_at)
+            )
+            rows = res.fetchall()
+        now = time.time()
+        for job_id, status, next_at, lease_until in rows:
+            due = next_at if status == RETRY else lease_until if status == STARTED else None
+            self._schedule(job_id, max(0.0, (due or now) - now))
+        if rows:
+            logger.info(f"Recovered {len(rows)} unfinished ingestion jobs")
+
+    def _schedule(self, job_id: str, delay: float = 0.0):
+        assert self._queue is not None
+        if delay <= 0:
+            self._queue.put_nowait(job_id)
+            return
+        loop = asyncio.get_running_loop()
+        timer: asyncio.TimerHandle
+
+        def fire():
+            self._timers.discard(timer)
+            if self._queue is not None:
+                self._queue.put_nowait(job_id)
+
+        timer = loop.call_later(delay, fire)
+        self._timers.add(timer)
+
+    async def submit(self, document_id: int, object_name: str, content_type: str, run_inline: bool = False) -> str:
+        job_id = uuid.uuid4().hex
+        async with SessionLocal() as session:  # type: ignore
+            session.add(models.IngestJob(
+                id=job_id, document_id=document_id, object_name=object_name,
+                content_type=content_type, status=PENDING, stage="queued",
+            ))
+            await session.commit()
+        if run_inline:
+            await self._run(job_id)
+        else:
+            await self.start()
+            self._schedule(job_id)
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        async with SessionLocal() as session:  # type: ignore
+            job = await session.get(models.IngestJob, job_id)
+            return job_to_dict(job) if job else None
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a job; returns its resulting status, or None if unknown.
+
+        Both branches are conditional updates, so a job claimed meanwhile is
+        asked to stop rather than marked REVOKED under its running worker.
+        """
+        job_row = models.IngestJob.id == job_id
+        async with SessionLocal() as session:  # type: ignore
+            res = await session.execute(
+                update(models.IngestJob).where(job_row, models.IngestJob.status.in_((PENDING, RETRY)))
+                .values(status=REVOKED, stage="cancelled")
+            )
+            if res.rowcount:
+                document_id = (await session.execute(select(models.IngestJob.document_id).where(job_row))).scalar_one()
+                await session.execute(tasks.status_update(document_id, "error"))
+            else:
+                res = await session.execute(
+                    update(models.IngestJob).where(job_row, models.IngestJob.status == STARTED).values(cancel_requested=True)
+                )
+                if res.rowcount and job_id in self._running:
+                    self._cancelled.add(job_id)
+            status = (await session.execute(select(models.IngestJob.status).where(job_row))).scalar_one_or_none()
+            await session.commit()
+            return status
+
+    async def _active_jobs(self, document_id: int) -> List[str]:
+        async with SessionLocal() as session:  # type: ignore
+            res = await session.execute(
+                select(models.IngestJob.id).where(models.IngestJob.document_id == document_id, models.IngestJob.status.in_(ACTIVE))
+            )
+            return [r[0] for r in res.fetchall()]
+
+    async def cancel_for_document(self, document_id: int, wait_s: float = 0.0) -> bool:
+        """Cancel the document's unfinished jobs and wait up to `wait_s` for running ones to stop.
+
+        A running job only stops at its next checkpoint, and on the way out drops
+        the document's vectors and chunk rows. Returns True once none is left
+        running, so the caller can replace the file and submit a new job.
+        """
+        for job_id in await self._active_jobs(document_id):
+            await self.cancel(job_id)
+        deadline = time.monotonic() + wait_s
+        while await self._active_jobs(document_id):
+            if time.monotonic() >= deadline:
+                return False
+            await asyncio.sleep(CANCEL_POLL_S)
+        return True
+
+    async def _worker(self):
+        assert self._queue is not None
+        queue = self._queue
+        while True:
+            job_id = await queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:  # pragma: no cover - _run handles its own failures
+                logger.exception(f"Ingest worker crashed on job {job_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _claim(self, job_id: str) -> Optional[Tuple[int, int, str, str]]:
+        """Start a queued job, or take over one whose lease ran out; None if it is not ours to run."""
+        now = time.time()
+        job = models.IngestJob
+        async with SessionLocal() as session:  # type: ignore
+            res = await session.execute(
+                update(job)
+                .where(job.id == job_id, or_(
+                    job.status.in_((PENDING, RETRY)),
+                    and_(job.status == STARTED, or_(job.lease_until.is_(None), job.lease_until < now)),
+                ))
+                .values(status=STARTED, attempts=func.coalesce(job.attempts, 0) + 1, next_attempt_at=None, error=None,
+                        cancel_requested=None, lease_until=now + settings.ingest_lease_s)
+            )
+            if not res.rowcount:
+                return None
+            row = (await session.execute(
+                select(job.attempts, job.document_id, job.object_name, job.content_type).where(job.id == job_id)
+            )).one()
+            await session.commit()
+        return tuple(row)
+
+    async def _heartbeat(self, job_id: str):
+        """Renew the lease of a running job and pick up cancel requests made through any process."""
+        while True:
+            await asyncio.sleep(min(HEARTBEAT_S, settings.ingest_lease_s / 3))
+            try:
+                async with SessionLocal() as session:  # type: ignore
+                    await session.execute(
+                        update(models.IngestJob).where(models.IngestJob.id == job_id, models.IngestJob.status == STARTED)
+                        .values(lease_until=time.time() + settings.ingest_lease_s)
+                    )
+                    requested = (await session.execute(
+                        select(models.IngestJob.cancel_requested).where(models.IngestJob.id == job_id)
+                    )).scalar()
+                    await session.commit()
+            except Exception as e:
+                logger.warning(f"Lease renewal of ingestion job {job_id} failed: {e}")
+                continue
+            if requested:
+                self._cancelled.add(job_id)
+
+    async def _run(self, job_id: str):
+        claimed = await self._claim(job_id)
+        if claimed is None:
+            return
+        attempts, document_id, object_name, content_type = claimed
+        error: Optional[str] = None
+        progress = JobProgress(job_id, self)
+        self._running.add(job_id)
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        try:
+            try:
+                result = await tasks.ingest_document(document_id, object_name, content_type, progress=progress)
+            finally:
+                heartbeat.cancel()
+                self._running.discard(job_id)
+                await progress.flush()
+            error = result.get("error")
+        except tasks.IngestCancelled:
+            self._cancelled.discard(job_id)
+            await _drop_document_index(document_id)
+            await _write_job(job_id, (document_id, "error"), status=REVOKED, stage="cancelled")
+            logger.info(f"Ingestion job {job_id} (doc {document_id}) cancelled")
+            return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.exception(f"Ingestion job {job_id} (doc {document_id}) failed: {e}")
+        self._cancelled.discard(job_id)  # a cancel that arrived after the last checkpoint
+        if not error:
+            await _write_job(job_id, status=SUCCESS, stage="done")
+            return
+        if attempts < settings.ingest_max_attempts and error not in PERMANENT_ERRORS:
+            delay = settings.ingest_retry_backoff_s * (2 ** (attempts - 1))
+            await _write_job(job_id, (document_id, "queued"), status=RETRY, stage="waiting_retry", error=error[:2000],
+                             next_attempt_at=time.time() + delay)
+            logger.warning(f"Ingestion job {job_id} attempt {attempts} failed ({error}); retrying in {delay:.1f}s")
+            if self._queue is not None:
+                self._schedule(job_id, delay)
+            else:
+                await asyncio.sleep(delay)
+                await self._run(job_id)
+            return
+        await _write_job(job_id, (document_id, "error"), status=FAILURE, stage="failed", error=error[:2000])
+
+
+ingest_queue = IngestQueue()
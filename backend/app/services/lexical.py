@@ -0,0 +1,347 @@
+"""Inverted-index BM25 engine for the keyword half of hybrid retrieval.
+
+Each term maps to a postings list of (slot, tf) pairs held in compact
+`array('i')` buffers; slots are assigned in insertion order, so every postings
+list is sorted and can be intersected with `searchsorted`. Scoring is BM25
+with document-length normalization. Query terms are processed in decreasing
+order of their score upper bound (term-at-a-time max-score): once the k-th
+best accumulated score exceeds what all remaining terms could still add, no
+new candidates are admitted and the remaining (usually very common) terms
+only probe the surviving candidates instead of scanning their postings.
+Results carry that bound summed over the query terms as `max_score`, which
+puts BM25 scores on a fixed [0, 1] scale for score fusion.
+
+Deletes tombstone slots and fix up document frequencies immediately; the
+in-memory postings are compacted once their tombstones outnumber live chunks. Chunks carrying
+a `chunk_id` are unique by it: re-adding one replaces the previous entry.
+
+An index can sit on top of a read-only snapshot (`lexical_snapshot.Snapshot`,
+memory-mapped from disk): the snapshot's chunks occupy the first slots and its
+postings are used in place, while later adds, deletes and page updates are kept
+in memory as above. Its slots are fixed by its postings, so compaction leaves
+them (and their tombstones) alone until `lexical_sync` builds a new snapshot. `tokenize_batch` is the bulk tokenizer used to build
+snapshots.
+"""
+from __future__ import annotations
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import math
+import re
+import numpy as np
+
+_WORD_RE = re.compile(r"[A-Za-z0-9_]{2,}")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall((text or "").lower())[:5000]
+
+
+def tokenize_batch(texts: List[str]) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Tokenize many chunks at once (picklable, runs on the CPU pool during rebuilds).
+
+    Returns the batch vocabulary, then term id, row and term frequency of every
+    distinct (row, term) pair ordered by row, then the token count of each row.
+    """
+    vocab: Dict[str, int] = {}
+    ids = array("i")
+    lengths = np.empty(len(texts), dtype=np.int32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[row] = len(tokens)
+        ids.extend([vocab.setdefault(t, len(vocab)) for t in tokens])
+    rows = np.repeat(np.arange(len(texts), dtype=np.int64), lengths)
+    keys, tfs = np.unique((rows << 32) | np.frombuffer(ids, dtype=np.int32), return_counts=True)
+    return list(vocab), (keys & 0xFFFFFFFF).astype(np.int32), (keys >> 32).astype(np.int32), tfs.astype(np.int32), lengths
+
+
+class LexicalIndex:
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    def clear(self):
+        self._base = None
+        self._base_n = 0
+        self._base_dead = 0
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._max_tf: Dict[str, int] = {}
+        self._df: Dict[str, int] = {}
+        self._doc_ids = array("i")
+        self._pages = array("i")
+        self._lengths = array("i")
+        self._alive = bytearray()
+        self._texts: List[Optional[str]] = []  # slots from _base_n on
+        self._chunk_ids: List[Optional[str]] = []
+        self._by_document: Dict[int, List[int]] = {}
+        self._by_chunk: Dict[str, int] = {}
+        self._live = 0
+        self._dead = 0
+        self._total_len = 0
+
+    def __len__(self) -> int:
+        return self._live
+
+    def attach(self, snapshot):
+        """Serve `snapshot` as the read-only base of this (emptied) index."""
+        self.clear()
+        self._base = snapshot
+        self._base_n = snapshot.count
+        self._doc_ids.frombytes(np.ascontiguousarray(snapshot.doc_ids, dtype=np.int32).tobytes())
+        self._pages.frombytes(np.ascontiguousarray(snapshot.pages, dtype=np.int32).tobytes())
+        self._lengths.frombytes(np.ascontiguousarray(snapshot.lengths, dtype=np.int32).tobytes())
+        self._alive = bytearray(b"\x01") * snapshot.count
+        self._live = snapshot.count
+        self._total_len = snapshot.total_len
+
+    @property
+    def snapshot(self):
+        return self._base
+
+    @property
+    def changes_since_snapshot(self) -> int:
+        """Chunks added or deleted in memory on top of the snapshot."""
+        return len(self._lengths) - self._base_n + self._base_dead
+
+    def _text(self, slot: int) -> Optional[str]:
+        if slot < self._base_n:
+            return self._base.text(slot)
+        return self._texts[slot - self._base_n]
+
+    def _chunk_id(self, slot: int) -> Optional[str]:
+        if slot < self._base_n:
+            return self._base.chunk_id(slot)
+        return self._chunk_ids[slot - self._base_n]
+
+    def _slot_of(self, chunk_id: str) -> Optional[int]:
+        slot = self._by_chunk.get(chunk_id)
+        if slot is None and self._base is not None:
+            slot = self._base.find_chunk(chunk_id)
+            if slot is None or not self._alive[slot]:
+                return None
+        return slot
+
+    def _doc_freq(self, term: str) -> int:
+        df = self._df.get(term, 0)
+        if self._base is not None:
+            i = self._base.term(term)
+            if i >= 0:
+                df += int(self._base.df[i])
+        return df
+
+    def _term_max_tf(self, term: str) -> int:
+        tf = self._max_tf.get(term, 0)
+        if self._base is not None:
+            i = self._base.term(term)
+            if i >= 0:
+                tf = max(tf, int(self._base.max_tf[i]))
+        return tf
+
+    def _term_postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        # Snapshot slots all precede in-memory ones, so the concatenation stays sorted.
+        delta = self._postings.get(term)
+        if delta is not None:
+            slots, tfs = np.frombuffer(delta[0], dtype=np.int32), np.frombuffer(delta[1], dtype=np.int32)
+        else:
+            slots = tfs = np.empty(0, dtype=np.int32)
+        if self._base is not None:
+            i = self._base.term(term)
+            if i >= 0:
+                base_slots, base_tfs = self._base.postings(i)
+                if not slots.size:
+                    return base_slots, base_tfs
+                return np.concatenate([base_slots, slots]), np.concatenate([base_tfs, tfs])
+        return slots, tfs
+
+    def has_chunk(self, chunk_id: str) -> bool:
+        return self._slot_of(chunk_id) is not None
+
+    def chunk_ids(self) -> np.ndarray:
+        """Ids (36-byte strings) of every live chunk that has one."""
+        alive = np.frombuffer(self._alive, dtype=np.uint8).astype(bool)
+        delta = [cid or "" for i, cid in enumerate(self._chunk_ids) if alive[self._base_n + i]]
+        parts = [np.asarray(delta, dtype="S36")]
+        if self._base is not None:
+            parts.insert(0, np.asarray(self._base.chunk_ids)[alive[:self._base_n]])
+        ids = np.concatenate(parts)
+        return ids[ids != b""]
+
+    def add(self, chunks: List[Dict]):
+        self.delete_chunks([ch["chunk_id"] for ch in chunks if ch.get("chunk_id")])
+        for ch in chunks:
+            text = ch.get("text") or ""
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            slot = len(self._lengths)
+            chunk_id = ch.get("chunk_id")
+            self._chunk_ids.append(chunk_id)
+            if chunk_id:
+                self._by_chunk[chunk_id] = slot
+            document_id = ch.get("document_id") or 0
+            self._doc_ids.append(document_id)
+            self._pages.append(ch.get("page", 0) or 0)
+            self._lengths.append(len(tokens))
+            self._alive.append(1)
+            self._texts.append(text)
+            self._by_document.setdefault(document_id, []).append(slot)
+            for term, tf in Counter(tokens).items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = (array("i"), array("i"))
+                postings[0].append(slot)
+                postings[1].append(tf)
+                if tf > self._max_tf.get(term, 0):
+                    self._max_tf[term] = tf
+                self._df[term] = self._df.get(term, 0) + 1
+            self._live += 1
+            self._total_len += len(tokens)
+
+    def _kill(self, slot: int):
+        if not self._alive[slot]:
+            return
+        self._alive[slot] = 0
+        for term in set(tokenize(self._text(slot) or "")):
+            # Counts here are relative to the snapshot's, so they can go negative.
+            left = self._df.get(term, 0) - 1
+            if left:
+                self._df[term] = left
+            else:
+                self._df.pop(term, None)
+        if slot >= self._base_n:
+            self._texts[slot - self._base_n] = None
+        else:
+            self._base_dead += 1
+        chunk_id = self._chunk_id(slot)
+        if chunk_id and self._by_chunk.get(chunk_id) == slot:
+            del self._by_chunk[chunk_id]
+        self._live -= 1
+        self._dead += 1
+        self._total_len -= self._lengths[slot]
+
+    def _maybe_compact(self):
+        if self._dead - self._base_dead > max(1000, self._live):
+            self.compact()
+
+    def delete_document(self, document_id: int):
+        slots = self._by_document.pop(document_id, [])
+        if self._base is not None:
+            slots = [*self._base.document_slots(document_id), *slots]
+        for slot in slots:
+            self._kill(slot)
+        self._maybe_compact()
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        found = False
+        for chunk_id in chunk_ids:
+            slot = self._slot_of(chunk_id)
+            if slot is not None:
+                self._kill(slot)
+                found = True
+        if found:
+            self._maybe_compact()
+
+    def update_pages(self, pages: Dict[str, int]):
+        """Set the page of existing chunks (chunk_id -> page) without re-indexing them."""
+        for chunk_id, page in pages.items():
+            slot = self._slot_of(chunk_id)
+            if slot is not None:
+                self._pages[slot] = page
+
+    def compact(self):
+        """Drop tombstoned in-memory slots and renumber the live ones; the snapshot stays mapped."""
+        n = self._base_n
+        survivors = [
+            {"text": self._text(s), "document_id": self._doc_ids[s], "page": self._pages[s], "chunk_id": self._chunk_id(s)}
+            for s in range(n, len(self._lengths)) if self._alive[s]
+        ]
+        # Killing the survivors takes their counts out of df, live and total length; `add` puts them back.
+        for slot in range(n, len(self._lengths)):
+            self._kill(slot)
+        for column in (self._doc_ids, self._pages, self._lengths, self._alive):
+            del column[n:]
+        self._postings, self._max_tf = {}, {}
+        self._texts, self._chunk_ids = [], []
+        self._by_document, self._by_chunk = {}, {}
+        self._dead = self._base_dead
+        self.add(survivors)
+
+    def _idf(self, term: str) -> float:
+        df = self._doc_freq(term)
+        return math.log(1 + (self._live - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, top_k: int, document_ids: Optional[List[int]] = None) -> List[Dict]:
+        if not self._live or top_k <= 0 or not query.strip():
+            return []
+        terms = [t for t in set(tokenize(query)) if self._doc_freq(t) > 0]
+        if not terms:
+            return []
+        k1, b = self.k1, self.b
+        avgdl = self._total_len / self._live
+        lengths = np.frombuffer(self._lengths, dtype=np.int32)
+        doc_ids = np.frombuffer(self._doc_ids, dtype=np.int32)
+        alive = np.frombuffer(self._alive, dtype=np.uint8)
+        allowed_docs = np.asarray(document_ids, dtype=np.int32) if document_ids else None
+        filtered = allowed_docs is not None or self._dead > 0
+
+        idf = {t: self._idf(t) for t in terms}
+        # BM25 term score is maximised at the largest tf and shortest document (norm >= 1 - b).
+        max_tf = {t: self._term_max_tf(t) for t in terms}
+        upper = {t: idf[t] * (k1 + 1) * max_tf[t] / (max_tf[t] + k1 * (1 - b)) for t in terms}
+        terms.sort(key=lambda t: upper[t], reverse=True)
+        remaining = bound = sum(upper.values())
+
+        cands = np.empty(0, dtype=np.int32)
+        scores = np.empty(0, dtype=np.float64)
+        theta = 0.0
+        pruning = False
+        for term in terms:
+            slots, tfs = self._term_postings(term)
+            remaining = max(0.0, remaining - upper[term])
+            if pruning:
+                if cands.size == 0:
+                    break
+                pos = np.searchsorted(slots, cands)
+                pos[pos >= slots.size] = 0
+                hit = slots[pos] == cands
+                tf = tfs[pos[hit]].astype(np.float64)
+                dl = lengths[cands[hit]]
+                scores[hit] += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+            else:
+                if filtered:
+                    keep = alive[slots].astype(bool)
+                    if allowed_docs is not None:
+                        keep &= np.isin(doc_ids[slots], allowed_docs)
+                    slots, tfs = slots[keep], tfs[keep]
+                tf = tfs.astype(np.float64)
+                contrib = idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[slots] / avgdl))
+                merged = np.concatenate([cands, slots])
+                cands, inverse = np.unique(merged, return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate([scores, contrib]), minlength=cands.size)
+                cands = cands.astype(np.int32)
+            if cands.size >= top_k:
+                theta = max(theta, float(np.partition(scores, -top_k)[-top_k]))
+                if theta > remaining:
+                    # Nothing outside the candidate set can still reach the top-k.
+                    pruning = True
+                    viable = scores + remaining >= theta
+                    cands, scores = cands[viable], scores[viable]
+        if cands.size == 0:
+            return []
+        k = min(top_k, cands.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        out: List[Dict] = []
+        for i in top:
+            slot = int(cands[i])
+            out.append({
+                "score": float(scores[i]),
+                "text": self._text(slot),
+                "page": self._pages[slot],
+                "document_id": self._doc_ids[slot],
+                "chunk_id": self._chunk_id(slot),
+                "mode": "keyword",
+                "max_score": bound,
+            })
+        return out
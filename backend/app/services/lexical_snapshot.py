@@ -0,0 +1,284 @@
+"""Versioned on-disk snapshots of the BM25 index, memory-mapped read-only.
+
+Layout under `lexical_index_dir`:
+
+    CURRENT              name of the newest complete version (replaced atomically)
+    .lock                flock()ed by the process building or checking a version
+    v<N>/meta.json       format, chunk count, total tokens, chunks-table watermark
+                         (highest chunks.id read and the number of rows up to it)
+    v<N>/*.npy, *.bin    fixed-layout arrays
+
+Terms are stored sorted in `terms.bin` (ASCII, see `lexical.tokenize`) with
+`term_offsets`, and looked up by binary search. The postings of term i are
+`post_slots`/`post_tfs[post_offsets[i]:post_offsets[i + 1]]`, slot-ordered.
+Per-slot arrays hold document id, page, token count and a 36-byte chunk id;
+sorted copies of the chunk ids and document ids make lookups a
+`searchsorted`. Chunk texts are a UTF-8 blob with offsets.
+
+Every file is opened with mmap, so workers mapping the same version share one
+copy in the page cache and loading costs no parsing. Versions are never
+modified once CURRENT names them; new ones are written beside them and the two
+newest are kept (unlinking a file another worker still maps is safe on POSIX).
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
+import mmap
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+
+try:  # POSIX only; without it concurrent builders are not serialized
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+FORMAT = 1
+KEEP_VERSIONS = 2
+
+
+def _map_blob(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class Snapshot:
+    """One mapped version; read-only."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta: Dict = json.load(f)
+        if self.meta.get("format") != FORMAT:
+            raise ValueError(f"unsupported lexical snapshot format {self.meta.get('format')}")
+        load = lambda name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")  # noqa: E731
+        self.count: int = self.meta["count"]
+        self.total_len: int = self.meta["total_len"]
+        self.rows: int = self.meta["rows"]  # chunk rows read, including ones without tokens
+        self.max_row_id: int = self.meta["max_row_id"]
+        self.terms = _map_blob(os.path.join(path, "terms.bin"))
+        self.term_offsets = load("term_offsets")
+        self.post_offsets = load("post_offsets")
+        self.post_slots = load("post_slots")
+        self.post_tfs = load("post_tfs")
+        self.df = load("df")
+        self.max_tf = load("max_tf")
+        self.doc_ids = load("doc_ids")
+        self.pages = load("pages")
+        self.lengths = load("lengths")
+        self.chunk_ids = load("chunk_ids")
+        self.chunk_sorted = load("chunk_sorted")
+        self.chunk_order = load("chunk_order")
+        self.doc_sorted = load("doc_sorted")
+        self.doc_order = load("doc_order")
+        self.texts = _map_blob(os.path.join(path, "texts.bin"))
+        self.text_offsets = load("text_offsets")
+
+    @property
+    def version(self) -> str:
+        return os.path.basename(self.path)
+
+    def _term_at(self, i: int) -> bytes:
+        return self.terms[self.term_offsets[i]:self.term_offsets[i + 1]]
+
+    def term(self, term: str) -> int:
+        """Index of `term` in the vocabulary, or -1."""
+        key = term.encode()
+        lo, hi = 0, len(self.term_offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self.term_offsets) - 1 and self._term_at(lo) == key else -1
+
+    def postings(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        a, b = self.post_offsets[i], self.post_offsets[i + 1]
+        return self.post_slots[a:b], self.post_tfs[a:b]
+
+    def text(self, slot: int) -> str:
+        return self.texts[self.text_offsets[slot]:self.text_offsets[slot + 1]].decode("utf-8")
+
+    def chunk_id(self, slot: int) -> Optional[str]:
+        return self.chunk_ids[slot].decode() or None
+
+    def find_chunk(self, chunk_id: str) -> Optional[int]:
+        key = chunk_id.encode()
+        i = int(np.searchsorted(self.chunk_sorted, key))
+        if i < self.count and self.chunk_sorted[i] == key:
+            return int(self.chunk_order[i])
+        return None
+
+    def document_slots(self, document_id: int) -> np.ndarray:
+        a, b = np.searchsorted(self.doc_sorted, [document_id, document_id + 1])
+        return self.doc_order[a:b]
+
+
+class SnapshotBuilder:
+    """Accumulates `lexical.tokenize_batch` output in slot order and writes a new version.
+
+    Texts stream straight to disk; the postings are held as flat arrays (about
+    12 bytes per distinct term per chunk) until `write` sorts them by term.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.staging = os.path.join(directory, f".build-{uuid.uuid4().hex}")
+        os.makedirs(self.staging)
+        self._texts = open(os.path.join(self.staging, "texts.bin"), "wb")
+        self._text_offsets: List[int] = [0]
+        self._vocab: Dict[str, int] = {}
+        self._term_ids: List[np.ndarray] = []
+        self._slots: List[np.ndarray] = []
+        self._tfs: List[np.ndarray] = []
+        self._doc_ids: List[int] = []
+        self._pages: List[int] = []
+        self._lengths: List[np.ndarray] = []
+        self._chunk_ids: List[bytes] = []
+        self.count = 0
+        self.rows = 0
+        self.max_row_id = 0
+
+    def add_batch(self, batch, rows: List[Tuple[int, Optional[str], int, int, str]]):
+        """`batch` is `tokenize_batch` of the row texts; rows are (row id, chunk id, document id, page, text)."""
+        terms, term_ids, row_idx, tfs, lengths = batch
+        keep = lengths > 0  # chunks without tokens get no slot, as in LexicalIndex.add
+        slot_of_row = np.cumsum(keep, dtype=np.int64) - 1 + self.count
+        vocab = self._vocab
+        local = np.fromiter((vocab.setdefault(t, len(vocab)) for t in terms), dtype=np.int32, count=len(terms))
+        self._term_ids.append(local[term_ids] if term_ids.size else term_ids)
+        self._slots.append(slot_of_row[row_idx].astype(np.int32))
+        self._tfs.append(tfs)
+        self._lengths.append(lengths[keep])
+        pos = self._text_offsets[-1]
+        for (row_id, chunk_id, document_id, page, text), kept in zip(rows, keep):
+            self.max_row_id = max(self.max_row_id, row_id)
+            if not kept:
+                continue
+            data = (text or "").encode("utf-8")
+            self._texts.write(data)
+            pos += len(data)
+            self._text_offsets.append(pos)
+            self._doc_ids.append(document_id or 0)
+            self._pages.append(page or 0)
+            self._chunk_ids.append((chunk_id or "").encode())
+        self.count += int(keep.sum())
+        self.rows += len(rows)
+
+    def _save(self, name: str, arr: np.ndarray):
+        np.save(os.path.join(self.staging, name + ".npy"), arr)
+
+    def write(self) -> str:
+        """Finish the staged version, publish it as CURRENT and return its path."""
+        self._texts.close()
+        terms = list(self._vocab)
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[order] = np.arange(len(terms), dtype=np.int32)
+        term_ids = rank[np.concatenate(self._term_ids)] if self._term_ids else np.empty(0, dtype=np.int32)
+        slots = np.concatenate(self._slots) if self._slots else np.empty(0, dtype=np.int32)
+        tfs = np.concatenate(self._tfs) if self._tfs else np.empty(0, dtype=np.int32)
+        self._term_ids = self._slots = self._tfs = []
+        # Rows arrive in slot order, so a stable sort by term keeps each postings list sorted.
+        perm = np.argsort(term_ids, kind="stable")
+        df = np.bincount(term_ids, minlength=len(terms)).astype(np.int32)
+        post_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=post_offsets[1:])
+        post_tfs = tfs[perm]
+        self._save("post_slots", slots[perm])
+        del slots, perm
+        self._save("post_tfs", post_tfs)
+        self._save("post_offsets", post_offsets)
+        self._save("df", df)
+        self._save("max_tf", np.maximum.reduceat(post_tfs, post_offsets[:-1]) if terms else np.empty(0, dtype=np.int32))
+        del post_tfs, term_ids, tfs
+        encoded = [terms[i].encode() for i in order]
+        term_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in encoded], out=term_offsets[1:])
+        with open(os.path.join(self.staging, "terms.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        self._save("term_offsets", term_offsets)
+        doc_ids = np.asarray(self._doc_ids, dtype=np.int32)
+        chunk_ids = np.asarray(self._chunk_ids, dtype="S36")
+        lengths = np.concatenate(self._lengths) if self._lengths else np.empty(0, dtype=np.int32)
+        self._save("doc_ids", doc_ids)
+        self._save("pages", np.asarray(self._pages, dtype=np.int32))
+        self._save("lengths", lengths)
+        self._save("chunk_ids", chunk_ids)
+        chunk_order = np.argsort(chunk_ids, kind="stable").astype(np.int32)
+        self._save("chunk_sorted", chunk_ids[chunk_order])
+        self._save("chunk_order", chunk_order)
+        doc_order = np.argsort(doc_ids, kind="stable").astype(np.int32)
+        self._save("doc_sorted", doc_ids[doc_order])
+        self._save("doc_order", doc_order)
+        self._save("text_offsets", np.asarray(self._text_offsets, dtype=np.int64))
+        meta = {
+            "format": FORMAT,
+            "count": self.count,
+            "total_len": int(lengths.sum()),
+            "terms": len(terms),
+            "rows": self.rows,
+            "max_row_id": self.max_row_id,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(self.staging, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return publish(self.directory, self.staging)
+
+    def discard(self):
+        self._texts.close()
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+def _versions(directory: str) -> List[int]:
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(n[1:]) for n in names if n.startswith("v") and n[1:].isdigit())
+
+
+def publish(directory: str, staging: str) -> str:
+    versions = _versions(directory)
+    name = f"v{(versions[-1] + 1) if versions else 1}"
+    path = os.path.join(directory, name)
+    os.rename(staging, path)
+    tmp = os.path.join(directory, f".CURRENT-{uuid.uuid4().hex}")
+    with open(tmp, "w") as f:
+        f.write(name)
+    os.replace(tmp, os.path.join(directory, "CURRENT"))
+    for old in _versions(directory)[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(directory, f"v{old}"), ignore_errors=True)
+    return path
+
+
+def current(directory: str) -> Optional[str]:
+    """Path of the version CURRENT names, if any."""
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isdir(path) else None
+
+
+@contextmanager
+def locked(directory: str) -> Iterator[None]:
+    """Exclusive lock across processes (blocking) while a version is checked or built."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
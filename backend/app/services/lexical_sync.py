@@ -0,0 +1,263 @@
+"""Keeps the BM25 index in step with the `chunks` table across restarts and workers.
+
+On startup `restore` maps the CURRENT snapshot under `lexical_index_dir` and
+catches up on what changed in the chunks table since it was written: rows
+newer than its watermark are indexed (or, for chunks it already has, only
+their page is updated) and chunks whose rows are gone are dropped. When there
+is no usable snapshot, or the changes exceed `lexical_rebuild_ratio` of it,
+the index is rebuilt from the chunks table instead: rows are streamed in
+batches, tokenized on the CPU pool and written as a new version, which is then
+mapped. A file lock makes sure a single worker rebuilds while the others wait
+and map the result.
+
+With `lexical_refresh_s` > 0 each worker repeats the catch-up periodically,
+maps newer versions written by other workers, and rebuilds once its in-memory
+changes outgrow the snapshot, so multi-worker deployments converge.
+"""
+from __future__ import annotations
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import time
+import numpy as np
+from loguru import logger
+from sqlalchemy import func, select
+from app.core import executors
+from app.core.config import get_settings
+from app.db.session import engine
+from app.db import models
+from . import lexical, lexical_snapshot, tenants
+from .lexical import LexicalIndex
+
+settings = get_settings()
+
+REBUILD_BATCH = 5000
+
+_refresh_task: Optional[asyncio.Task] = None
+# Watermark of the index: highest chunks.id applied and the number of rows up to it.
+_seen_row_id = 0
+_seen_rows: Optional[int] = None
+# Whether the chunks table can reuse deleted row ids (see `models.chunk_row_ids_reused`), checked once.
+_ids_reused: Optional[bool] = None
+
+
+@asynccontextmanager
+async def _locked(directory: str):
+    lock = lexical_snapshot.locked(directory)
+    await executors.run_io(lock.__enter__)
+    try:
+        yield
+    finally:
+        lock.__exit__(None, None, None)
+
+
+def _open(path: Optional[str]) -> Optional[lexical_snapshot.Snapshot]:
+    if not path:
+        return None
+    try:
+        return lexical_snapshot.Snapshot(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable lexical snapshot {path}: {e}")
+        return None
+
+
+async def rebuild(directory: str, batch_size: int = REBUILD_BATCH) -> str:
+    """Build a new snapshot version from the chunks table and publish it."""
+    builder = lexical_snapshot.SnapshotBuilder(directory)
+    inflight: deque = deque()
+    stmt = (
+        select(models.Chunk.id, models.Chunk.chunk_id, models.Chunk.document_id, models.Chunk.page, models.Chunk.text)
+        .order_by(models.Chunk.id)
+        .execution_options(yield_per=batch_size)
+    )
+    try:
+        async with engine.connect() as conn:
+            result = await conn.stream(stmt)
+            async for part in result.partitions(batch_size):
+                rows = [tuple(r) for r in part]
+                # Tokenize on the CPU pool while the next batch is read; batches are added in order.
+                task = asyncio.ensure_future(executors.run_cpu(lexical.tokenize_batch, [r[4] or "" for r in rows]))
+                inflight.append((task, rows))
+                while len(inflight) > max(1, settings.parse_workers):
+                    task, done = inflight.popleft()
+                    await executors.run_io(builder.add_batch, await task, done)
+        while inflight:
+            task, done = inflight.popleft()
+            await executors.run_io(builder.add_batch, await task, done)
+        return await executors.run_io(builder.write)
+    except BaseException:
+        for task, _ in inflight:
+            task.cancel()
+        builder.discard()
+        raise
+
+
+async def db_chunk_ids() -> np.ndarray:
+    """Chunk ids of all rows of the chunks table (S36)."""
+    ids = []
+    async with engine.connect() as conn:
+        result = await conn.stream(
+            select(models.Chunk.chunk_id).where(models.Chunk.chunk_id.is_not(None)).execution_options(yield_per=50_000)
+        )
+        async for part in result.scalars().partitions(50_000):
+            ids.append(np.asarray(part, dtype="S36"))
+    return np.concatenate(ids) if ids else np.empty(0, dtype="S36")
+
+
+async def _rows_upto(row_id: int) -> int:
+    async with engine.connect() as conn:
+        stmt = select(func.count()).select_from(models.Chunk).where(models.Chunk.id <= row_id)
+        return (await conn.execute(stmt)).scalar_one()
+
+
+async def _rows_after(row_id: int) -> int:
+    async with engine.connect() as conn:
+        stmt = select(func.count()).select_from(models.Chunk).where(models.Chunk.id > row_id)
+        return (await conn.execute(stmt)).scalar_one()
+
+
+async def _row_ids_reused() -> bool:
+    global _ids_reused
+    if _ids_reused is None:
+        async with engine.connect() as conn:
+            _ids_reused = await conn.run_sync(models.chunk_row_ids_reused)
+    return _ids_reused
+
+
+def _select_rows():
+    return select(models.Chunk.id, models.Chunk.chunk_id, models.Chunk.document_id, models.Chunk.page,
+                  models.Chunk.text, models.Chunk.owner_id)
+
+
+def _apply(index: LexicalIndex, rows: List) -> Tuple[int, int]:
+    """Index the chunk rows the index lacks and update the page of the others; returns both counts."""
+    fresh, pages = [], {}
+    for _, chunk_id, document_id, page, text, owner_id in rows:
+        if chunk_id and index.has_chunk(chunk_id):
+            pages[chunk_id] = page or 0
+        else:
+            fresh.append({"chunk_id": chunk_id, "document_id": document_id, "page": page or 0, "text": text or ""})
+            tenants.owners.set(document_id, owner_id)
+    index.update_pages(pages)
+    index.add(fresh)
+    return len(fresh), len(pages)
+
+
+async def catch_up(index: LexicalIndex, since_row_id: int, rows_upto: Optional[int] = None) -> Dict[str, int]:
+    """Index chunk rows newer than `since_row_id` and drop chunks whose rows are gone.
+
+    Row ids only grow, so when the table still holds `rows_upto` rows up to the
+    watermark nothing older was deleted and the full chunk id scan is skipped.
+    On SQLite tables that reuse row ids that shortcut does not hold: chunk ids
+    are always compared, and rows up to the watermark whose chunks the index
+    lacks are indexed too. Owners of the new chunks are recorded in
+    `tenants.owners`, so documents ingested by other workers are searchable by
+    their owner.
+    """
+    global _seen_row_id, _seen_rows
+    reused = await _row_ids_reused()
+    older = await _rows_upto(since_row_id)
+    removed = added = moved = 0
+    if reused or older != rows_upto:
+        live = index.chunk_ids()
+        in_db = await db_chunk_ids()
+        gone = live[~np.isin(live, in_db)] if live.size else live
+        index.delete_chunks([g.decode() for g in gone])
+        removed = int(gone.size)
+        # Rows at or below the watermark may have taken the id of a deleted one.
+        missing = in_db[~np.isin(in_db, live)] if reused else in_db[:0]
+        for start in range(0, missing.size, REBUILD_BATCH):
+            batch = [m.decode() for m in missing[start:start + REBUILD_BATCH].tolist()]
+            stmt = _select_rows().where(models.Chunk.id <= since_row_id, models.Chunk.chunk_id.in_(batch))
+            async with engine.connect() as conn:
+                added += _apply(index, (await conn.execute(stmt)).all())[0]
+    seen, rows = since_row_id, older
+    stmt = (
+        _select_rows()
+        .where(models.Chunk.id > since_row_id)
+        .order_by(models.Chunk.id)
+        .execution_options(yield_per=REBUILD_BATCH)
+    )
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt)
+        async for part in result.partitions(REBUILD_BATCH):
+            fresh, pages = _apply(index, part)
+            added += fresh
+            moved += pages
+            seen = max(seen, part[-1][0])
+            rows += len(part)
+    _seen_row_id, _seen_rows = seen, rows
+    return {"added": added, "updated": moved, "removed": removed}
+
+
+async def restore(index: LexicalIndex) -> Dict:
+    """Map (or rebuild) the snapshot into `index` and catch up with the chunks table."""
+    directory = settings.lexical_index_dir
+    if not directory:
+        return {"mode": "disabled"}
+    t0 = time.perf_counter()
+    mode = "mapped"
+    async with _locked(directory):
+        snapshot = _open(lexical_snapshot.current(directory))
+        if snapshot is not None:
+            changed = await _rows_after(snapshot.max_row_id) + snapshot.rows - await _rows_upto(snapshot.max_row_id)
+            if changed > settings.lexical_rebuild_ratio * max(snapshot.rows, 1):
+                snapshot = None
+        if snapshot is None:
+            snapshot = lexical_snapshot.Snapshot(await rebuild(directory))
+            mode = "rebuilt"
+    index.attach(snapshot)
+    changes = await catch_up(index, snapshot.max_row_id, snapshot.rows)
+    stats = {"mode": mode, "version": snapshot.version, "chunks": len(index), "seconds": round(time.perf_counter() - t0, 3), **changes}
+    logger.info(f"Lexical index ready: {stats}")
+    return stats
+
+
+async def refresh(index: LexicalIndex):
+    """One refresh round: map a newer version if there is one, then catch up."""
+    directory = settings.lexical_index_dir
+    if not directory:
+        return
+    path = lexical_snapshot.current(directory)
+    base = index.snapshot
+    if path and (base is None or base.path != path):
+        snapshot = _open(path)
+        if snapshot is not None:
+            index.attach(snapshot)
+            await catch_up(index, snapshot.max_row_id, snapshot.rows)
+            return
+    await catch_up(index, _seen_row_id, _seen_rows)
+    if index.changes_since_snapshot > settings.lexical_rebuild_ratio * max(base.count if base is not None else 0, 1):
+        async with _locked(directory):
+            if lexical_snapshot.current(directory) == path:  # nobody else rebuilt meanwhile
+                await rebuild(directory)
+        await refresh(index)
+
+
+async def _refresh_loop(index: LexicalIndex):
+    while True:
+        await asyncio.sleep(settings.lexical_refresh_s)
+        try:
+            await refresh(index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # pragma: no cover
+            logger.warning(f"Lexical index refresh failed: {e}")
+
+
+def start_refresh(index: LexicalIndex):
+    global _refresh_task
+    if settings.lexical_refresh_s > 0 and settings.lexical_index_dir and _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop(index))
+
+
+async def stop_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
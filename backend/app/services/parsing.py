@@ -1,5 +1,7 @@
 import io
-from typing import List, Tuple
+import mmap
+import time
+from typing import List, Tuple, Union
 import fitz  # PyMuPDF
 import pdfplumber
 import pytesseract
@@ -9,26 +11,65 @@ from docx import Document as DocxDocument
 SUPPORTED = {"application/pdf", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "text/plain"}
 
 
-def parse_pdf(data: bytes) -> List[Tuple[int, str]]:
-    results: List[Tuple[int, str]] = []
-    # Try text extraction first
-    doc = fitz.open(stream=data, filetype="pdf")
-    for page_index, page in enumerate(doc):
-        text = page.get_text().strip()
-        if not text:
-            # fallback to OCR for that page
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            ocr_text = pytesseract.image_to_string(img)
-            results.append((page_index + 1, ocr_text))
-        else:
+# Parsers accept raw bytes or a path to a spooled file (what ingestion passes).
+Source = Union[bytes, str]
+
+
+def _open_pdf(data: Source) -> "fitz.Document":
+    return fitz.open(data, filetype="pdf") if isinstance(data, str) else fitz.open(stream=data, filetype="pdf")
+
+
+def pdf_page_count(data: Source) -> int:
+    with _open_pdf(data) as doc:
+        return doc.page_count
+
+
+class PageList(list):
+    """(page, text) list that also carries the seconds spent on each OCRed page.
+
+    Shards run in the parse process pool, which cannot update the parent's
+    metrics; the timings travel back with the result instead.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.ocr_seconds: List[float] = []
+
+
+def parse_pdf_range(data: Source, start: int, stop: int, ocr_dpi: int = 72) -> List[Tuple[int, str]]:
+    """Extract pages [start, stop) (0-based); results carry 1-based page numbers.
+
+    Each process-pool task reopens the document itself, from the spooled file
+    path ingestion passes (PyMuPDF maps it lazily), so shards share nothing.
+    """
+    results = PageList()
+    with _open_pdf(data) as doc:
+        for page_index in range(start, min(stop, doc.page_count)):
+            page = doc[page_index]
+            # Try text extraction first
+            text = page.get_text().strip()
+            if not text:
+                # fallback to OCR for that page
+                ocr_start = time.perf_counter()
+                pix = page.get_pixmap(dpi=ocr_dpi)
+                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+                text = pytesseract.image_to_string(img)
+                results.ocr_seconds.append(time.perf_counter() - ocr_start)
             results.append((page_index + 1, text))
     return results
 
 
-def parse_docx(data: bytes) -> List[Tuple[int, str]]:
-    f = io.BytesIO(data)
-    doc = DocxDocument(f)
+def page_ranges(page_count: int, pages_per_task: int) -> List[Tuple[int, int]]:
+    step = max(1, pages_per_task)
+    return [(start, min(start + step, page_count)) for start in range(0, page_count, step)]
+
+
+def parse_pdf(data: Source, ocr_dpi: int = 72) -> List[Tuple[int, str]]:
+    return parse_pdf_range(data, 0, pdf_page_count(data), ocr_dpi)
+
+
+def parse_docx(data: Source) -> List[Tuple[int, str]]:
+    doc = DocxDocument(data if isinstance(data, str) else io.BytesIO(data))
     paragraphs = []
     for p in doc.paragraphs:
         t = p.text.strip()
@@ -38,11 +79,18 @@ def parse_docx(data: bytes) -> List[Tuple[int, str]]:
     return [(1, joined)]
 
 
-def parse_txt(data: bytes) -> List[Tuple[int, str]]:
+def parse_txt(data: Source) -> List[Tuple[int, str]]:
+    if isinstance(data, str):
+        with open(data, "rb") as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    return [(1, str(m[:], "utf-8", errors="ignore"))]
+            except ValueError:  # empty file cannot be mapped
+                return [(1, "")]
     return [(1, data.decode(errors="ignore"))]
 
 
-def parse_file(content_type: str, data: bytes) -> List[Tuple[int, str]]:
+def parse_file(content_type: str, data: Source) -> List[Tuple[int, str]]:
     if content_type == "application/pdf":
         return parse_pdf(data)
     if content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
@@ -1,16 +1,18 @@
-import httpx
 import json
 import time
-from typing import List, Dict
+import httpx
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from app.core.config import get_settings
-from app.core import runtime_state
+from app.core import runtime_state, http_client, metrics
+from app.services import context
 from loguru import logger
 
 settings = get_settings()
 if settings.generation_model == "gemini-1.5-flash":  # backward compatibility auto-upgrade
     settings.generation_model = "gemini-flash-latest"
 
-GEMINI_GEN_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={key}"
+GEMINI_GEN_URL = "{base}/models/{model}:generateContent?key={key}"
+GEMINI_STREAM_URL = "{base}/models/{model}:streamGenerateContent?alt=sse&key={key}"
 
 PROMPT_TEMPLATE = """You are a domain-constrained QA assistant. Use ONLY the supplied context to answer. If the answer is not in context, reply with OUT_OF_SCOPE.
 Classify the answer type as one of: factual, contextual, analytical, descriptive, summarization, out_of_scope.
@@ -22,6 +24,210 @@ Context:
 """
 
 
+def _build_prompt(template: str, question: str, context_chunks: List[Dict], **fields) -> Tuple[str, List[Dict], Dict[str, int]]:
+    """Format `template` with the packed context; returns the prompt, its passages and packing stats."""
+    with metrics.timer(metrics.GENERATION_SECONDS, stage="prompt_build"):
+        passages, stats = context.pack(context_chunks)
+        prompt = template.format(question=question, context=context.render(passages), **fields)
+    stats["prompt_tokens"] = context.estimate_tokens(prompt)
+    metrics.PROMPT_TOKENS.observe(stats["prompt_tokens"])
+    return prompt, passages, stats
+
+
+def _model_candidates() -> List[str]:
+    # Try original, then prefixed models/<name>, then -latest variant
+    model_try = settings.generation_model
+    candidates = [model_try]
+    if not model_try.startswith("models/"):
+        candidates.append(f"models/{model_try}")
+    if not model_try.endswith("-latest"):
+        candidates.append(model_try + "-latest")
+    return candidates
+
+
+def _extractive_fallback(question: str, context_chunks: List[Dict], e: Exception, tried_models: List[str], start: float) -> Dict:
+    # Local fallback: extract the most common sentences mentioning question terms
+    q_terms = [t.lower() for t in question.split() if len(t) > 3][:8]
+    sentences: List[str] = []
+    for c in context_chunks:
+        for part in c['text'].split('.'):
+            s = part.strip()
+            if not s:
+                continue
+            if any(t in s.lower() for t in q_terms):
+                sentences.append(s)
+    unique: List[str] = []
+    for s in sentences:
+        if s not in unique:
+            unique.append(s)
+    answer_fallback = '. '.join(unique[:4]) or 'Relevant context found but model generation failed.'
+    metrics.GENERATION_REQUESTS.inc(mode="fallback")
+    return {
+        "answer": answer_fallback,
+        "answer_type": "contextual" if unique else "out_of_scope",
+        "sources": [f"page:{c['page']}" for c in context_chunks],
+        "latency_ms": int((time.time() - start) * 1000),
+        "retrieved": len(context_chunks),
+        "generation_mode": "fallback",
+        "fallback_reason": f"{e}"[:160],
+        "tried_models": tried_models,
+    }
+
+
+# Streaming asks for prose first and the classification last, so answer tokens
+# can be forwarded as they arrive and the metadata parsed once the stream ends.
+STREAM_META_MARKER = "###META"
+STREAM_PROMPT_TEMPLATE = """You are a domain-constrained QA assistant. Use ONLY the supplied context to answer. If the answer is not in context, reply with OUT_OF_SCOPE.
+Write the answer as plain text first. Then, on its own line, write {marker} followed by JSON with keys answer_type (one of: factual, contextual, analytical, descriptive, summarization, out_of_scope) and sources (list).
+
+Question: {question}
+Context:
+{context}
+"""
+ANSWER_TYPES = ("factual", "contextual", "analytical", "descriptive", "summarization", "out_of_scope")
+
+
+class _StreamSplitter:
+    """Separates streamed answer text from the trailing metadata block.
+
+    Text that could be the start of the marker is held back until the next
+    delta disambiguates it. A response that opens with "{" is the non-streaming
+    JSON format; it is buffered and parsed whole at the end.
+    """
+
+    def __init__(self):
+        self.answer = ""
+        self.meta = ""
+        self._pending = ""
+        self._in_meta = False
+        self.json_mode: Optional[bool] = None
+
+    def feed(self, text: str) -> str:
+        if self.json_mode is None:
+            head = (self._pending + text).lstrip()
+            if not head:
+                self._pending += text
+                return ""
+            self.json_mode = head.startswith("{")
+        if self.json_mode or self._in_meta:
+            self.meta += text
+            return ""
+        buf = self._pending + text
+        idx = buf.find(STREAM_META_MARKER)
+        if idx != -1:
+            self._in_meta = True
+            self.meta = buf[idx + len(STREAM_META_MARKER):]
+            out, self._pending = buf[:idx], ""
+        else:
+            # Hold back a suffix that is a prefix of the marker.
+            keep = 0
+            for n in range(min(len(buf), len(STREAM_META_MARKER) - 1), 0, -1):
+                if STREAM_META_MARKER.startswith(buf[-n:]):
+                    keep = n
+                    break
+            out, self._pending = buf[: len(buf) - keep], buf[len(buf) - keep:]
+        if not self.answer:
+            out = out.lstrip()
+        self.answer += out
+        return out
+
+    def finish(self) -> str:
+        out = "" if self.json_mode or self._in_meta else self._pending
+        self._pending = ""
+        self.answer += out
+        return out
+
+    def metadata(self) -> Dict:
+        text = self.meta
+        first, last = text.find("{"), text.rfind("}")
+        try:
+            return json.loads(text[first:last + 1]) if first != -1 else {}
+        except Exception:
+            return {}
+
+
+async def stream_answer(question: str, context_chunks: List[Dict]) -> AsyncIterator[Dict]:
+    """Stream an answer from `streamGenerateContent` (SSE).
+
+    Yields {"delta": text} events as tokens arrive and finally {"final": answer},
+    the same shape `generate_answer` returns. If no token arrives the extractive
+    fallback is returned instead; a stream cut off midway keeps what was received.
+    """
+    start = time.time()
+    prompt, passages, packing = _build_prompt(STREAM_PROMPT_TEMPLATE, question, context_chunks, marker=STREAM_META_MARKER)
+    runtime_key = runtime_state.get_gemini_key(settings.gemini_api_key)
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    tried_models: List[str] = []
+    error_obj: Optional[Exception] = None
+    splitter = _StreamSplitter()
+    received = False
+    for cand in _model_candidates():
+        url = GEMINI_STREAM_URL.format(base=settings.gemini_api_base.rstrip('/'), model=cand, key=runtime_key)
+        tried_models.append(cand)
+        try:
+            async with http_client.get_client().stream("POST", url, json=payload) as r:
+                if r.status_code == 404:
+                    logger.warning(f"Streaming 404 for model {cand}; trying next candidate if any")
+                    continue
+                if r.status_code >= 400:
+                    await r.aread()
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    parts = (((event.get("candidates") or [{}])[0].get("content") or {}).get("parts")) or []
+                    text = "".join(p.get("text", "") for p in parts)
+                    if not text:
+                        continue
+                    received = True
+                    delta = splitter.feed(text)
+                    if delta:
+                        yield {"delta": delta}
+            runtime_state.set_gemini_success()
+            error_obj = None
+            break
+        except Exception as e:
+            error_obj = e
+            runtime_state.set_gemini_failure(f"gen_error: {e}")
+            logger.warning(f"Streaming generation failed for {cand}: {e}")
+            if received:
+                break  # tokens already went out; do not restart with another model
+    if not received:
+        yield {"final": {**_extractive_fallback(question, context_chunks, error_obj or Exception("Empty generation stream"), tried_models, start),
+                         "context": packing}}
+        return
+    tail = splitter.finish()
+    if tail:
+        yield {"delta": tail}
+    if splitter.json_mode:
+        parsed = splitter.metadata() or {"answer": splitter.meta.strip()}
+        if parsed.get("answer"):
+            yield {"delta": str(parsed["answer"])}
+        answer = str(parsed.get("answer", ""))
+    else:
+        parsed = splitter.metadata()
+        answer = splitter.answer.strip()
+    answer_type = parsed.get("answer_type")
+    if answer_type not in ANSWER_TYPES:
+        answer_type = "out_of_scope" if "OUT_OF_SCOPE" in answer else "contextual"
+    sources = parsed.get("sources")
+    mode = "gemini" if error_obj is None else "gemini-partial"
+    metrics.GENERATION_REQUESTS.inc(mode=mode)
+    metrics.GENERATION_SECONDS.observe(time.time() - start, stage="stream")
+    yield {"final": {
+        "answer": answer,
+        "answer_type": answer_type,
+        "sources": [str(x) for x in sources] if isinstance(sources, list) else [f"page:{p['page']}" for p in passages],
+        "latency_ms": int((time.time() - start) * 1000),
+        "retrieved": len(context_chunks),
+        "context": packing,
+        "generation_mode": mode,
+        "model_used": tried_models[-1],
+        "fallback_reason": None if error_obj is None else f"stream_interrupted: {error_obj}"[:160],
+    }}
+
+
 async def generate_answer(question: str, context_chunks: List[Dict]):
     start = time.time()
     if not context_chunks:
@@ -34,26 +240,18 @@ async def generate_answer(question: str, context_chunks: List[Dict]):
             "generation_mode": "none",
             "fallback_reason": "no_context",
         }
-    context_text = "\n---\n".join([f"[p{c['page']}] {c['text'][:800]}" for c in context_chunks])
-    prompt = PROMPT_TEMPLATE.format(question=question, context=context_text)
+    prompt, passages, packing = _build_prompt(PROMPT_TEMPLATE, question, context_chunks)
     runtime_key = runtime_state.get_gemini_key(settings.gemini_api_key)
-    model_try = settings.generation_model
     tried_models = []
     data = None
     error_obj = None
-    # Try original, then prefixed models/<name>, then -latest variant
-    candidates = [model_try]
-    if not model_try.startswith("models/"):
-        candidates.append(f"models/{model_try}")
-    if not model_try.endswith("-latest"):
-        candidates.append(model_try + "-latest")
-    for cand in candidates:
-        url = GEMINI_GEN_URL.format(model=cand, key=runtime_key)
-        tried_models.append(cand)
-        try:
-            async with httpx.AsyncClient(timeout=120) as client:
+    with metrics.timer(metrics.GENERATION_SECONDS, stage="generate"):
+        for cand in _model_candidates():
+            url = GEMINI_GEN_URL.format(base=settings.gemini_api_base.rstrip('/'), model=cand, key=runtime_key)
+            tried_models.append(cand)
+            try:
                 payload = {"contents": [{"parts": [{"text": prompt}]}]}
-                r = await client.post(url, json=payload)
+                r = await http_client.get_client().post(url, json=payload)
                 if r.status_code == 404:
                     logger.warning(f"Generation 404 for model {cand}; trying next candidate if any")
                     continue
@@ -61,38 +259,14 @@ async def generate_answer(question: str, context_chunks: List[Dict]):
                 data = r.json()
                 runtime_state.set_gemini_success()
                 break
-        except Exception as e:  # store and keep trying
-            error_obj = e
-            runtime_state.set_gemini_failure(f"gen_error: {e}")
-            logger.warning(f"Generation attempt failed for {cand}: {e}")
-            continue
+            except Exception as e:  # store and keep trying
+                error_obj = e
+                runtime_state.set_gemini_failure(f"gen_error: {e}")
+                logger.warning(f"Generation attempt failed for {cand}: {e}")
+                continue
     if data is None:
-        e = error_obj or Exception("All generation attempts failed")
-        # Local fallback: extract the most common sentences mentioning question terms
-        q_terms = [t.lower() for t in question.split() if len(t) > 3][:8]
-        sentences: List[str] = []
-        for c in context_chunks:
-            for part in c['text'].split('.'):
-                s = part.strip()
-                if not s:
-                    continue
-                if any(t in s.lower() for t in q_terms):
-                    sentences.append(s)
-        unique: List[str] = []
-        for s in sentences:
-            if s not in unique:
-                unique.append(s)
-        answer_fallback = '. '.join(unique[:4]) or 'Relevant context found but model generation failed.'
-        return {
-            "answer": answer_fallback,
-            "answer_type": "contextual" if unique else "out_of_scope",
-            "sources": [f"page:{c['page']}" for c in context_chunks],
-            "latency_ms": int((time.time() - start) * 1000),
-            "retrieved": len(context_chunks),
-            "generation_mode": "fallback",
-            "fallback_reason": f"{e}"[:160],
-            "tried_models": tried_models,
-        }
+        return {**_extractive_fallback(question, context_chunks, error_obj or Exception("All generation attempts failed"), tried_models, start),
+                "context": packing}
     # Attempt to parse JSON from model output
     try:
         text = data["candidates"][0]["content"]["parts"][0]["text"]  # type: ignore
@@ -105,40 +279,33 @@ async def generate_answer(question: str, context_chunks: List[Dict]):
             parsed = {"answer": text.strip(), "answer_type": "factual", "sources": []}
     except Exception:
         parsed = {"answer": "Unable to parse model response.", "answer_type": "out_of_scope", "sources": []}
-    parsed.setdefault("sources", [f"page:{c['page']}" for c in context_chunks])
+    parsed.setdefault("sources", [f"page:{p['page']}" for p in passages])
+    usage = data.get("usageMetadata") or {}
+    if usage.get("promptTokenCount"):
+        packing["model_prompt_tokens"] = int(usage["promptTokenCount"])
+    parsed["context"] = packing
     parsed["latency_ms"] = int((time.time() - start) * 1000)
     parsed["retrieved"] = len(context_chunks)
     parsed["generation_mode"] = "gemini"
+    metrics.GENERATION_REQUESTS.inc(mode="gemini")
     parsed.setdefault("model_used", tried_models[-1] if tried_models else settings.generation_model)
     parsed.setdefault("fallback_reason", None)
     return parsed
 
-SUMMARY_PROMPT = """You are a summarization assistant. Produce a concise, comprehensive summary of the document content below. Return JSON with keys: answer (the summary), answer_type='summarization', sources (list of page numbers referenced).\n\nContent:\n{content}\n"""
+async def complete(prompt: str, stage: str, timeout: float | None = None) -> Tuple[str, Dict[str, int]]:
+    """One generateContent call with the configured model; returns the text and its token usage.
 
-
-async def summarize(content: str):
+    `timeout` (seconds) overrides the shared client's timeouts; None keeps them.
+    Raises on any HTTP or response-shape error (callers decide on fallbacks).
+    """
     runtime_key = runtime_state.get_gemini_key(settings.gemini_api_key)
-    url = GEMINI_GEN_URL.format(model=settings.generation_model, key=runtime_key)
-    prompt = SUMMARY_PROMPT.format(content=content[:60000])
-    try:
-        async with httpx.AsyncClient(timeout=180) as client:
-            r = await client.post(url, json={"contents": [{"parts": [{"text": prompt}]}]})
-            r.raise_for_status()
-            data = r.json()
-    except Exception as e:
-        logger.warning(f"Summarization failed: {e}")
-        return {"answer": "Summarization unavailable (model error).", "answer_type": "summarization", "sources": []}
-    try:
-        text = data["candidates"][0]["content"]["parts"][0]["text"]  # type: ignore
-        first = text.find('{')
-        last = text.rfind('}')
-        if first != -1:
-            js = text[first:last+1]
-            j = json.loads(js)
-        else:
-            j = {"answer": text.strip()}
-    except Exception:
-        j = {"answer": "Summarization failed."}
-    j.setdefault("answer_type", "summarization")
-    j.setdefault("sources", [])
-    return j
+    url = GEMINI_GEN_URL.format(base=settings.gemini_api_base.rstrip('/'), model=settings.generation_model, key=runtime_key)
+    with metrics.timer(metrics.GENERATION_SECONDS, stage=stage):
+        r = await http_client.get_client().post(url, json={"contents": [{"parts": [{"text": prompt}]}]},
+                                                 timeout=httpx.USE_CLIENT_DEFAULT if timeout is None else timeout)
+        r.raise_for_status()
+        data = r.json()
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    meta = data.get("usageMetadata") or {}
+    usage = {"prompt_tokens": int(meta.get("promptTokenCount", 0)), "output_tokens": int(meta.get("candidatesTokenCount", 0))}
+    return text, usage
@@ -1,153 +1,295 @@
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient
 from qdrant_client.http import models as qmodels
 from app.core.config import get_settings
+from app.core import metrics
 from .embeddings import embed_texts
-from typing import List, Dict, Optional
+from . import answer_cache, fusion, tenants
+from .vector_index import QUANTIZATIONS, VectorIndex
+from .lexical import LexicalIndex
+from typing import Iterable, List, Dict, Optional, Set
 from loguru import logger
-import math, re, collections
+import asyncio
+import hashlib
+import uuid
 
 settings = get_settings()
 
-client = QdrantClient(url=settings.qdrant_url)
+client = AsyncQdrantClient(url=settings.qdrant_url)
+# Collections known to exist (with payload indexes) so searches skip get_collections.
+_collections_ready: set = set()
 
 # In-memory fallback store (vector)
-_MEM_INDEX: List[Dict] = []  # {vector, text, page, document_id}
+_MEM_INDEX = VectorIndex(
+    settings.vector_quantization if settings.vector_quantization in QUANTIZATIONS else "none",
+    settings.vector_rescore_factor, settings.vector_spill_dir,
+    settings.vector_ann_min_rows, settings.vector_ann_lists, settings.vector_ann_probes,
+)
 
-# Simple lexical index for keyword scoring
-_LEX_CHUNKS: List[Dict] = []  # parallel list of chunk dicts
-_LEX_TERM_FREQS: List[Dict[str, int]] = []
-_LEX_DOC_FREQ: Dict[str, int] = collections.defaultdict(int)
-_LEX_TOTAL: int = 0
-_WORD_RE = re.compile(r"[A-Za-z0-9_]{2,}")
+# Inverted BM25 index for keyword scoring
+_LEX_INDEX = LexicalIndex()
 
 
-def _tokenize(text: str):
-    return _WORD_RE.findall((text or "").lower())[:5000]
+# Fixed namespace so chunk ids are stable across processes and restarts.
+_CHUNK_NAMESPACE = uuid.UUID("5d0c6f1e-3b8a-4f52-9a51-2f6d8c1e7a40")
+# Chunk fields that can change without the text changing (kept in sync via payload updates).
+CHUNK_META = ("page", "page_start", "page_end", "position", "char_start", "char_end")
 
 
-def _lex_add(chunks: List[Dict]):
-    global _LEX_TOTAL
+def chunk_id(document_id: int, text: str, occurrence: int = 0) -> str:
+    """Deterministic Qdrant point id for a chunk.
+
+    Derived from the document and the chunk's content hash (plus an occurrence
+    counter for repeated identical chunks) rather than its position, so an edit
+    that shifts later chunks does not change their ids.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(_CHUNK_NAMESPACE, f"{document_id}:{digest}:{occurrence}"))
+
+
+def assign_chunk_ids(chunks: List[Dict]) -> List[Dict]:
+    seen: Dict[tuple, int] = {}
     for ch in chunks:
-        tokens = _tokenize(ch.get("text", ""))
-        if not tokens:
-            continue
-        tf: Dict[str, int] = collections.defaultdict(int)
-        for t in tokens:
-            tf[t] += 1
-        _LEX_CHUNKS.append(ch)
-        _LEX_TERM_FREQS.append(tf)
-        for term in set(tf.keys()):
-            _LEX_DOC_FREQ[term] += 1
-        _LEX_TOTAL += 1
+        key = (ch.get("document_id") or 0, ch["text"])
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ch["chunk_id"] = chunk_id(key[0], ch["text"], occurrence)
+    return chunks
+
+
+def _batches(items: List, size: int) -> Iterable[List]:
+    size = max(1, size)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
 
 
 def _lex_search(query: str, top_k: int, document_ids: Optional[List[int]]):
-    if not _LEX_CHUNKS or not query.strip():
-        return []
-    q_tokens = _tokenize(query)
-    if not q_tokens:
-        return []
-    q_set = set(q_tokens)
-    scored: List[tuple[float, int]] = []
-    for idx, (chunk, tf) in enumerate(zip(_LEX_CHUNKS, _LEX_TERM_FREQS)):
-        if document_ids and chunk.get("document_id") not in document_ids:
-            continue
-        score = 0.0
-        for term in q_set:
-            if term in tf:
-                df = _LEX_DOC_FREQ.get(term, 1)
-                idf = math.log((1 + _LEX_TOTAL) / (1 + df)) + 1
-                score += tf[term] * idf
-        if score > 0:
-            scored.append((score, idx))
-    scored.sort(key=lambda x: x[0], reverse=True)
-    out: List[Dict] = []
-    for sc, idx in scored[:top_k]:
-        ch = _LEX_CHUNKS[idx]
-        out.append({
-            "score": sc,
-            "text": ch.get("text"),
-            "page": ch.get("page", 0),
-            "document_id": ch.get("document_id"),
-            "mode": "keyword"
-        })
-    return out
+    return _LEX_INDEX.search(query, top_k, document_ids)
+
+
+def _local_scope(document_ids: Optional[List[int]], owner_id: Optional[str]) -> Optional[List[int]]:
+    """Document filter for the in-process indexes; [] when the owner has none of them."""
+    if not settings.multi_tenant:
+        return document_ids
+    if not document_ids and tenants.owners and len(tenants.owners.documents(owner_id)) == len(tenants.owners):
+        return None  # the owner has every indexed document; filtering would only cost time
+    return tenants.owners.scope(owner_id, document_ids)
+
+
+def _search_filter(document_ids: Optional[List[int]], owner_id: Optional[str]) -> Optional[qmodels.Filter]:
+    must: List = []
+    if document_ids:
+        must.append(qmodels.FieldCondition(key="document_id", match=qmodels.MatchAny(any=document_ids)))
+    # Per-owner collections hold nothing else; the shared one is filtered on the indexed owner_id.
+    if settings.multi_tenant and tenants.layout() == "payload":
+        if owner_id:
+            must.append(qmodels.FieldCondition(key="owner_id", match=qmodels.MatchValue(value=owner_id)))
+        else:
+            must.append(qmodels.IsEmptyCondition(is_empty=qmodels.PayloadField(key="owner_id")))
+    return qmodels.Filter(must=must) if must else None
+
+
+async def _ensure_payload_indexes(collection: str):
+    # Without them Qdrant evaluates document/owner filters point by point while walking the graph.
+    fields = [("document_id", qmodels.PayloadSchemaType.INTEGER)]
+    if settings.multi_tenant and tenants.layout() == "payload":
+        fields.append(("owner_id", qmodels.PayloadSchemaType.KEYWORD))
+    for field, schema in fields:
+        try:
+            await client.create_payload_index(collection_name=collection, field_name=field, field_schema=schema)
+        except Exception as e:  # pragma: no cover
+            logger.warning(f"Payload index {collection}.{field} not created: {e}")
+
+
+def _quantization_config():
+    if settings.vector_quantization == "int8":
+        return qmodels.ScalarQuantization(scalar=qmodels.ScalarQuantizationConfig(type=qmodels.ScalarType.INT8, quantile=0.99, always_ram=True))
+    if settings.vector_quantization == "binary":
+        return qmodels.BinaryQuantization(binary=qmodels.BinaryQuantizationConfig(always_ram=True))
+    return None
 
 
-def ensure_collection(vector_size: int | None = None):
+def _search_params() -> Optional[qmodels.SearchParams]:
+    if _quantization_config() is None:
+        return None
+    return qmodels.SearchParams(quantization=qmodels.QuantizationSearchParams(
+        rescore=True, oversampling=float(max(1, settings.vector_rescore_factor)),
+    ))
+
+
+async def _ensure_quantization(collection: str):
+    """Turn on the configured quantization for a collection created without it (Qdrant rebuilds it in the background)."""
+    quantization = _quantization_config()
+    if quantization is None:
+        return
+    try:
+        info = await client.get_collection(collection)
+        if info.config.quantization_config is None:
+            await client.update_collection(collection_name=collection, quantization_config=quantization)
+            logger.info(f"Enabled {settings.vector_quantization} quantization on {collection}")
+    except Exception as e:  # pragma: no cover
+        logger.warning(f"Quantization not enabled on {collection}: {e}")
+
+
+async def ensure_collection(vector_size: int | None = None, collection: str | None = None):
+    collection = collection or settings.qdrant_collection
+    if collection in _collections_ready:
+        return
     try:
-        existing = {c.name: c for c in client.get_collections().collections}
+        existing = {c.name: c for c in (await client.get_collections()).collections}
     except Exception:
         # Qdrant not available yet
         return
-    if settings.qdrant_collection in existing:
-        return
-    if vector_size is None:
-        # Defer creation until we know vector size (first add_documents or search call)
-        logger.debug("Deferring collection creation until vector size known")
-        return
-    client.recreate_collection(
-        collection_name=settings.qdrant_collection,
-        vectors_config=qmodels.VectorParams(size=vector_size, distance=qmodels.Distance.COSINE),
-    )
+    if collection not in existing:
+        if vector_size is None:
+            # Defer creation until we know vector size (first add_documents or search call)
+            logger.debug("Deferring collection creation until vector size known")
+            return
+        hnsw = None
+        if settings.multi_tenant and tenants.layout() == "payload":
+            # Extra graph links per indexed owner_id value, so a tenant's filtered search stays a graph walk.
+            hnsw = qmodels.HnswConfigDiff(payload_m=16)
+        quantization = _quantization_config()
+        await client.recreate_collection(
+            collection_name=collection,
+            # Quantized collections keep the codes in RAM and the originals (read only to rescore) on disk.
+            vectors_config=qmodels.VectorParams(size=vector_size, distance=qmodels.Distance.COSINE, on_disk=True if quantization is not None else None),
+            hnsw_config=hnsw,
+            quantization_config=quantization,
+        )
+    else:
+        await _ensure_quantization(collection)
+    # Creating an index that exists is a no-op, so collections from older versions get them too.
+    await _ensure_payload_indexes(collection)
+    _collections_ready.add(collection)
+
+
+def reset_collection_state():
+    """Forget the cached collection checks (after a collection is dropped or a call fails)."""
+    _collections_ready.clear()
+
 
+def _by_collection(chunks: List[Dict]) -> Dict[str, List[int]]:
+    groups: Dict[str, List[int]] = {}
+    for i, ch in enumerate(chunks):
+        groups.setdefault(tenants.collection_for(ch.get("owner_id")), []).append(i)
+    return groups
 
-async def add_documents(chunks: List[Dict]):
+
+async def add_documents(chunks: List[Dict]) -> Set[str]:
+    """Embed and index chunks, upserting by chunk id (re-adding a chunk replaces it).
+
+    Callers ingesting a document in slices assign ids over the whole document
+    first (`assign_chunk_ids`) so repeated chunks get distinct occurrences.
+    Returns the ids of the chunks whose Qdrant points were not written (the
+    local indexes have them either way), so the caller can re-add them later.
+    """
     if not chunks:
-        return
+        return set()
+    if any(not ch.get("chunk_id") for ch in chunks):
+        assign_chunk_ids(chunks)
     texts = [c["text"] for c in chunks]
     vectors = await embed_texts(texts)
-    embed_mode = getattr(vectors, "_embed_mode", "unknown")
     if not vectors:
         logger.warning("No vectors returned for chunks; skipping add_documents")
-        return
-    # Ensure collection with actual size
-    ensure_collection(len(vectors[0]))
-    points = []
-    for idx, (chunk, vec) in enumerate(zip(chunks, vectors)):
-        # Qdrant PointStruct requires an id (int or UUID). Use a simple incremental integer.
-        points.append(qmodels.PointStruct(id=idx, vector=vec, payload={**chunk}))
-        _MEM_INDEX.append({
-            "vector": vec,
-            "text": chunk.get("text"),
-            "page": chunk.get("page", 0),
-            "document_id": chunk.get("document_id"),
-            "_embed_mode": embed_mode
-        })
+        return {c["chunk_id"] for c in chunks}
+    points = [
+        qmodels.PointStruct(id=chunk["chunk_id"], vector=vec, payload={**chunk})
+        for chunk, vec in zip(chunks, vectors)
+    ]
+    _MEM_INDEX.add(vectors, chunks)
+    tenants.owners.update((c.get("document_id"), c.get("owner_id")) for c in chunks)
+    unwritten: Set[str] = set()
     try:
-        client.upsert(collection_name=settings.qdrant_collection, points=points)
+        with metrics.timer(metrics.QDRANT_SECONDS, op="upsert"):
+            for collection, rows in _by_collection(chunks).items():
+                # Ensure collection with actual size
+                await ensure_collection(len(vectors[0]), collection)
+                for batch in _batches([points[i] for i in rows], settings.qdrant_upsert_batch_size):
+                    await client.upsert(collection_name=collection, points=batch)
     except Exception:
+        metrics.QDRANT_ERRORS.inc(op="upsert")
+        reset_collection_state()
         logger.warning("Vector upsert skipped (Qdrant unreachable)")
+        unwritten = {c["chunk_id"] for c in chunks}
     # lexical index update
     try:
-        _lex_add(chunks)
+        _LEX_INDEX.add(chunks)
     except Exception:  # pragma: no cover
         pass
+    answer_cache.invalidate_documents({c.get("document_id") for c in chunks if c.get("document_id") is not None})
+    return unwritten
 
 
-async def search(query: str, top_k: int | None = None, document_ids: Optional[List[int]] = None, hybrid_weight: float = 0.4):
-    top_k = top_k or settings.top_k
-    qvecs = await embed_texts([query])
-    qvec = qvecs[0]
-    query_embed_mode = getattr(qvecs, "_embed_mode", "unknown")
-    ensure_collection(len(qvec))
-    search_filter = None
-    if document_ids:
-        try:
-            search_filter = qmodels.Filter(
-                must=[qmodels.FieldCondition(key="document_id", match=qmodels.MatchAny(any=document_ids))]
-            )
-        except Exception:  # pragma: no cover
-            search_filter = None
+async def update_chunk_metadata(chunks: List[Dict]) -> Set[str]:
+    """Rewrite page/offset payload fields of already-indexed chunks (no re-embedding).
+
+    Returns the ids of the chunks whose Qdrant payload was not updated.
+    """
+    if not chunks:
+        return set()
+    _MEM_INDEX.update_pages({ch["chunk_id"]: ch.get("page", 0) or 0 for ch in chunks})
+    _LEX_INDEX.update_pages({ch["chunk_id"]: ch.get("page", 0) or 0 for ch in chunks})
+    answer_cache.invalidate_documents({ch.get("document_id") for ch in chunks if ch.get("document_id") is not None})
+    ops = [
+        qmodels.SetPayloadOperation(set_payload=qmodels.SetPayload(
+            payload={k: ch.get(k) for k in CHUNK_META}, points=[ch["chunk_id"]],
+        ))
+        for ch in chunks
+    ]
     try:
-        res = client.search(
-            collection_name=settings.qdrant_collection,
-            query_vector=qvec,
-            limit=top_k,
-            query_filter=search_filter,
-        )
+        with metrics.timer(metrics.QDRANT_SECONDS, op="set_payload"):
+            for collection, rows in _by_collection(chunks).items():
+                for batch in _batches([ops[i] for i in rows], settings.qdrant_upsert_batch_size):
+                    await client.batch_update_points(collection_name=collection, update_operations=batch)
     except Exception:
-        return _memory_only_search(qvec, top_k, document_ids)
+        metrics.QDRANT_ERRORS.inc(op="set_payload")
+        reset_collection_state()
+        logger.warning("Payload update skipped (Qdrant unreachable)")
+        return {ch["chunk_id"] for ch in chunks}
+    return set()
+
+
+async def delete_chunks(chunk_ids: List[str], document_id: Optional[int] = None, owner_id: Optional[str] = None):
+    if not chunk_ids:
+        return
+    _MEM_INDEX.delete_chunks(chunk_ids)
+    _LEX_INDEX.delete_chunks(chunk_ids)
+    answer_cache.invalidate_documents([document_id] if document_id is not None else [])
+    try:
+        with metrics.timer(metrics.QDRANT_SECONDS, op="delete"):
+            for batch in _batches(chunk_ids, settings.qdrant_upsert_batch_size):
+                await client.delete(collection_name=tenants.collection_for(owner_id), points_selector=qmodels.PointIdsList(points=batch))
+    except Exception:
+        metrics.QDRANT_ERRORS.inc(op="delete")
+        reset_collection_state()
+        logger.warning("Point delete skipped (Qdrant unreachable)")
+
+
+async def _vector_search(qvec: List[float], top_k: int, document_ids: Optional[List[int]], embed_mode: str,
+                         owner_id: Optional[str] = None) -> List[Dict]:
+    with metrics.timer(metrics.RETRIEVAL_SECONDS, stage="vector"):
+        return await _qdrant_search(qvec, top_k, document_ids, embed_mode, owner_id)
+
+
+async def _qdrant_search(qvec: List[float], top_k: int, document_ids: Optional[List[int]], embed_mode: str,
+                         owner_id: Optional[str] = None) -> List[Dict]:
+    collection = tenants.collection_for(owner_id)
+    await ensure_collection(len(qvec), collection)
+    try:
+        with metrics.timer(metrics.QDRANT_SECONDS, op="search"):
+            res = await client.search(
+                collection_name=collection,
+                query_vector=qvec,
+                limit=top_k,
+                query_filter=_search_filter(document_ids, owner_id),
+                search_params=_search_params(),
+            )
+    except Exception as e:
+        if collection != settings.qdrant_collection and "not found" in str(e).lower():
+            return []  # the owner has not indexed anything yet
+        metrics.QDRANT_ERRORS.inc(op="search")
+        reset_collection_state()
+        return _memory_only_search(qvec, top_k, document_ids, owner_id)
     vector_results = []
     for r in res:
         payload = r.payload or {}
@@ -156,71 +298,75 @@ async def search(query: str, top_k: int | None = None, document_ids: Optional[Li
             "text": payload.get("text"),
             "page": payload.get("page", 0),
             "document_id": payload.get("document_id"),
+            "chunk_id": payload.get("chunk_id") or str(r.id),
             "mode": "vector",
-            "_embed_mode": query_embed_mode
+            "_embed_mode": embed_mode
         })
-    # Keyword layer (internal)
-    keyword_results = _lex_search(query, top_k, document_ids)
-    def normalize(items):
-        if not items:
-            return
-        scs = [i["score"] for i in items]
-        mn, mx = min(scs), max(scs)
-        rng = (mx - mn) or 1.0
-        for i in items:
-            i["norm"] = (i["score"] - mn) / rng
-    normalize(vector_results)
-    normalize(keyword_results)
-    merged: Dict[tuple, Dict] = {}
-    for it in vector_results:
-        merged[(it["text"], it.get("document_id"))] = it
-    for it in keyword_results:
-        key = (it["text"], it.get("document_id"))
-        if key in merged:
-            existing = merged[key]
-            existing["hybrid_score"] = (1 - hybrid_weight) * existing.get("norm", 0) + hybrid_weight * it.get("norm", 0)
-        else:
-            it["norm"] = it.get("norm", 0)
-            it["hybrid_score"] = hybrid_weight * it.get("norm", 0)
-            merged[key] = it
-    final = list(merged.values())
-    for f in final:
-        if "hybrid_score" not in f:
-            f["hybrid_score"] = f.get("norm", 0)
-    final.sort(key=lambda x: x["hybrid_score"], reverse=True)
-    return final[:top_k]
-
-def delete_document_vectors(document_id: int):
-    try:
-        client.delete(
-            collection_name=settings.qdrant_collection,
-            points_selector=qmodels.FilterSelector(
-                filter=qmodels.Filter(must=[qmodels.FieldCondition(key="document_id", match=qmodels.MatchValue(value=document_id))])
-            ),
+    return vector_results
+
+
+async def _keyword_search(query: str, top_k: int, document_ids: Optional[List[int]], owner_id: Optional[str] = None) -> List[Dict]:
+    # Runs on the event loop while the Qdrant request is in flight; the index is
+    # mutated from the loop too, so it must not be searched from another thread.
+    with metrics.timer(metrics.RETRIEVAL_SECONDS, stage="lexical"):
+        scope = _local_scope(document_ids, owner_id)
+        if settings.multi_tenant and scope == []:
+            return []
+        return _lex_search(query, top_k, scope)
+
+
+async def search(query: str, top_k: int | None = None, document_ids: Optional[List[int]] = None,
+                 hybrid_weight: Optional[float] = None, query_vectors: Optional[List[List[float]]] = None,
+                 fusion_strategy: Optional[str] = None, owner_id: Optional[str] = None):
+    """Hybrid search; `query_vectors` is `embed_texts([query])` when the caller already has it.
+
+    Both retrievers fetch `top_k * fusion_overfetch` candidates concurrently;
+    the union is ranked by `fusion.fuse` (strategy and keyword weight default
+    to the settings). With `multi_tenant` only `owner_id`'s documents are
+    searched (unowned ones when it is None).
+    """
+    top_k = top_k or settings.top_k
+    fetch_k = top_k * max(1, settings.fusion_overfetch)
+    qvecs = query_vectors if query_vectors is not None else await embed_texts([query])
+    query_embed_mode = getattr(qvecs, "_embed_mode", "unknown")
+    vector_results, keyword_results = await asyncio.gather(
+        _vector_search(qvecs[0], fetch_k, document_ids, query_embed_mode, owner_id),
+        _keyword_search(query, fetch_k, document_ids, owner_id),
+    )
+    with metrics.timer(metrics.RETRIEVAL_SECONDS, stage="fusion"):
+        return fusion.fuse(
+            vector_results,
+            keyword_results,
+            top_k,
+            strategy=fusion.parse_strategy(fusion_strategy, settings.fusion_strategy),
+            hybrid_weight=settings.hybrid_weight if hybrid_weight is None else hybrid_weight,
+            rrf_k=settings.fusion_rrf_k,
         )
+
+async def delete_document_vectors(document_id: int, owner_id: Optional[str] = None):
+    try:
+        with metrics.timer(metrics.QDRANT_SECONDS, op="delete"):
+            await client.delete(
+                collection_name=tenants.collection_for(owner_id),
+                points_selector=qmodels.FilterSelector(
+                    filter=qmodels.Filter(must=[qmodels.FieldCondition(key="document_id", match=qmodels.MatchValue(value=document_id))])
+                ),
+            )
     except Exception:
+        metrics.QDRANT_ERRORS.inc(op="delete")
+        reset_collection_state()
         logger.warning(f"Failed to delete vectors for document {document_id} (Qdrant unreachable)")
-    global _MEM_INDEX
-    _MEM_INDEX = [c for c in _MEM_INDEX if c.get("document_id") != document_id]
+    _MEM_INDEX.delete_document(document_id)
+    _LEX_INDEX.delete_document(document_id)
+    tenants.owners.forget(document_id)
+    answer_cache.invalidate_documents([document_id])
 
 
-def _memory_only_search(qvec: List[float], top_k: int, document_ids: Optional[List[int]]):
-    if not _MEM_INDEX:
+def _memory_only_search(qvec: List[float], top_k: int, document_ids: Optional[List[int]], owner_id: Optional[str] = None):
+    scope = _local_scope(document_ids, owner_id)
+    if settings.multi_tenant and scope == []:
         return []
-    def cosine(a, b):
-        return sum(x*y for x,y in zip(a,b)) / ((math.sqrt(sum(x*x for x in a)) or 1.0) * (math.sqrt(sum(y*y for y in b)) or 1.0))
-    candidates = _MEM_INDEX
-    if document_ids:
-        candidates = [c for c in candidates if c.get("document_id") in document_ids]
-    scored = []
-    for c in candidates:
-        scored.append({
-            "score": cosine(qvec, c["vector"]),
-            "text": c["text"],
-            "page": c["page"],
-            "document_id": c.get("document_id"),
-            "mode": "vector-fallback",
-            "hybrid_score": 0.0
-        })
-    scored.sort(key=lambda x: x["score"], reverse=True)
-    return scored[:top_k]
+    scored = _MEM_INDEX.search(qvec, top_k, scope)
+    for s in scored:
+        s["mode"] = "vector-fallback"
+    return scored
@@ -1,6 +1,8 @@
 from minio import Minio
 from app.core.config import get_settings
-from typing import BinaryIO
+from typing import BinaryIO, Optional
+import os
+import tempfile
 import uuid
 
 settings = get_settings()
@@ -19,7 +21,7 @@ def ensure_bucket():
 
 def store_file(file_obj: BinaryIO, filename: str) -> str:
     ensure_bucket()
-    object_name = f"{uuid.uuid4()}_{filename}"
+    object_name = object_name_for(filename)
     file_obj.seek(0, 2)
     size = file_obj.tell()
     file_obj.seek(0)
@@ -27,5 +29,48 @@ def store_file(file_obj: BinaryIO, filename: str) -> str:
     return object_name
 
 
+def object_name_for(filename: str) -> str:
+    return f"{uuid.uuid4()}_{filename}"
+
+
+def put_stream(stream: BinaryIO, object_name: str, content_type: str, client: Optional[Minio] = None) -> str:
+    """Upload a stream of unknown length as a multipart upload.
+
+    MinIO reads `upload_part_size_mb` at a time from `stream`, so memory stays
+    at a few parts regardless of the file size. A failed read aborts the
+    multipart upload.
+    """
+    client = client or _client
+    if client is _client:
+        ensure_bucket()
+    part_size = max(5, settings.upload_part_size_mb) * 1024 * 1024  # S3 minimum part size is 5 MiB
+    client.put_object(
+        settings.minio_bucket, object_name, stream, length=-1,
+        part_size=part_size, content_type=content_type or "application/octet-stream",
+        num_parallel_uploads=1,
+    )
+    return object_name
+
+
+def download_to_tempfile(object_name: str, chunk_size: int = 1024 * 1024) -> str:
+    """Stream an object into a temp file and return its path; the caller deletes it."""
+    suffix = os.path.splitext(object_name)[1]
+    fd, path = tempfile.mkstemp(prefix="ingest-", suffix=suffix, dir=settings.ingest_tmp_dir)
+    response = None
+    try:
+        with os.fdopen(fd, "wb") as f:
+            response = _client.get_object(settings.minio_bucket, object_name)
+            for chunk in response.stream(chunk_size):
+                f.write(chunk)
+    except BaseException:
+        os.unlink(path)
+        raise
+    finally:
+        if response is not None:
+            response.close()
+            response.release_conn()
+    return path
+
+
 def get_presigned(object_name: str, expires=3600) -> str:
     return _client.presigned_get_object(settings.minio_bucket, object_name, expires=expires)
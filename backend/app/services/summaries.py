@@ -0,0 +1,227 @@
+"""Map-reduce document summaries with cached section summaries.
+
+A document's chunks (in order, overlaps trimmed) are cut into sections at
+content-defined boundaries: after a chunk whose text hash hits a fixed
+modulus once the section holds at least half of `summary_section_chars`.
+Boundaries depend only on nearby text, so an edit moves at most the sections
+around it. Sections are summarized concurrently (map), then the summaries are
+merged `summary_reduce_fanin` at a time, level by level, until a final merge
+writes the JSON answer (reduce). At most `summary_max_concurrency` model calls
+are in flight.
+
+Every node is stored in `section_summaries` under a hash of its input (model,
+prompt version and text, or the keys of its children), so a repeat call makes
+no model call and a re-summary after a small edit recomputes only the touched
+sections and the reduce path above them. Nodes no longer in the tree are
+deleted after each run.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import time
+from loguru import logger
+from sqlalchemy import delete, select
+from app.core.config import get_settings
+from app.db.session import SessionLocal
+from app.db import models
+from app.services import rag
+
+settings = get_settings()
+
+# Bump when the prompts change so cached summaries are not reused.
+PROMPT_VERSION = "1"
+# Long sections and merges take longer than the shared client's default read timeout.
+SUMMARY_TIMEOUT_S = 180
+
+MAP_PROMPT = """Summarize this section of a document (pages {pages}) in a few sentences. Keep names, figures, dates and conclusions. Reply with the summary text only.
+
+Section:
+{content}
+"""
+
+REDUCE_PROMPT = """Merge these consecutive section summaries of one document into a single summary that keeps the key facts and their page ranges. Reply with the summary text only.
+
+{content}
+"""
+
+FINAL_PROMPT = """You are a summarization assistant. Below are summaries of consecutive parts of one document, labelled with their pages. Produce a concise, comprehensive summary of the whole document. Return JSON with keys: answer (the summary), answer_type='summarization', sources (list of page numbers referenced).
+
+{content}
+"""
+
+
+class SummaryUnavailable(Exception):
+    """The document has no chunks to summarize."""
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _pages(first: int, last: int) -> str:
+    return str(first) if first == last else f"{first}-{last}"
+
+
+def split_sections(chunks: List[Dict], section_chars: int, chunk_chars: int) -> List[Dict]:
+    """Group ordered chunks into sections of about `section_chars` characters.
+
+    Returns [{"text", "first_page", "last_page"}]; each chunk's overlap with
+    the previous one (from char offsets, when known) is dropped.
+    """
+    min_chars = max(1, section_chars // 2)
+    # Expected extra length after min_chars is one chunk per `modulus` hash draws.
+    modulus = max(1, round(min_chars / max(1, chunk_chars)))
+    sections: List[Dict] = []
+    parts: List[str] = []
+    size = 0
+    first = last = 0
+    prev_end: Optional[int] = None
+    for ch in chunks:
+        text = ch["text"] or ""
+        start = ch.get("char_start")
+        if prev_end is not None and start is not None and start < prev_end:
+            text = text[prev_end - start:]
+        if ch.get("char_end") is not None:
+            prev_end = ch["char_end"]
+        if not parts:
+            first = ch.get("page") or 0
+        parts.append(text)
+        size += len(text)
+        last = ch.get("page_end") or ch.get("page") or first
+        boundary = int.from_bytes(hashlib.sha256((ch["text"] or "").encode("utf-8")).digest()[:8], "big") % modulus == 0
+        if (size >= min_chars and boundary) or size >= 2 * section_chars:
+            sections.append({"text": "".join(parts), "first_page": first, "last_page": last})
+            parts, size = [], 0
+    if parts:
+        sections.append({"text": "".join(parts), "first_page": first, "last_page": last})
+    return sections
+
+
+def _parse_final(text: str) -> Dict:
+    first = text.find('{')
+    last = text.rfind('}')
+    try:
+        parsed = json.loads(text[first:last + 1]) if first != -1 else {"answer": text.strip()}
+    except Exception:
+        parsed = {"answer": text.strip()}
+    if not isinstance(parsed, dict):
+        parsed = {"answer": str(parsed)}
+    sources = parsed.get("sources")
+    return {
+        "answer": str(parsed.get("answer", "")),
+        "answer_type": "summarization",
+        "sources": [str(s) for s in sources] if isinstance(sources, list) else [],
+    }
+
+
+class _Run:
+    """One summarization: cache lookups, bounded model calls and usage totals."""
+
+    def __init__(self, document_id: int, cached: Dict[str, models.SectionSummary]):
+        self.document_id = document_id
+        self.cached = cached
+        self.fresh: Dict[str, models.SectionSummary] = {}
+        self.semaphore = asyncio.Semaphore(max(1, settings.summary_max_concurrency))
+        self.usage = {"model_calls": 0, "cached_nodes": 0, "prompt_tokens": 0, "output_tokens": 0}
+
+    async def node(self, key: str, kind: str, prompt: str) -> str:
+        row = self.cached.get(key)
+        if row is not None:
+            self.usage["cached_nodes"] += 1
+            return row.summary
+        async with self.semaphore:
+            text, usage = await rag.complete(prompt, "summarize_map" if kind == "map" else "summarize_reduce", SUMMARY_TIMEOUT_S)
+        self.usage["model_calls"] += 1
+        self.usage["prompt_tokens"] += usage["prompt_tokens"]
+        self.usage["output_tokens"] += usage["output_tokens"]
+        summary = json.dumps(_parse_final(text)) if kind == "final" else text.strip()
+        self.fresh[key] = models.SectionSummary(
+            document_id=self.document_id, key=key, kind=kind, summary=summary,
+            prompt_tokens=usage["prompt_tokens"], output_tokens=usage["output_tokens"],
+        )
+        return summary
+
+
+async def _load(document_id: int) -> Tuple[List[Dict], Dict[str, models.SectionSummary]]:
+    async with SessionLocal() as session:  # type: ignore
+        res = await session.execute(
+            select(models.Chunk.text, models.Chunk.page, models.Chunk.page_end, models.Chunk.char_start, models.Chunk.char_end)
+            .where(models.Chunk.document_id == document_id)
+            .order_by(models.Chunk.position)
+        )
+        chunks = [row._asdict() for row in res.all()]
+        res = await session.execute(select(models.SectionSummary).where(models.SectionSummary.document_id == document_id))
+        cached = {row.key: row for row in res.scalars().all()}
+    return chunks, cached
+
+
+async def _save(document_id: int, fresh: List[models.SectionSummary], keep: List[str]):
+    async with SessionLocal() as session:  # type: ignore
+        await session.execute(
+            delete(models.SectionSummary)
+            .where(models.SectionSummary.document_id == document_id, models.SectionSummary.key.not_in(keep))
+        )
+        session.add_all(fresh)
+        await session.commit()
+
+
+async def summarize_document(document_id: int) -> Dict:
+    """Summarize an ingested document; raises SummaryUnavailable when it has no chunks.
+
+    The answer carries `latency_ms`, `timings` (map_ms, reduce_ms) and
+    `usage` (sections, model_calls, cached_nodes and token counts).
+    """
+    start = time.time()
+    chunks, cached = await _load(document_id)
+    if not chunks:
+        raise SummaryUnavailable(document_id)
+    model = settings.generation_model
+    sections = split_sections(chunks, settings.summary_section_chars, settings.chunk_size)
+    run = _Run(document_id, cached)
+    keys = [_hash(model, PROMPT_VERSION, "map", s["text"]) for s in sections]
+    fanin = max(2, settings.summary_reduce_fanin)
+    level_keys: List[str] = []
+    failed: Optional[Exception] = None
+    timings: Dict[str, float] = {}
+    t0 = time.time()
+    try:
+        summaries = await asyncio.gather(*(
+            run.node(key, "map", MAP_PROMPT.format(pages=_pages(s["first_page"], s["last_page"]), content=s["text"]))
+            for key, s in zip(keys, sections)
+        ))
+        timings["map_ms"] = (time.time() - t0) * 1000
+        t0 = time.time()
+        # Each level holds (key, summary, first_page, last_page) per node.
+        level = [(k, text, s["first_page"], s["last_page"]) for k, text, s in zip(keys, summaries, sections)]
+        level_keys = list(keys)
+        while True:
+            final = len(level) <= fanin
+            groups = [level] if final else [level[i:i + fanin] for i in range(0, len(level), fanin)]
+            kind = "final" if final else "reduce"
+            group_keys = [_hash(model, PROMPT_VERSION, kind, *(k for k, *_ in g)) for g in groups]
+            merged = await asyncio.gather(*(
+                run.node(key, kind, (FINAL_PROMPT if final else REDUCE_PROMPT).format(
+                    content="\n\n".join(f"[pages {_pages(a, b)}] {text}" for _, text, a, b in g)))
+                for key, g in zip(group_keys, groups)
+            ))
+            level_keys += group_keys
+            level = [(k, text, g[0][2], g[-1][3]) for k, text, g in zip(group_keys, merged, groups)]
+            if final:
+                break
+        timings["reduce_ms"] = (time.time() - t0) * 1000
+    except Exception as e:
+        failed = e
+    # Successful nodes are kept even when another failed, so a retry only redoes the rest.
+    try:
+        await _save(document_id, list(run.fresh.values()), list(cached) if failed else level_keys)
+    except Exception as e:  # pragma: no cover
+        logger.warning(f"Saving section summaries failed for doc {document_id}: {e}")
+    usage = {"sections": len(sections), **run.usage}
+    if failed is not None:
+        logger.warning(f"Summarization failed for doc {document_id}: {failed}")
+        answer = {"answer": "Summarization unavailable (model error).", "answer_type": "summarization", "sources": []}
+    else:
+        answer = json.loads(level[0][1])
+    return {**answer, "latency_ms": int((time.time() - start) * 1000), "timings": timings, "usage": usage}
@@ -1,77 +1,243 @@
-"""Simplified ingestion (synchronous inline) removing Celery/Redis.
-The upload route now awaits ingest_document_async directly.
+"""Document ingestion pipeline (download -> parse -> chunk -> embed/index -> persist).
+Runs inside the background job queue (`app.services.jobs`), which passes a
+progress reporter; it can still be awaited directly with no reporter.
 """
 
 from app.core.config import get_settings
-from app.core import runtime_state
+from app.core import runtime_state, executors, metrics
 from app.services import parsing, chunking, retrieval
 from app.db.session import SessionLocal
 from app.db import models
-from app.services.storage import _client, settings as ssettings
+from app.services import storage
 from loguru import logger
-import traceback
+from sqlalchemy import delete, insert, select, update
+import asyncio
+import os
+import time
 
 settings = get_settings()
 
 
+# Columns written when persisting chunks, in COPY order.
+CHUNK_COLUMNS = ("document_id", "chunk_id", "page", "page_end", "position", "char_start", "char_end", "text", "owner_id",
+                 "vector_pending")
+
+
+def status_update(document_id: int, state: str):
+    """UPDATE statement for a document's status (no row load), for callers batching writes."""
+    return update(models.Document).where(models.Document.id == document_id).values(status=state)
+
+
+async def document_owner(document_id: int) -> str | None:
+    async with SessionLocal() as session:  # type: ignore
+        return (await session.execute(select(models.Document.owner_id).where(models.Document.id == document_id))).scalar()
+
+
 async def _update_status(document_id: int, state: str):
     try:
         async with SessionLocal() as session:  # type: ignore
-            doc = await session.get(models.Document, document_id)
-            if doc:
-                doc.status = state
-                await session.commit()
-                logger.debug(f"doc {document_id} -> {state}")
+            await session.execute(status_update(document_id, state))
+            await session.commit()
+        logger.debug(f"doc {document_id} -> {state}")
     except Exception as e:  # pragma: no cover
         logger.warning(f"status update failed {document_id} {state}: {e}")
 
 
-async def ingest_document(document_id: int, object_name: str, content_type: str, gemini_key: str | None = None):  # noqa: D401
+class IngestCancelled(Exception):
+    """Raised at a stage boundary once the job has been cancelled."""
+
+
+class ProgressReporter:
+    """No-op progress sink; the job queue passes a DB-backed subclass."""
+
+    async def stage(self, name: str, document_id: int | None = None):
+        """Enter stage `name`; with `document_id` the document's status follows it."""
+        if document_id is not None:
+            await _update_status(document_id, name)
+
+    async def update(self, **counters: int):
+        pass
+
+    def check_cancelled(self):
+        pass
+
+
+async def _enter_stage(document_id: int, progress: ProgressReporter, state: str):
+    progress.check_cancelled()
+    await progress.stage(state, document_id)
+
+
+def _chunk_meta(ch) -> tuple:
+    return (ch.get("page", 0) or 0, ch.get("page_end"), ch.get("position"), ch.get("char_start"), ch.get("char_end"))
+
+
+async def _indexed_chunks(document_id: int, owner_id: str | None = None) -> dict:
+    """chunk_id -> metadata of the chunks persisted by the last successful ingestion.
+
+    Documents indexed before chunk ids existed have positional point ids that
+    cannot be diffed; their vectors are dropped and everything is re-added.
+    Chunks whose Qdrant point was not written are left out, so they count as
+    new and are upserted again.
+    """
+    async with SessionLocal() as session:  # type: ignore
+        res = await session.execute(
+            select(models.Chunk.chunk_id, models.Chunk.page, models.Chunk.page_end, models.Chunk.position,
+                   models.Chunk.char_start, models.Chunk.char_end)
+            .where(models.Chunk.document_id == document_id, models.Chunk.vector_pending.isnot(True))
+        )
+        rows = res.fetchall()
+    if any(row[0] is None for row in rows):
+        await retrieval.delete_document_vectors(document_id, owner_id)
+        return {}
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+async def _insert_chunks(session, rows: list):
+    """Bulk-insert chunk rows: COPY on Postgres, batched executemany elsewhere."""
+    conn = await session.connection()
+    if conn.dialect.name == "postgresql" and conn.dialect.driver == "asyncpg":
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            models.Chunk.__tablename__, records=[tuple(r[c] for c in CHUNK_COLUMNS) for r in rows], columns=list(CHUNK_COLUMNS),
+        )
+        return
+    size = max(1, settings.chunk_insert_batch_size)
+    for start in range(0, len(rows), size):
+        await session.execute(insert(models.Chunk), rows[start:start + size])
+
+
+async def _persist(document_id: int, status: str, text: str, chunks: list | None, pending: set = frozenset()) -> bool:
+    """Write the final status, the document text and (unless None) its chunks in one transaction.
+
+    Chunks in `pending` are marked `vector_pending`. Returns False when the
+    document no longer exists.
+    """
+    async with SessionLocal() as session:  # type: ignore
+        res = await session.execute(status_update(document_id, status))
+        if not res.rowcount:
+            return False
+        if chunks is not None:
+            await session.execute(delete(models.Chunk).where(models.Chunk.document_id == document_id))
+            await _insert_chunks(session, [
+                {"document_id": document_id, "chunk_id": ch["chunk_id"], "page": ch.get("page", 0), "page_end": ch.get("page_end"),
+                 "position": idx, "char_start": ch.get("char_start"), "char_end": ch.get("char_end"), "text": ch["text"],
+                 "owner_id": ch.get("owner_id"), "vector_pending": ch["chunk_id"] in pending}
+                for idx, ch in enumerate(chunks)
+            ])
+        await session.execute(delete(models.DocumentText).where(models.DocumentText.document_id == document_id))
+        await session.execute(insert(models.DocumentText).values(document_id=document_id, text=text[:2_000_000]))
+        await session.commit()
+    return True
+
+
+async def _parse(content_type: str, path: str, progress: ProgressReporter):
+    if content_type != "application/pdf":
+        return await executors.run_cpu(parsing.parse_file, content_type, path)
+    total = await executors.run_io(parsing.pdf_page_count, path)
+    await progress.update(pages_parsed=0, pages_total=total)
+    # Page-range shards run concurrently on the parse pool; reassembled in page order below.
+    shards = [
+        asyncio.ensure_future(executors.run_cpu(parsing.parse_pdf_range, path, start, stop, settings.ocr_dpi))
+        for start, stop in parsing.page_ranges(total, settings.parse_pages_per_task)
+    ]
+    parsed = 0
+    try:
+        for fut in asyncio.as_completed(shards):
+            shard = await fut
+            parsed += len(shard)
+            for seconds in getattr(shard, "ocr_seconds", ()):
+                metrics.INGEST_OCR_PAGE_SECONDS.observe(seconds)
+            progress.check_cancelled()
+            await progress.update(pages_parsed=parsed)
+    except BaseException:
+        for fut in shards:
+            fut.cancel()
+        raise
+    return [page for fut in shards for page in fut.result()]
+
+
+async def ingest_document(document_id: int, object_name: str, content_type: str, gemini_key: str | None = None, progress: ProgressReporter | None = None):  # noqa: D401
     if gemini_key:
         runtime_state.set_gemini_key(gemini_key)
-    await _update_status(document_id, "downloading")
+    progress = progress or ProgressReporter()
+    await _enter_stage(document_id, progress, "downloading")
     try:
-        response = _client.get_object(ssettings.minio_bucket, object_name)
-        data = response.read()
+        # Spooled to disk so parsing never holds the whole object in memory.
+        with metrics.timer(metrics.INGEST_SECONDS, stage="download"):
+            path = await executors.run_io(storage.download_to_tempfile, object_name)
     except Exception as e:
+        metrics.INGEST_DOCUMENTS.inc(outcome="error")
         await _update_status(document_id, "error")
         logger.exception(f"Download failed doc {document_id}: {e}")
         return {"document_id": document_id, "error": f"download:{e}"}
-    await _update_status(document_id, "parsing")
-    pages = parsing.parse_file(content_type, data)
+    try:
+        await _enter_stage(document_id, progress, "parsing")
+        with metrics.timer(metrics.INGEST_SECONDS, stage="parse"):
+            pages = await _parse(content_type, path, progress)
+    finally:
+        os.unlink(path)
+    await progress.update(pages_parsed=len(pages), pages_total=len(pages))
     page_dicts = [{"page": p, "text": t} for p, t in pages]
     aggregated_text = "\n".join([p["text"] for p in page_dicts])
-    await _update_status(document_id, "chunking")
-    chunks = chunking.chunk_pages(page_dicts)
-    for ch in chunks:
-        ch["document_id"] = document_id
+    await _enter_stage(document_id, progress, "chunking")
+    owner_id = await document_owner(document_id)
+    with metrics.timer(metrics.INGEST_SECONDS, stage="chunk"):
+        chunks = chunking.chunk_pages(page_dicts)
+        for ch in chunks:
+            ch["document_id"] = document_id
+            if owner_id is not None:
+                ch["owner_id"] = owner_id
+        retrieval.assign_chunk_ids(chunks)
+    # Diff against the chunks indexed by the previous ingestion of this document:
+    # unchanged chunks are skipped, moved ones only get a payload update.
+    previous = await _indexed_chunks(document_id, owner_id)
+    fresh = [ch for ch in chunks if ch["chunk_id"] not in previous]
+    moved = [ch for ch in chunks if ch["chunk_id"] in previous and previous[ch["chunk_id"]] != _chunk_meta(ch)]
+    current = {ch["chunk_id"] for ch in chunks}
+    stale = [cid for cid in previous if cid not in current]
+    if previous:
+        logger.info(
+            f"Re-ingesting doc {document_id}: {len(fresh)} new, {len(moved)} moved, "
+            f"{len(chunks) - len(fresh) - len(moved)} unchanged, {len(stale)} removed chunks"
+        )
     add_error: str | None = None
+    # Chunks indexed locally whose Qdrant point or payload was not written.
+    pending: set = set()
     try:
-        await _update_status(document_id, "embedding")
-        await retrieval.add_documents(chunks)
-        await _update_status(document_id, "indexing")
+        await _enter_stage(document_id, progress, "embedding")
+        await progress.update(chunks_embedded=0, chunks_total=len(fresh))
+        # Embed/index in slices that keep every embedding slot busy, reporting progress per slice.
+        step = max(1, settings.embedding_batch_size * settings.embedding_max_concurrency)
+        with metrics.timer(metrics.INGEST_SECONDS, stage="embed"):
+            for start in range(0, len(fresh), step):
+                progress.check_cancelled()
+                pending |= await retrieval.add_documents(fresh[start:start + step])
+                await progress.update(chunks_embedded=min(start + step, len(fresh)))
+        await _enter_stage(document_id, progress, "indexing")
+        with metrics.timer(metrics.INGEST_SECONDS, stage="index"):
+            pending |= await retrieval.update_chunk_metadata(moved)
+            await retrieval.delete_chunks(stale, document_id, owner_id)
+    except IngestCancelled:
+        raise
     except Exception as e:
         add_error = f"embedding_or_vector_error: {e}"
         logger.exception(f"Embedding/index error doc {document_id}: {e}")
     # Persist chunks and final status
+    persist_start = time.perf_counter()
     try:
-        async with SessionLocal() as session:  # type: ignore
-            doc = await session.get(models.Document, document_id)
-            if not doc:
-                return {"document_id": document_id, "error": "missing_doc"}
-            if add_error:
-                doc.status = "error"
-                doc.aggregated_text = (add_error + "\n" + aggregated_text)[:2_000_000]
-            else:
-                for idx, ch in enumerate(chunks):
-                    c = models.Chunk(document_id=document_id, page=ch.get("page", 0), position=idx, text=ch["text"])  # type: ignore
-                    session.add(c)
-                doc.status = "ingested"
-                doc.aggregated_text = aggregated_text[:2_000_000]
-            await session.commit()
+        if add_error:
+            found = await _persist(document_id, "error", add_error + "\n" + aggregated_text, None)
+        else:
+            if pending:
+                logger.warning(f"Doc {document_id}: {len(pending)} chunks not written to Qdrant; the next ingestion re-adds them")
+            found = await _persist(document_id, "ingested", aggregated_text, chunks, pending)
+        if not found:
+            return {"document_id": document_id, "error": "missing_doc"}
     except Exception as e:  # pragma: no cover
         logger.exception(f"Persist failed doc {document_id}: {e}")
         add_error = add_error or f"persist:{e}"
         await _update_status(document_id, "error")
-    return {"document_id": document_id, "chunks": len(chunks), "error": add_error}
+    metrics.INGEST_SECONDS.observe(time.perf_counter() - persist_start, stage="persist")
+    metrics.INGEST_DOCUMENTS.inc(outcome="error" if add_error else "ok")
+    return {"document_id": document_id, "chunks": len(chunks), "embedded": len(fresh), "error": add_error}
 
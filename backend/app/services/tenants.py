@@ -0,0 +1,115 @@
+"""Document ownership for multi-tenant deployments.
+
+With `multi_tenant` on, every document belongs to the owner named by the
+`X-Owner-Id` header of its upload (or to nobody when the header is absent),
+and listing, retrieval and the answer cache only see the caller's documents.
+The owner is copied onto each chunk and into its Qdrant payload, where it is
+stored either
+
+  payload     in one shared collection with a keyword payload index on
+              `owner_id` (and one on `document_id`), so a tenant's search is a
+              filtered search that Qdrant plans from the index, or
+  collection  in a collection per owner (`<qdrant_collection>__<owner>`), so a
+              tenant's search walks a graph holding only its own points.
+
+The in-process keyword and fallback vector indexes are shared; `owners` maps
+documents to owners so their searches can be restricted to the caller's
+documents. It is loaded from the documents table at startup and kept current
+by ingestion and by the lexical catch-up of other workers' chunks.
+"""
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import re
+from sqlalchemy import select
+from app.core.config import get_settings
+from app.db.session import engine
+from app.db import models
+
+settings = get_settings()
+
+LAYOUTS = ("payload", "collection")
+# Also keeps owners valid inside Qdrant collection names.
+_OWNER_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class InvalidOwner(ValueError):
+    """The owner id is not 1-64 letters, digits, '-' or '_'."""
+
+
+def parse_owner(value: Optional[str]) -> Optional[str]:
+    value = (value or "").strip()
+    if not value:
+        return None
+    if not _OWNER_RE.match(value):
+        raise InvalidOwner(value)
+    return value
+
+
+def layout() -> str:
+    return settings.qdrant_tenant_layout if settings.qdrant_tenant_layout in LAYOUTS else "payload"
+
+
+def collection_for(owner_id: Optional[str]) -> str:
+    """Qdrant collection holding the owner's points."""
+    if settings.multi_tenant and owner_id and layout() == "collection":
+        return f"{settings.qdrant_collection}__{owner_id}"
+    return settings.qdrant_collection
+
+
+def is_tenant_collection(name: str) -> bool:
+    return name == settings.qdrant_collection or name.startswith(f"{settings.qdrant_collection}__")
+
+
+class OwnerMap:
+    """document_id -> owner and owner -> document ids (None = unowned documents)."""
+
+    def __init__(self):
+        self._owner: Dict[int, Optional[str]] = {}
+        self._documents: Dict[Optional[str], Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._owner)
+
+    def set(self, document_id: int, owner_id: Optional[str]):
+        previous = self._owner.get(document_id, owner_id)
+        if previous != owner_id:
+            self._documents.get(previous, set()).discard(document_id)
+        self._owner[document_id] = owner_id
+        self._documents.setdefault(owner_id, set()).add(document_id)
+
+    def update(self, pairs: Iterable[Tuple[int, Optional[str]]]):
+        for document_id, owner_id in pairs:
+            if document_id is not None:
+                self.set(int(document_id), owner_id)
+
+    def forget(self, document_id: int):
+        owner_id = self._owner.pop(document_id, None)
+        self._documents.get(owner_id, set()).discard(document_id)
+
+    def documents(self, owner_id: Optional[str]) -> Set[int]:
+        return self._documents.get(owner_id, set())
+
+    def clear(self):
+        self._owner.clear()
+        self._documents.clear()
+
+    def scope(self, owner_id: Optional[str], document_ids: Optional[List[int]]) -> List[int]:
+        """The requested documents (all when None) that belong to the owner; [] means none do."""
+        owned = self.documents(owner_id)
+        if document_ids:
+            return [d for d in document_ids if d in owned]
+        return sorted(owned)
+
+
+owners = OwnerMap()
+
+
+async def load(owner_map: OwnerMap = owners, batch_size: int = 50_000) -> int:
+    """Fill `owner_map` from the documents table; returns the number of documents."""
+    owner_map.clear()
+    stmt = select(models.Document.id, models.Document.owner_id).execution_options(yield_per=batch_size)
+    async with engine.connect() as conn:
+        result = await conn.stream(stmt)
+        async for part in result.partitions(batch_size):
+            owner_map.update(part)
+    return len(owner_map)
@@ -0,0 +1,212 @@
+"""Streaming multipart/form-data uploads into object storage.
+
+The request body is parsed incrementally with python-multipart and the bytes
+of the `file` field are handed to `storage.put_stream`, which runs on the I/O
+thread pool and pulls them through a bounded queue. Peak memory per upload is
+therefore about one storage part plus the queue, whatever the file size. The
+size limit is enforced while streaming and a SHA-256 of the content is
+computed on the way through.
+"""
+from __future__ import annotations
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+import asyncio
+import hashlib
+from multipart.multipart import MultipartParser, parse_options_header
+from app.core import executors
+from app.services import storage
+
+# Request-body chunks buffered between the event loop and the storage thread.
+_QUEUE_CHUNKS = 16
+
+
+class UploadError(Exception):
+    """Malformed upload request (maps to HTTP 400)."""
+
+
+class UploadTooLarge(Exception):
+    """Upload exceeded the configured size limit (maps to HTTP 413)."""
+
+
+class StoredUpload:
+    def __init__(self, object_name: str, filename: str, content_type: str, size: int, sha256: str):
+        self.object_name = object_name
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+
+
+class _BodyReader:
+    """Blocking file-like view of chunks fed from the event loop.
+
+    `read()` runs on a worker thread and waits on the loop's queue, so the
+    bounded queue gives back-pressure: the request body is not read faster
+    than storage accepts it.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self._queue: asyncio.Queue = asyncio.Queue(_QUEUE_CHUNKS)
+        self._chunks: List[bytes] = []
+        self._buffered = 0
+        self._eof = False
+
+    # -- event loop side --
+    async def feed(self, data: bytes, consumer: asyncio.Future):
+        if not self._queue.full():
+            self._queue.put_nowait(data)
+            return
+        put = asyncio.ensure_future(self._queue.put(data))
+        await asyncio.wait({put, consumer}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            # The storage call ended before consuming the body; surface its error.
+            put.cancel()
+            consumer.result()
+            raise UploadError("storage upload ended before the file was fully read")
+
+    async def finish(self):
+        await self._queue.put(None)
+
+    def abort(self, exc: BaseException):
+        # Make room for the sentinel: the reader only needs to see the error.
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(exc)
+
+    # -- worker thread side --
+    async def _take(self) -> List:
+        items = [await self._queue.get()]
+        while not self._queue.empty():
+            items.append(self._queue.get_nowait())
+        return items
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._eof and (size < 0 or self._buffered < size):
+            # One loop round-trip drains everything queued so far.
+            for item in asyncio.run_coroutine_threadsafe(self._take(), self._loop).result():
+                if item is None:
+                    self._eof = True
+                elif isinstance(item, BaseException):
+                    self._eof = True
+                    raise item
+                else:
+                    self._chunks.append(item)
+                    self._buffered += len(item)
+        data = b"".join(self._chunks)
+        if 0 <= size < len(data):
+            self._chunks = [data[size:]]
+            data = data[:size]
+        else:
+            self._chunks = []
+        self._buffered -= len(data)
+        return data
+
+
+PutFn = Callable[..., str]
+
+
+async def stream_upload(
+    content_type_header: str,
+    body: AsyncIterator[bytes],
+    max_bytes: int,
+    field: str = "file",
+    put: Optional[PutFn] = None,
+) -> StoredUpload:
+    """Stream the `field` file part of a multipart body into storage.
+
+    `put(stream, object_name, content_type)` is the blocking storage call
+    (defaults to `storage.put_stream`).
+    """
+    put = put or storage.put_stream
+    ctype, params = parse_options_header(content_type_header or "")
+    boundary = params.get(b"boundary")
+    if ctype != b"multipart/form-data" or not boundary:
+        raise UploadError("Expected a multipart/form-data body")
+
+    loop = asyncio.get_running_loop()
+    events: List[Union[tuple, bytes]] = []
+    header_field = bytearray()
+    header_value = bytearray()
+    part_headers: Dict[bytes, bytes] = {}
+
+    def on_part_begin():
+        part_headers.clear()
+
+    def on_header_field(data: bytes, start: int, end: int):
+        header_field.extend(data[start:end])
+
+    def on_header_value(data: bytes, start: int, end: int):
+        header_value.extend(data[start:end])
+
+    def on_header_end():
+        part_headers[bytes(header_field).lower()] = bytes(header_value)
+        header_field.clear()
+        header_value.clear()
+
+    def on_headers_finished():
+        events.append(("begin", dict(part_headers)))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        events.append(data[start:end])
+
+    def on_part_end():
+        events.append(("end",))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    reader: Optional[_BodyReader] = None
+    consumer: Optional[asyncio.Future] = None
+    in_file = done = False
+    filename = content_type = object_name = ""
+    size = 0
+    digest = hashlib.sha256()
+    try:
+        async for chunk in body:
+            if done:
+                continue  # drain the rest of the body (trailing fields are ignored)
+            parser.write(chunk)
+            for ev in events:
+                if isinstance(ev, bytes):
+                    if not in_file or not ev:
+                        continue
+                    size += len(ev)
+                    if size > max_bytes:
+                        raise UploadTooLarge()
+                    digest.update(ev)
+                    await reader.feed(ev, consumer)  # type: ignore[union-attr,arg-type]
+                elif ev[0] == "begin" and reader is None:
+                    _, disposition = parse_options_header(ev[1].get(b"content-disposition", b""))
+                    if disposition.get(b"name", b"").decode("latin-1") != field or b"filename" not in disposition:
+                        continue
+                    filename = disposition[b"filename"].decode("utf-8", errors="replace")
+                    content_type = ev[1].get(b"content-type", b"").decode("latin-1")
+                    if not content_type:
+                        raise UploadError("Unknown content type")
+                    object_name = storage.object_name_for(filename)
+                    reader = _BodyReader(loop)
+                    consumer = asyncio.ensure_future(executors.run_io(put, reader, object_name, content_type))
+                    in_file = True
+                elif ev[0] == "end" and in_file:
+                    in_file = False
+                    done = True
+                    await reader.finish()  # type: ignore[union-attr]
+            events.clear()
+        if consumer is None:
+            raise UploadError(f"No file in form field '{field}'")
+        if not done:
+            raise UploadError("Incomplete multipart body")
+        await consumer
+    except BaseException as e:
+        if reader is not None and consumer is not None and not consumer.done():
+            reader.abort(e if isinstance(e, Exception) else UploadError("upload aborted"))
+            await asyncio.gather(consumer, return_exceptions=True)
+        raise
+    return StoredUpload(object_name, filename, content_type, size, digest.hexdigest())
@@ -0,0 +1,592 @@
+"""In-process vector index used when Qdrant is unreachable.
+
+Vectors are stored L2-normalized in a contiguous, growable float32 matrix with
+parallel columns for document_id, page, chunk id and text, so a query is one
+matrix-vector product plus an `argpartition` top-k. Embedding dimensions can
+differ between hash (256-d) and Gemini vectors, so each dimension gets its own
+segment and a query only scans the segment matching its own size.
+
+With quantization the scan runs over compact codes kept in RAM instead:
+"int8" stores each component as round(x / s * 127) with s the 0.99 quantile
+of |x| in the segment's first batch (1 byte per dimension), "binary" stores
+the sign of x - c with c the mean of that batch (1 bit per dimension; without
+centering, the component shared by all embeddings sets most bits alike).
+Codes are scored against the float query (asymmetrically), which ranks better
+than comparing binarized queries. The `rescore` x top_k best candidates are
+then rescored exactly against the float32 vectors, which live in an unlinked
+memory-mapped file under `spill_dir` (the system temp dir by default), like
+Qdrant's on-disk originals: the page cache holds them only while there is
+memory to spare.
+
+Once a segment reaches `ann_min_rows` it becomes an IVF-flat index: spherical
+k-means on a sample picks `ann_lists` centroids (about sqrt(rows) by default),
+every row is assigned to its nearest centroid, and a query only scores the
+rows of the `ann_probes` lists whose centroids are closest to it. Rows are
+kept ordered by list, so a probed list is one contiguous slice (gathering
+scattered rows costs several times more than scoring them). Rows added later
+are assigned on insert and appended to an unordered tail that is merged back
+once it outgrows a quarter of the ordered rows. The centroids are not
+retrained, so lists grow with the segment and `ann_probes` is the
+recall/latency knob. Filtered queries intersect the probed rows with the
+filter, and fall back to scanning the filtered rows when that leaves fewer
+than top_k.
+
+`write` saves the index as .npy columns plus a text blob and `load` maps them
+back copy-on-write, so loading costs no parsing and unmodified pages stay
+shared with the page cache. The first insert into a loaded segment copies it
+into growable arrays. To write from another thread, `frozen` pins views of the
+segments as they are: while pinned, a segment is never modified in place
+(appends land past the pinned rows, deletes and page updates go to new
+arrays), so neither searches nor mutations wait for the writer.
+
+Entries carrying a `chunk_id` are unique by it: adding the same chunk again
+replaces the old row, so re-ingesting a document cannot duplicate it.
+"""
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+import copy
+import json
+import mmap
+import os
+import tempfile
+import numpy as np
+
+QUANTIZATIONS = ("none", "int8", "binary")
+FORMAT = 1
+# Rows compacted per block when deleting.
+SCAN_BLOCK = 16384
+# Quantized rows decoded per block during a scan; the float32 buffer stays cache-sized.
+DECODE_BLOCK = 512
+# k-means training: sampled rows per list, iterations, and the most lists an automatic choice makes.
+TRAIN_SAMPLE = 64
+TRAIN_ITERS = 8
+MAX_AUTO_LISTS = 1024
+# Rows appended after clustering are reordered by list once they exceed this fraction of the ordered ones.
+TAIL_RATIO = 0.25
+# Scoring a gathered row costs about this many rows scored in a contiguous slice.
+GATHER_COST = 4
+_COLUMNS = ("vectors", "codes", "doc_ids", "pages", "chunk_ids", "text_refs", "lists")
+
+
+def _compact(array: np.ndarray, mask: np.ndarray, size: int) -> int:
+    """Move the rows of `array[:size]` selected by `mask` to the front, block by block; returns their count."""
+    kept = 0
+    for start in range(0, size, SCAN_BLOCK):
+        stop = min(start + SCAN_BLOCK, size)
+        rows = array[start:stop][mask[start:stop]]
+        array[kept:kept + len(rows)] = rows
+        kept += len(rows)
+    return kept
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (by dot product) of each row, as int16."""
+    out = np.empty(len(vectors), dtype=np.int16)
+    for start in range(0, len(vectors), SCAN_BLOCK):
+        block = np.asarray(vectors[start:start + SCAN_BLOCK], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def _map_blob(path: str):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class _TextStore:
+    """Chunk texts by reference: a mapped UTF-8 blob from a snapshot plus texts added since."""
+
+    def __init__(self, blob=b"", offsets: Optional[np.ndarray] = None):
+        self.blob = blob
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int64)
+        self.base = len(self.offsets) - 1
+        self.extra: Dict[int, str] = {}
+        self._next = self.base
+
+    def add(self, texts: Sequence[str]) -> np.ndarray:
+        refs = np.arange(self._next, self._next + len(texts), dtype=np.int64)
+        self.extra.update(zip(refs.tolist(), texts))
+        self._next += len(texts)
+        return refs
+
+    def drop(self, refs: Iterable[int]):
+        for ref in refs:
+            self.extra.pop(ref, None)
+
+    def __getitem__(self, ref: int) -> str:
+        if ref < self.base:
+            return bytes(self.blob[int(self.offsets[ref]):int(self.offsets[ref + 1])]).decode("utf-8")
+        return self.extra[ref]
+
+
+class _Segment:
+    def __init__(self, dim: int, capacity: int = 1024, quantization: str = "none", spill_dir: Optional[str] = None):
+        self.dim = dim
+        self.size = 0
+        self.quantization = quantization
+        self.spill_dir = spill_dir
+        self.scale: Optional[float] = None
+        self.center: Optional[np.ndarray] = None
+        self.vectors = self._alloc_vectors(capacity)
+        self.codes = self._alloc_codes(capacity)
+        self.doc_ids = np.zeros(capacity, dtype=np.int32)
+        self.pages = np.zeros(capacity, dtype=np.int32)
+        self.chunk_ids = np.zeros(capacity, dtype="S36")
+        self.text_refs = np.zeros(capacity, dtype=np.int64)
+        self.texts = _TextStore()
+        # IVF: unit-norm centroids and each row's list; rows [0, clustered) are ordered by list,
+        # list i spanning rows [offsets[i], offsets[i + 1]).
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: Optional[np.ndarray] = None
+        self.clustered = 0
+        self.offsets: Optional[np.ndarray] = None
+        # Frozen views referencing the current arrays, and text refs to drop once they are released.
+        self.pinned = 0
+        self._dropped: List[int] = []
+
+    def _alloc_vectors(self, capacity: int) -> np.ndarray:
+        if self.quantization == "none":
+            return np.zeros((capacity, self.dim), dtype=np.float32)
+        fd, path = tempfile.mkstemp(prefix="vectors-", suffix=".f32", dir=self.spill_dir)
+        os.close(fd)
+        try:
+            return np.memmap(path, dtype=np.float32, mode="w+", shape=(max(capacity, 1), self.dim))
+        finally:
+            os.unlink(path)  # the mapping keeps the data; the space is freed when it is dropped
+
+    def _alloc_codes(self, capacity: int) -> Optional[np.ndarray]:
+        if self.quantization == "int8":
+            return np.zeros((capacity, self.dim), dtype=np.int8)
+        if self.quantization == "binary":
+            return np.zeros((capacity, (self.dim + 7) // 8), dtype=np.uint8)
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of the arrays held in RAM (spilled float vectors excluded)."""
+        arrays = [self.doc_ids, self.pages, self.chunk_ids, self.text_refs, self.lists]
+        arrays.append(self.codes if self.codes is not None else self.vectors)
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def _realloc(self, capacity: int, order: Optional[np.ndarray] = None):
+        """Move every column into new arrays of `capacity` rows: the first `size` rows, or rows `order`."""
+        for name in _COLUMNS:
+            old = getattr(self, name)
+            if old is None:
+                continue
+            if name == "vectors":
+                new = self._alloc_vectors(capacity)
+            elif name == "codes":
+                new = self._alloc_codes(capacity)
+            else:
+                new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            rows = self.size if order is None else len(order)
+            for start in range(0, rows, SCAN_BLOCK):
+                stop = min(start + SCAN_BLOCK, rows)
+                new[start:stop] = old[start:stop] if order is None else old[order[start:stop]]
+            setattr(self, name, new)
+
+    def _reserve(self, extra: int):
+        needed = self.size + extra
+        capacity = self.doc_ids.shape[0]
+        if needed > capacity:
+            self._realloc(max(needed, capacity * 2))
+
+    def _cluster(self):
+        """Order all rows by list."""
+        self._realloc(self.doc_ids.shape[0], np.argsort(self.lists[: self.size], kind="stable"))
+        self.clustered = self.size
+        self._count_lists()
+
+    def _count_lists(self):
+        self.offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.lists[: self.clustered], minlength=len(self.centroids)), out=self.offsets[1:])
+
+    def _encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.quantization == "binary":
+            if self.center is None:
+                self.center = vectors.mean(axis=0)
+            return np.packbits(vectors > self.center, axis=1)
+        if self.scale is None:
+            self.scale = float(np.quantile(np.abs(vectors), 0.99)) or 1.0
+        return np.clip(np.rint(vectors * (127.0 / self.scale)), -127, 127).astype(np.int8)
+
+    def add(self, vectors: np.ndarray, doc_ids: Sequence[int], pages: Sequence[int], texts: Sequence[str], chunk_ids: Sequence[Optional[str]]):
+        n = vectors.shape[0]
+        self._reserve(n)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        normalized = vectors / norms
+        rows = slice(self.size, self.size + n)
+        self.vectors[rows] = normalized
+        if self.codes is not None:
+            self.codes[rows] = self._encode(normalized)
+        if self.lists is not None:
+            self.lists[rows] = _nearest(normalized, self.centroids)
+        self.doc_ids[rows] = doc_ids
+        self.pages[rows] = pages
+        self.chunk_ids[rows] = [(c or "").encode() for c in chunk_ids]
+        self.text_refs[rows] = self.texts.add(texts)
+        self.size += n
+        if self.lists is not None and self.size - self.clustered > TAIL_RATIO * self.clustered:
+            self._cluster()
+
+    def keep(self, mask: np.ndarray):
+        dropped = self.text_refs[: self.size][~mask].tolist()
+        if self.pinned:
+            self._dropped.extend(dropped)
+            kept = int(np.count_nonzero(mask))
+            self._realloc(self.doc_ids.shape[0], np.flatnonzero(mask))
+        else:
+            self.texts.drop(dropped)
+            for name in _COLUMNS:
+                if getattr(self, name) is not None:
+                    kept = _compact(getattr(self, name), mask, self.size)
+        # Both keep the row order, so the ordered rows stay ordered.
+        self.clustered = int(np.count_nonzero(mask[: self.clustered]))
+        self.size = kept
+        if self.lists is not None:
+            self._count_lists()
+
+    def set_pages(self, rows: List[int], pages: List[int]):
+        if self.pinned:
+            self.pages = self.pages.copy()
+        self.pages[rows] = pages
+
+    def pin(self) -> "_Segment":
+        """A view of the segment as it is now; see `VectorIndex.frozen`."""
+        self.pinned += 1
+        return copy.copy(self)
+
+    def unpin(self):
+        self.pinned -= 1
+        if not self.pinned:
+            self.texts.drop(self._dropped)
+            self._dropped = []
+
+    def rows_of(self, chunk_ids: List[str]) -> np.ndarray:
+        if not self.size:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(np.isin(self.chunk_ids[: self.size], np.asarray(chunk_ids, dtype="S36")))
+
+    def train(self, nlist: int, rng: np.random.Generator):
+        """Cluster a sample with spherical k-means and assign every row to its nearest centroid."""
+        take = min(self.size, nlist * TRAIN_SAMPLE)
+        sample = np.asarray(self.vectors[np.sort(rng.choice(self.size, take, replace=False))])
+        centroids = sample[rng.choice(take, nlist, replace=False)].copy()
+        for _ in range(TRAIN_ITERS):
+            assign = _nearest(sample, centroids)
+            counts = np.bincount(assign, minlength=nlist)
+            filled = counts > 0
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            centroids[filled] = np.add.reduceat(sample[np.argsort(assign, kind="stable")], starts, axis=0)
+            # Reseed empty lists with random sample rows.
+            centroids[~filled] = sample[rng.choice(take, int((~filled).sum()))]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        self.centroids = centroids.astype(np.float32)
+        self.lists = np.zeros(self.doc_ids.shape[0], dtype=np.int16)
+        self.lists[: self.size] = _nearest(self.vectors[: self.size], self.centroids)
+        self._cluster()
+
+    def probe(self, q: np.ndarray, nprobe: int) -> Tuple[List[Tuple[int, int]], np.ndarray]:
+        """Row ranges of the `nprobe` lists whose centroids are closest to `q`, and their rows in the tail."""
+        nprobe = min(nprobe, len(self.centroids))
+        best = np.sort(np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe])
+        ranges = [(int(self.offsets[i]), int(self.offsets[i + 1])) for i in best if self.offsets[i] < self.offsets[i + 1]]
+        tail = self.clustered + np.flatnonzero(np.isin(self.lists[self.clustered: self.size], best))
+        return ranges, tail
+
+    def range_scores(self, q: np.ndarray, ranges: List[Tuple[int, int]], tail: np.ndarray) -> np.ndarray:
+        """`scores` of the rows in `ranges` followed by `tail`, as returned by `probe`."""
+        if self.codes is not None:
+            return self.scores(q, np.concatenate([np.arange(a, b) for a, b in ranges] + [tail]))
+        return np.concatenate([self.vectors[a:b] @ q for a, b in ranges] + [self.vectors[tail] @ q])
+
+    def scores(self, q: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Cosine scores of all rows (or of `rows`); approximate, higher-is-better values when quantized."""
+        if self.codes is None:
+            return (self.vectors[rows] if rows is not None else self.vectors[: self.size]) @ q
+        n = rows.size if rows is not None else self.size
+        out = np.empty(n, dtype=np.float32)
+        buf = np.empty((DECODE_BLOCK, self.dim), dtype=np.float32)
+        for start in range(0, n, DECODE_BLOCK):
+            stop = min(start + DECODE_BLOCK, n)
+            block = self.codes[rows[start:stop]] if rows is not None else self.codes[start:stop]
+            if self.quantization == "binary":
+                # q . sign(x - c) = 2 * (q . bits) - sum(q), so q . bits ranks the same.
+                block = np.unpackbits(block, axis=1, count=self.dim)
+            decoded = buf[: stop - start]
+            decoded[...] = block
+            np.dot(decoded, q, out=out[start:stop])
+        return out
+
+    def write(self, path: str) -> Dict:
+        os.makedirs(path)
+        n = self.size
+        save = lambda name, arr: np.save(os.path.join(path, name + ".npy"), arr)  # noqa: E731
+        save("vectors", self.vectors[:n])
+        for name in ("codes", "lists"):
+            if getattr(self, name) is not None:
+                save(name, getattr(self, name)[:n])
+        for name in ("centroids", "center"):
+            if getattr(self, name) is not None:
+                save(name, getattr(self, name))
+        save("doc_ids", self.doc_ids[:n])
+        save("pages", self.pages[:n])
+        save("chunk_ids", self.chunk_ids[:n])
+        save("chunk_sorted", np.sort(self.chunk_ids[:n]))
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        with open(os.path.join(path, "texts.bin"), "wb") as f:
+            for row, ref in enumerate(self.text_refs[:n].tolist()):
+                data = self.texts[ref].encode("utf-8")
+                f.write(data)
+                offsets[row + 1] = offsets[row] + len(data)
+        save("text_offsets", offsets)
+        return {"dim": self.dim, "size": n, "scale": self.scale, "clustered": self.clustered}
+
+    @classmethod
+    def load(cls, path: str, meta: Dict, quantization: str, spill_dir: Optional[str]) -> "_Segment":
+        seg = cls(meta["dim"], 1, quantization, spill_dir)
+
+        def load(name: str) -> Optional[np.ndarray]:
+            file = os.path.join(path, name + ".npy")
+            return np.load(file, mmap_mode="c") if os.path.exists(file) else None
+
+        for name in ("vectors", "codes", "lists", "centroids", "center", "doc_ids", "pages", "chunk_ids"):
+            setattr(seg, name, load(name))
+        seg.scale = meta.get("scale")
+        seg.size = meta["size"]
+        if seg.lists is not None:
+            seg.clustered = meta["clustered"]
+            seg._count_lists()
+        seg.texts = _TextStore(_map_blob(os.path.join(path, "texts.bin")), load("text_offsets"))
+        seg.text_refs = np.arange(seg.size, dtype=np.int64)
+        return seg
+
+
+class FrozenIndex:
+    """Segments of a `VectorIndex` pinned by `VectorIndex.frozen`."""
+
+    def __init__(self, quantization: str, segments: List[Tuple[int, _Segment]]):
+        self.quantization = quantization
+        self._segments = segments
+
+    def write(self, path: str):
+        """Save the pinned segments under `path` (a new directory) for `VectorIndex.load`."""
+        os.makedirs(path, exist_ok=True)
+        segments = [seg.write(os.path.join(path, f"d{dim}")) for dim, seg in self._segments]
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"format": FORMAT, "quantization": self.quantization, "segments": segments}, f)
+
+
+class VectorIndex:
+    """Cosine index over pre-normalized float32 vectors, optionally quantized, IVF-partitioned once large."""
+
+    def __init__(self, quantization: str = "none", rescore: int = 4, spill_dir: Optional[str] = None,
+                 ann_min_rows: int = 0, ann_lists: int = 0, ann_probes: int = 16):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"quantization must be one of {QUANTIZATIONS}, got {quantization!r}")
+        self.quantization = quantization
+        self.rescore = max(1, rescore)
+        self.spill_dir = spill_dir
+        self.ann_min_rows = ann_min_rows
+        self.ann_lists = ann_lists
+        self.ann_probes = max(1, ann_probes)
+        self._segments: Dict[int, _Segment] = {}
+        # Chunk ids added since the last load; loaded ones are looked up in the snapshot's sorted ids.
+        self._chunk_ids: Set[str] = set()
+        self._loaded_ids: List[np.ndarray] = []
+        self._rng = np.random.default_rng(0)
+        # Bumped by every mutation, so callers can tell whether a snapshot is stale.
+        self.changes = 0
+
+    def __len__(self) -> int:
+        return sum(s.size for s in self._segments.values())
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of vector data held in RAM (codes when quantized), plus the id and page arrays."""
+        return sum(s.nbytes for s in self._segments.values())
+
+    def _present(self, chunk_ids: List[str]) -> Set[str]:
+        """The chunk ids that may be indexed (loaded ones deleted since are reported too)."""
+        found = self._chunk_ids.intersection(chunk_ids)
+        if chunk_ids:
+            keys = np.asarray(chunk_ids, dtype="S36")
+            for loaded in self._loaded_ids:
+                if len(loaded):
+                    at = np.minimum(np.searchsorted(loaded, keys), len(loaded) - 1)
+                    found.update(c for c, hit in zip(chunk_ids, loaded[at] == keys) if hit)
+        return found
+
+    def _lists_for(self, size: int) -> int:
+        nlist = self.ann_lists or min(MAX_AUTO_LISTS, max(16, int(np.sqrt(size))))
+        return max(1, min(nlist, size, np.iinfo(np.int16).max))
+
+    def _maybe_train(self, seg: _Segment):
+        if self.ann_min_rows and seg.centroids is None and seg.size >= self.ann_min_rows:
+            seg.train(self._lists_for(seg.size), self._rng)
+
+    def add(self, vectors: Sequence[Sequence[float]], chunks: Sequence[Dict]):
+        self.delete_chunks([c["chunk_id"] for c in chunks if c.get("chunk_id")])
+        by_dim: Dict[int, List[int]] = {}
+        for i, v in enumerate(vectors):
+            by_dim.setdefault(len(v), []).append(i)
+        for dim, idxs in by_dim.items():
+            seg = self._segments.get(dim)
+            if seg is None:
+                seg = self._segments[dim] = _Segment(dim, quantization=self.quantization, spill_dir=self.spill_dir)
+            seg.add(
+                np.asarray([vectors[i] for i in idxs], dtype=np.float32),
+                [chunks[i].get("document_id") or 0 for i in idxs],
+                [chunks[i].get("page", 0) or 0 for i in idxs],
+                [chunks[i].get("text") or "" for i in idxs],
+                [chunks[i].get("chunk_id") for i in idxs],
+            )
+            self._maybe_train(seg)
+        self._chunk_ids.update(c["chunk_id"] for c in chunks if c.get("chunk_id"))
+        self.changes += 1
+
+    def delete_chunks(self, chunk_ids: Sequence[str]):
+        drop = list(self._present(list(chunk_ids)))
+        if not drop:
+            return
+        self._chunk_ids.difference_update(drop)
+        self.changes += 1
+        for seg in self._segments.values():
+            rows = seg.rows_of(drop)
+            if rows.size:
+                mask = np.ones(seg.size, dtype=bool)
+                mask[rows] = False
+                seg.keep(mask)
+
+    def update_pages(self, pages: Dict[str, int]):
+        """Set the page of existing chunks (chunk_id -> page) without touching vectors."""
+        present = list(self._present(list(pages)))
+        if not present:
+            return
+        for seg in self._segments.values():
+            rows = seg.rows_of(present).tolist()
+            if rows:
+                seg.set_pages(rows, [pages[seg.chunk_ids[row].decode()] for row in rows])
+        self.changes += 1
+
+    def delete_document(self, document_id: int):
+        for seg in self._segments.values():
+            if seg.size:
+                mask = seg.doc_ids[: seg.size] != document_id
+                if mask.all():
+                    continue
+                self._chunk_ids.difference_update(c.decode() for c in seg.chunk_ids[: seg.size][~mask].tolist())
+                seg.keep(mask)
+                self.changes += 1
+
+    def clear(self):
+        self._segments.clear()
+        self._chunk_ids.clear()
+        self._loaded_ids = []
+        self.changes += 1
+
+    def chunk_ids(self) -> np.ndarray:
+        """Chunk ids of all rows (S36; empty for rows without one)."""
+        parts = [seg.chunk_ids[: seg.size] for seg in self._segments.values()]
+        return np.concatenate(parts) if parts else np.empty(0, dtype="S36")
+
+    @contextmanager
+    def frozen(self) -> Iterator["FrozenIndex"]:
+        """Pin the index as it is now, for writing from another thread while it stays in use.
+
+        Enter and exit on the thread that mutates the index; only the yielded
+        view's `write` may run elsewhere.
+        """
+        segments = list(self._segments.items())
+        views = [(dim, seg.pin()) for dim, seg in segments]
+        try:
+            yield FrozenIndex(self.quantization, views)
+        finally:
+            for _, seg in segments:
+                seg.unpin()
+
+    def write(self, path: str):
+        """Save the index under `path` (a new directory) for `load`."""
+        with self.frozen() as view:
+            view.write(path)
+
+    def load(self, path: str):
+        """Replace the contents with the index saved under `path`, memory-mapped."""
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT:
+            raise ValueError(f"unsupported vector snapshot format {meta.get('format')}")
+        if meta["quantization"] != self.quantization:
+            raise ValueError(f"snapshot quantization {meta['quantization']!r} differs from {self.quantization!r}")
+        segments = {m["dim"]: _Segment.load(os.path.join(path, f"d{m['dim']}"), m, self.quantization, self.spill_dir)
+                    for m in meta["segments"]}
+        self._segments = segments
+        self._chunk_ids = set()
+        self._loaded_ids = [np.load(os.path.join(path, f"d{dim}", "chunk_sorted.npy"), mmap_mode="r") for dim in segments]
+        for seg in segments.values():
+            self._maybe_train(seg)
+
+    def search(self, qvec: Sequence[float], top_k: int, document_ids: Optional[List[int]] = None) -> List[Dict]:
+        seg = self._segments.get(len(qvec))
+        if seg is None or seg.size == 0 or top_k <= 0:
+            return []
+        q = np.asarray(qvec, dtype=np.float32)
+        q /= float(np.linalg.norm(q)) or 1.0
+        rows = mask = None
+        candidates = seg.size
+        if document_ids:
+            mask = np.isin(seg.doc_ids[: seg.size], np.asarray(document_ids, dtype=np.int32))
+            candidates = int(np.count_nonzero(mask))
+            if candidates == 0:
+                return []
+        scores = None
+        # Probe the IVF lists unless gathering the filtered rows costs less than scanning the probed slices.
+        if seg.centroids is not None and candidates * GATHER_COST > self.ann_probes * seg.size / len(seg.centroids):
+            ranges, tail = seg.probe(q, self.ann_probes)
+            probed = np.concatenate([np.arange(a, b) for a, b in ranges] + [tail])
+            if mask is not None:
+                probed = probed[mask[probed]]
+            if probed.size >= min(top_k, candidates):
+                if mask is None:
+                    scores = seg.range_scores(q, ranges, tail)
+                rows, mask, candidates = probed, None, probed.size
+        if mask is not None:
+            rows = np.flatnonzero(mask)
+            if rows.size * 4 < seg.size:
+                mask = None
+            else:
+                # Gathering most rows copies most of the matrix; score all of them and drop the rest instead.
+                rows = None
+        if scores is None:
+            scores = seg.scores(q, rows)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        k = min(top_k, candidates)
+        # Quantized scores only pick candidates; the best `rescore` x k get exact scores.
+        n = k if seg.codes is None else min(candidates, k * self.rescore)
+        top = np.argpartition(-scores, n - 1)[:n]
+        picked = rows[top] if rows is not None else top
+        if seg.codes is None:
+            order = np.argsort(-scores[top])
+            picked, final = picked[order], scores[top][order]
+        else:
+            picked = np.sort(picked)  # ascending rows read the spilled vectors sequentially
+            exact = seg.vectors[picked] @ q
+            order = np.argsort(-exact)[:k]
+            picked, final = picked[order], exact[order]
+        out: List[Dict] = []
+        for row, score in zip(picked, final):
+            row = int(row)
+            out.append({
+                "score": float(score),
+                "text": seg.texts[int(seg.text_refs[row])],
+                "page": int(seg.pages[row]),
+                "document_id": int(seg.doc_ids[row]),
+                "chunk_id": seg.chunk_ids[row].decode() or None,
+            })
+        return out
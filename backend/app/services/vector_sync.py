@@ -0,0 +1,115 @@
+"""Keeps the fallback vector index across restarts.
+
+On startup `restore` memory-maps the CURRENT snapshot under `vector_index_dir`
+into the (still empty) index and drops chunks whose rows have left the chunks
+table since it was written. `save` pins the index as it is (see
+`VectorIndex.frozen`), writes that view as a new version on the I/O pool and
+publishes it; searches and mutations go on meanwhile without waiting. It runs
+at shutdown and, with `vector_snapshot_s` > 0, periodically while the
+index keeps changing. Versions are laid out and published like the lexical
+snapshots (see `lexical_snapshot`).
+
+Embeddings are not stored in the chunks table, so unlike the keyword index
+this one cannot catch up: chunks ingested by a worker that never saved stay
+out of the fallback index until they are ingested again. With several workers
+the last one to save wins.
+"""
+from __future__ import annotations
+from typing import Dict, Optional
+import asyncio
+import os
+import shutil
+import time
+import uuid
+import numpy as np
+from loguru import logger
+from app.core import executors
+from app.core.config import get_settings
+from . import lexical_snapshot, lexical_sync
+from .vector_index import VectorIndex
+
+settings = get_settings()
+
+_snapshot_task: Optional[asyncio.Task] = None
+# `VectorIndex.changes` when the index last matched a snapshot.
+_saved_changes: Optional[int] = None
+
+
+def _publish(directory: str, staging: str) -> str:
+    with lexical_snapshot.locked(directory):
+        return lexical_snapshot.publish(directory, staging)
+
+
+async def restore(index: VectorIndex) -> Dict:
+    """Map the current snapshot into `index` (when it is empty) and drop chunks deleted since."""
+    global _saved_changes
+    directory = settings.vector_index_dir
+    if not directory:
+        return {"mode": "disabled"}
+    path = lexical_snapshot.current(directory)
+    if path is None or len(index):
+        _saved_changes = index.changes
+        return {"mode": "skipped" if path else "empty", "chunks": len(index)}
+    t0 = time.perf_counter()
+    await executors.run_io(index.load, path)
+    live = index.chunk_ids()
+    gone = live[~np.isin(live, await lexical_sync.db_chunk_ids())] if live.size else live
+    index.delete_chunks([g.decode() for g in gone.tolist() if g])
+    _saved_changes = index.changes
+    stats = {"mode": "mapped", "version": os.path.basename(path), "chunks": len(index), "removed": int(gone.size),
+             "seconds": round(time.perf_counter() - t0, 3)}
+    logger.info(f"Vector index ready: {stats}")
+    return stats
+
+
+async def save(index: VectorIndex) -> Optional[str]:
+    """Write and publish a snapshot if the index changed since the last one; returns its path."""
+    global _saved_changes
+    directory = settings.vector_index_dir
+    changes = index.changes
+    if not directory or changes == _saved_changes:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    staging = os.path.join(directory, f".build-{uuid.uuid4().hex}")
+    try:
+        with index.frozen() as view:
+            await executors.run_io(view.write, staging)
+        path = await executors.run_io(_publish, directory, staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _saved_changes = changes
+    return path
+
+
+async def _snapshot_loop(index: VectorIndex):
+    while True:
+        await asyncio.sleep(settings.vector_snapshot_s)
+        try:
+            await save(index)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # pragma: no cover
+            logger.warning(f"Vector index snapshot failed: {e}")
+
+
+def start_snapshots(index: VectorIndex):
+    global _snapshot_task
+    if settings.vector_snapshot_s > 0 and settings.vector_index_dir and _snapshot_task is None:
+        _snapshot_task = asyncio.create_task(_snapshot_loop(index))
+
+
+async def stop_snapshots(index: VectorIndex):
+    """Stop the periodic snapshots and write a final one."""
+    global _snapshot_task
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+        try:
+            await _snapshot_task
+        except asyncio.CancelledError:
+            pass
+        _snapshot_task = None
+    try:
+        await save(index)
+    except Exception as e:
+        logger.warning(f"Vector index snapshot failed: {e}")
@@ -0,0 +1,114 @@
+"""Latency and recall of the IVF fallback vector index versus the exact scan.
+
+Usage (from backend/):
+
+python -m scripts.bench_ann --chunks 200000 --dim 768 --probes 4 8 16 32 64
+python -m scripts.bench_ann --quantization int8
+
+Builds `VectorIndex` over --chunks synthetic embeddings (see
+`bench_quantization.make_vectors`), once as the exact scan (`ann_min_rows` 0)
+and once partitioned into IVF lists trained when --ann-min-rows vectors are
+in (as `vector_ann_min_rows` does), and reports:
+
+  build     seconds to add all vectors in batches of 10k (IVF: including k-means training)
+  write     seconds to write a snapshot, and its size
+  load      seconds to map the snapshot back, and RSS growth while loading
+  search    p50/p99 latency and recall@k against exact search, for each --probes value,
+            unfiltered and restricted to 10% of the documents
+"""
+from __future__ import annotations
+import argparse, os, shutil, tempfile, time
+import numpy as np
+from scripts.bench_common import ensure_env, percentile, rss_mb
+
+ensure_env()
+
+from app.services.vector_index import VectorIndex  # noqa: E402
+from scripts.bench_quantization import make_vectors  # noqa: E402
+
+
+def dir_mb(path: str) -> float:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files) / 2**20
+
+
+def timed_searches(index: VectorIndex, queries, k: int, document_ids=None):
+    hits, latencies = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        hits.append({int(h["chunk_id"]) for h in index.search(q, k, document_ids)})
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return hits, latencies
+
+
+def row(label: str, latencies, recall=None):
+    tail = f"  recall {recall:.3f}" if recall is not None else ""
+    print(f"{label:<24} p50 {percentile(latencies, 50):>8.2f} ms  p99 {percentile(latencies, 99):>8.2f} ms{tail}")
+
+
+def build(args, vectors, chunks, ann_min_rows: int) -> VectorIndex:
+    index = VectorIndex(args.quantization, ann_min_rows=ann_min_rows, ann_lists=args.lists)
+    t0 = time.perf_counter()
+    for start in range(0, len(vectors), 10_000):
+        index.add(vectors[start:start + 10_000], chunks[start:start + 10_000])
+    label = "ivf" if ann_min_rows else "exact"
+    print(f"build {label:<18} {time.perf_counter() - t0:>8.1f} s")
+    return index
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--data", choices=["spectrum", "clusters", "gaussian"], default="spectrum")
+    ap.add_argument("--documents", type=int, default=2_000)
+    ap.add_argument("--quantization", choices=["none", "int8", "binary"], default="none")
+    ap.add_argument("--ann-min-rows", type=int, default=50_000, help="rows at which the lists are trained")
+    ap.add_argument("--lists", type=int, default=0, help="IVF lists (0 = automatic)")
+    ap.add_argument("--probes", type=int, nargs="+", default=[4, 8, 16, 32, 64])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=10)
+    args = ap.parse_args()
+    rng = np.random.default_rng(11)
+    vectors = make_vectors(args.data, args.chunks + args.queries, args.dim, rng)
+    vectors, queries = vectors[: args.chunks], vectors[args.chunks:]
+    chunks = [{"chunk_id": str(i), "document_id": i % args.documents + 1, "text": f"chunk {i}"} for i in range(args.chunks)]
+    scope = list(range(1, args.documents // 10 + 1))
+    print(f"{args.chunks} x {args.dim}-d {args.data} vectors, {args.queries} queries, top-{args.top_k}, {args.quantization}")
+
+    exact = build(args, vectors, chunks, 0)
+    truth, latencies = timed_searches(exact, queries, args.top_k)
+    row("exact", latencies)
+    scoped_truth, latencies = timed_searches(exact, queries, args.top_k, scope)
+    row("exact, 10% docs", latencies)
+    del exact
+
+    index = build(args, vectors, chunks, args.ann_min_rows)
+    seg = next(iter(index._segments.values()))
+    print(f"ivf lists {len(seg.centroids)}, {seg.size / len(seg.centroids):.0f} vectors per list")
+    for probes in args.probes:
+        index.ann_probes = probes
+        for label, want, document_ids in (("", truth, None), (", 10% docs", scoped_truth, scope)):
+            hits, latencies = timed_searches(index, queries, args.top_k, document_ids)
+            recall = np.mean([len(h & w) / args.top_k for h, w in zip(hits, want)])
+            row(f"ivf probes={probes}{label}", latencies, recall)
+
+    directory = tempfile.mkdtemp(prefix="bench-ann-")
+    try:
+        path = os.path.join(directory, "v1")
+        t0 = time.perf_counter()
+        index.write(path)
+        print(f"write {time.perf_counter() - t0:>23.1f} s  {dir_mb(path):.0f} MiB")
+        del index, seg
+        before = rss_mb()
+        t0 = time.perf_counter()
+        loaded = VectorIndex(args.quantization, ann_min_rows=args.ann_min_rows, ann_probes=args.probes[len(args.probes) // 2])
+        loaded.load(path)
+        print(f"load {time.perf_counter() - t0:>24.3f} s  RSS +{rss_mb() - before:.0f} MiB")
+        hits, latencies = timed_searches(loaded, queries, args.top_k)
+        row(f"mapped probes={loaded.ann_probes}", latencies, np.mean([len(h & w) / args.top_k for h, w in zip(hits, truth)]))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Chunking throughput and peak memory: streaming chunker versus the old join-and-split.
+
+Usage (from backend/):
+
+python -m scripts.bench_chunking --pages 1000 --page-chars 3000
+
+Peak memory is the tracemalloc peak of the chunking call alone (the page list
+is built beforehand). "streaming" consumes `iter_chunks` without keeping the
+chunks, which is the memory floor; "list" keeps them like `chunk_pages`.
+"""
+from __future__ import annotations
+import argparse, random, time, tracemalloc
+from scripts.bench_common import ensure_env
+
+ensure_env()
+
+from app.core.config import get_settings  # noqa: E402
+from app.services.chunking import iter_chunks, chunk_pages  # noqa: E402
+
+settings = get_settings()
+
+
+def legacy_chunk_pages(pages):
+    """The former implementation: join every page, split, page=0 everywhere."""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=settings.chunk_size, chunk_overlap=settings.chunk_overlap,
+        separators=["\n\n", "\n", ". ", ".", "?", "!", " "],
+    )
+    joined = "\n".join(p["text"] for p in pages)
+    return [{"position": i, "text": t, "page": 0} for i, t in enumerate(splitter.split_text(joined))]
+
+
+def make_pages(n: int, chars: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = [f"w{i}" for i in range(5000)]
+    pages = []
+    for i in range(n):
+        parts, size = [], 0
+        while size < chars:
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(6, 20))) + (". " if rng.random() < 0.8 else ".\n\n")
+            parts.append(sentence)
+            size += len(sentence)
+        pages.append({"page": i + 1, "text": "".join(parts)})
+    return pages
+
+
+def measure(fn, pages):
+    # Timed and traced in separate runs: tracemalloc slows allocation-heavy code.
+    t0 = time.perf_counter()
+    n = fn(pages)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn(pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return n, elapsed, peak / (1024 * 1024)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=1000)
+    ap.add_argument("--page-chars", type=int, default=3000)
+    args = ap.parse_args()
+    pages = make_pages(args.pages, args.page_chars)
+    mb = sum(len(p["text"]) for p in pages) / (1024 * 1024)
+    print(f"{args.pages} pages, {mb:.1f} MiB of text, chunk_size={settings.chunk_size} overlap={settings.chunk_overlap}")
+    modes = [
+        ("legacy", lambda ps: len(legacy_chunk_pages(ps))),
+        ("list", lambda ps: len(chunk_pages(ps))),
+        ("streaming", lambda ps: sum(1 for _ in iter_chunks(ps))),
+    ]
+    for label, fn in modes:
+        n, elapsed, peak = measure(fn, pages)
+        print(f"{label:<10} chunks {n:>7}  {mb / elapsed:>7.1f} MB/s  peak {peak:>8.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+"""Shared helpers for the offline benchmark scripts.
+
+Benchmarks import the app modules directly, so `ensure_env()` must run before
+any `app.*` import to give Settings dummy values for the required fields.
+"""
+from __future__ import annotations
+import json, math, os, resource, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # socketserver's default backlog of 5 refuses bursts of concurrent connects
+
+
+def ensure_env():
+    os.environ.setdefault("QDRANT_URL", "http://127.0.0.1:6333")
+    os.environ.setdefault("MINIO_ENDPOINT", "http://127.0.0.1:9000")
+    os.environ.setdefault("MINIO_ROOT_USER", "bench")
+    os.environ.setdefault("MINIO_ROOT_PASSWORD", "bench")
+    os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///./bench.db")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are kept in `resolution_ms` units; every power of two is split into
+    `sub_buckets` linear buckets, so a reported percentile is within
+    1/sub_buckets of the true value (about 1.6% with the default 64) at any
+    magnitude, in constant memory and mergeable across runs.
+    """
+
+    def __init__(self, sub_buckets: int = 64, resolution_ms: float = 0.01):
+        self.sub = 1 << max(1, (sub_buckets - 1).bit_length())
+        self.resolution_ms = resolution_ms
+        self.counts: dict = {}
+        self.total = 0
+        self.max_ms = 0.0
+
+    def _index(self, value: int) -> int:
+        shift = max(0, value.bit_length() - self.sub.bit_length())
+        return shift * self.sub + (value >> shift)
+
+    def _upper_ms(self, index: int) -> float:
+        shift = max(0, index // self.sub - 1)
+        mantissa = index - shift * self.sub
+        return (((mantissa + 1) << shift) - 1) * self.resolution_ms
+
+    def record(self, ms: float):
+        idx = self._index(max(0, int(ms / self.resolution_ms)))
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.total += 1
+        self.max_ms = max(self.max_ms, ms)
+
+    def merge(self, other: "LatencyHistogram"):
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        self.total += other.total
+        self.max_ms = max(self.max_ms, other.max_ms)
+
+    def percentile(self, pct: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(pct / 100.0 * self.total))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(self._upper_ms(idx), self.max_ms)
+        return self.max_ms
+
+    def summary(self) -> dict:
+        out = {f"p{p:g}_ms": round(self.percentile(p), 3) for p in (50, 90, 95, 99, 99.9)}
+        out.update(count=self.total, max_ms=round(self.max_ms, 3))
+        return out
+
+    def buckets(self) -> List[List[float]]:
+        """[[upper bound ms, count], ...] for the non-empty buckets."""
+        return [[round(self._upper_ms(i), 3), self.counts[i]] for i in sorted(self.counts)]
+
+    def render(self, width: int = 40, rows: int = 12) -> str:
+        """Text histogram over `rows` log-spaced ranges."""
+        if not self.total:
+            return "(empty)"
+        lo = max(self.resolution_ms, min(self._upper_ms(i) for i in self.counts))
+        hi = max(lo * 1.0001, self.max_ms)
+        edges = [lo * (hi / lo) ** (k / rows) for k in range(rows + 1)]
+        bins = [0] * rows
+        for idx, n in self.counts.items():
+            v = min(self._upper_ms(idx), self.max_ms)
+            k = next((j for j in range(rows) if v <= edges[j + 1]), rows - 1)
+            bins[k] += n
+        peak = max(bins) or 1
+        return "\n".join(
+            f"  <= {edges[k + 1]:>9.1f} ms {bins[k]:>7} {'#' * max(1 if bins[k] else 0, round(width * bins[k] / peak))}"
+            for k in range(rows)
+        )
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (Linux /proc, falls back to peak RSS)."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class MockGeminiServer:
+    """Threaded local HTTP server imitating the Gemini REST endpoints we call.
+
+    `latency_s` is added to every request; `max_rps` (if set) makes the server
+    answer 429 once more than that many requests arrive within one second.
+    With `tls=True` it serves HTTPS with a throwaway self-signed certificate
+    whose path is `cert_file` (point SSL_CERT_FILE at it); `connections`
+    counts accepted connections, i.e. TCP+TLS handshakes. Generation produces
+    `answer_tokens` words at `token_delay_s` each: streamGenerateContent sends
+    them as SSE events as they are "generated", generateContent after all.
+    `vector_fn` replaces the placeholder embeddings (e.g. with `hash_embed`).
+    """
+
+    def __init__(self, latency_s: float = 0.02, dim: int = 768, max_rps: float | None = None, tls: bool = False,
+                 answer_tokens: int = 40, token_delay_s: float = 0.0, vector_fn: Callable[[str], List[float]] | None = None):
+        self.latency_s = latency_s
+        self.vector_fn = vector_fn
+        self.answer_tokens = answer_tokens
+        self.token_delay_s = token_delay_s
+        self.dim = dim
+        self.max_rps = max_rps
+        self.requests = 0
+        self.rate_limited = 0
+        self.connections = 0
+        self.cert_file: str | None = None
+        self._window: List[float] = []
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._tmpdir = None
+        if tls:
+            self._wrap_tls()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def _wrap_tls(self):
+        import datetime, ssl, tempfile
+        from cryptography import x509
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.x509.oid import NameOID
+        import ipaddress
+
+        key = ec.generate_private_key(ec.SECP256R1())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+        now = datetime.datetime.now(datetime.timezone.utc)
+        cert = (
+            x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(minutes=5)).not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(key, hashes.SHA256())
+        )
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.cert_file = os.path.join(self._tmpdir.name, "cert.pem")
+        key_file = os.path.join(self._tmpdir.name, "key.pem")
+        with open(self.cert_file, "wb") as f:
+            f.write(cert.public_bytes(serialization.Encoding.PEM))
+        with open(key_file, "wb") as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(self.cert_file, key_file)
+        ctx.set_alpn_protocols(["http/1.1"])
+        self._server.socket = ctx.wrap_socket(self._server.socket, server_side=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        scheme = "https" if self.cert_file else "http"
+        return f"{scheme}://{host}:{port}/v1beta"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+
+    def _admit(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            if not self.max_rps:
+                return True
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.max_rps:
+                self.rate_limited += 1
+                return False
+            self._window.append(now)
+            return True
+
+    def _answer(self) -> str:
+        return " ".join(f"token{i}" for i in range(self.answer_tokens)) + "."
+
+    def _vector(self, text: str) -> List[float]:
+        if self.vector_fn is not None:
+            return self.vector_fn(text)
+        seed = (hash(text) % 997) / 997.0
+        return [seed] * self.dim
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are separate writes
+
+            def setup(self):
+                with mock._lock:
+                    mock.connections += 1
+                super().setup()
+
+            def log_message(self, *args):  # silence per-request logging
+                pass
+
+            def _send(self, status: int, body: dict, headers: dict | None = None):
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(mock.latency_s)
+                if not mock._admit():
+                    self._send(429, {"error": {"code": 429, "message": "quota"}}, {"Retry-After": "0.2"})
+                    return
+                action = self.path.split("?")[0].rsplit(":", 1)[-1]
+                if action == "batchEmbedContents":
+                    embeddings = [{"values": mock._vector(r["content"]["parts"][0]["text"])} for r in payload.get("requests", [])]
+                    self._send(200, {"embeddings": embeddings})
+                elif action == "embedContent":
+                    self._send(200, {"embedding": {"values": mock._vector(payload["content"]["parts"][0]["text"])}})
+                elif action == "generateContent":
+                    time.sleep(mock.token_delay_s * mock.answer_tokens)
+                    text = json.dumps({"answer": mock._answer(), "answer_type": "factual", "sources": ["page:1"]})
+                    self._send(200, {"candidates": [{"content": {"parts": [{"text": text}]}}]})
+                elif action == "streamGenerateContent":
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    words = mock._answer().split(" ")
+                    pieces = [w + " " for w in words] + ['\n###META {"answer_type": "factual", "sources": ["page:1"]}']
+                    for piece in pieces:
+                        time.sleep(mock.token_delay_s)
+                        event = {"candidates": [{"content": {"parts": [{"text": piece}]}}]}
+                        self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode())
+                        self.wfile.flush()
+                    self.close_connection = True
+                else:
+                    self._send(404, {"error": {"code": 404, "message": f"unknown action {action}"}})
+
+        return Handler
+
+
+class MockQdrantServer:
+    """Threaded local HTTP server answering the Qdrant REST calls `retrieval` makes.
+
+    Points live in a `VectorIndex` (pass the app's `retrieval._MEM_INDEX` to
+    share one copy), so searches are an exact NumPy scan rather than HNSW, but
+    they go through the real `AsyncQdrantClient` request/response path.
+    Supported: list/create/delete collection, payload index creation (a
+    no-op), upsert, search (with a `document_id` match filter) and delete by
+    point ids. `load` seeds the
+    index directly, skipping JSON for large corpora.
+    """
+
+    def __init__(self, index, latency_s: float = 0.0):
+        self.index = index
+        self.latency_s = latency_s
+        self.collections: set = set()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def load(self, collection: str, vectors, chunks: List[dict]):
+        with self._lock:
+            self.collections.add(collection)
+            self.index.add(vectors, chunks)
+
+    def _search(self, body: dict) -> List[dict]:
+        document_ids = None
+        for cond in ((body.get("filter") or {}).get("must") or []):
+            if cond.get("key") == "document_id":
+                match = cond.get("match") or {}
+                document_ids = match.get("any") or ([match["value"]] if "value" in match else None)
+        hits = self.index.search(body["vector"], int(body.get("limit", 10)), document_ids)
+        return [
+            {"id": h["chunk_id"], "version": 0, "score": h["score"],
+             "payload": {"text": h["text"], "page": h["page"], "document_id": h["document_id"], "chunk_id": h["chunk_id"]}}
+            for h in hits
+        ]
+
+    def _handler(self):
+        mock = self
+        done = {"operation_id": 0, "status": "completed"}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body are separate writes
+
+            def log_message(self, *args):  # silence per-request logging
+                pass
+
+            def _send(self, status: int, result):
+                raw = json.dumps({"result": result, "status": "ok", "time": 0.0}).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def _route(self, method: str):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(mock.latency_s)
+                with mock._lock:
+                    mock.requests += 1
+                parts = self.path.split("?")[0].strip("/").split("/")
+                if parts == ["collections"] and method == "GET":
+                    return self._send(200, {"collections": [{"name": n} for n in sorted(mock.collections)]})
+                if len(parts) < 2 or parts[0] != "collections":
+                    return self._send(404, None)
+                name, rest = parts[1], parts[2:]
+                if not rest:
+                    if method == "PUT":
+                        mock.collections.add(name)
+                    elif method == "DELETE":
+                        mock.collections.discard(name)
+                        mock.index.clear()
+                    return self._send(200, True)
+                if name not in mock.collections:
+                    return self._send(404, None)
+                if rest == ["index"] and method == "PUT":
+                    return self._send(200, done)
+                if rest == ["points"] and method == "PUT":
+                    points = body.get("points") or []
+                    with mock._lock:
+                        mock.index.add([p["vector"] for p in points], [{**(p.get("payload") or {}), "chunk_id": str(p["id"])} for p in points])
+                    return self._send(200, done)
+                if rest == ["points", "search"]:
+                    return self._send(200, mock._search(body))
+                if rest == ["points", "delete"]:
+                    with mock._lock:
+                        mock.index.delete_chunks([str(i) for i in body.get("points") or []])
+                    return self._send(200, done)
+                return self._send(404, None)
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_PUT(self):
+                self._route("PUT")
+
+            def do_POST(self):
+                self._route("POST")
+
+            def do_DELETE(self):
+                self._route("DELETE")
+
+        return Handler
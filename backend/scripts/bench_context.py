@@ -0,0 +1,115 @@
+"""Prompt size before and after context packing (services/context.py) on a sample corpus.
+
+Usage (from backend/):
+
+python -m scripts.bench_context --documents 200 --top-k 5 10 20
+
+Builds documents of Zipf-vocabulary sentences, adds lightly edited copies of
+--dup-ratio of them (the same policy filed twice, a revised version), chunks
+everything with the app's chunker (`chunk_size`/`chunk_overlap` from the
+settings) and indexes it in a `LexicalIndex`. For each query (a phrase from
+a random chunk, so neighbouring and copied chunks compete for the top
+ranks) the top-k chunks are turned into prompt context two ways:
+
+  old   every chunk cut to 800 characters and joined (the previous _context_text)
+  new   context.pack: overlap stitching, near-duplicate removal, token budget
+
+and the estimated context tokens, the share of queries where packing merged
+or dropped something and the packing time are reported. --budget 0 measures
+stitching and deduplication alone (unlimited budget).
+"""
+from __future__ import annotations
+import argparse, time
+import numpy as np
+from scripts.bench_common import ensure_env, percentile
+
+ensure_env()
+
+from app.services import chunking, context  # noqa: E402
+from app.services.lexical import LexicalIndex  # noqa: E402
+
+
+def make_documents(n: int, sentences: int, vocab: int, rng: np.random.Generator):
+    words = np.array([f"w{i}" for i in range(vocab)])
+    docs = []
+    for _ in range(n):
+        lengths = rng.integers(8, 24, size=sentences)
+        text = " ".join(
+            " ".join(words[np.minimum(rng.zipf(1.2, size=k), vocab) - 1]).capitalize() + "." for k in lengths
+        )
+        docs.append(text)
+    return docs
+
+
+def edited_copy(text: str, rng: np.random.Generator, edits: int = 3) -> str:
+    tokens = text.split(" ")
+    for i in rng.integers(0, len(tokens), size=edits):
+        tokens[int(i)] = "revised"
+    return " ".join(tokens)
+
+
+def old_context(chunks) -> str:
+    return "\n---\n".join(f"[p{c['page']}] {c['text'][:800]}" for c in chunks)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--documents", type=int, default=200)
+    ap.add_argument("--sentences", type=int, default=120, help="sentences per document")
+    ap.add_argument("--vocab", type=int, default=20_000)
+    ap.add_argument("--dup-ratio", type=float, default=0.3)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--top-k", type=int, nargs="+", default=[5, 10, 20])
+    ap.add_argument("--budget", type=int, default=None, help="token budget (default: CONTEXT_TOKEN_BUDGET; 0 = unlimited)")
+    args = ap.parse_args()
+    rng = np.random.default_rng(11)
+
+    docs = make_documents(args.documents, args.sentences, args.vocab, rng)
+    for i in rng.choice(len(docs), size=int(len(docs) * args.dup_ratio), replace=False):
+        docs.append(edited_copy(docs[int(i)], rng))
+    chunks = []
+    for doc_id, text in enumerate(docs, 1):
+        pages = [{"page": p + 1, "text": text[start:start + 3000]} for p, start in enumerate(range(0, len(text), 3000))]
+        for ch in chunking.chunk_pages(pages):
+            ch["document_id"] = doc_id
+            ch["chunk_id"] = f"{doc_id}-{ch['position']}"
+            chunks.append(ch)
+    index = LexicalIndex()
+    index.add(chunks)
+    by_id = {c["chunk_id"]: c for c in chunks}
+    budget = None if args.budget is None else (args.budget or 10**9)
+    print(f"{len(docs)} documents ({args.dup_ratio:.0%} edited copies), {len(chunks)} chunks; "
+          f"chunk_size={chunking.settings.chunk_size} overlap={chunking.settings.chunk_overlap} "
+          f"budget={'unlimited' if budget == 10**9 else budget or context.settings.context_token_budget} tokens")
+
+    queries = []
+    for i in rng.integers(0, len(chunks), size=args.queries):
+        tokens = chunks[int(i)]["text"].split()
+        start = int(rng.integers(0, max(1, len(tokens) - 6)))
+        queries.append(" ".join(tokens[start:start + 6]))
+
+    print(f"{'top_k':>5}  {'old tokens':>10}  {'new tokens':>10}  {'reduction':>9}  {'merged':>7}  {'deduped':>7}  "
+          f"{'dropped':>7}  {'pack p50':>9}  {'pack p99':>9}")
+    for k in args.top_k:
+        old_tokens, new_tokens, pack_ms = [], [], []
+        merged = deduped = dropped = 0
+        for q in queries:
+            hits = [dict(by_id[h["chunk_id"]]) for h in index.search(q, k)]
+            if not hits:
+                continue
+            old_tokens.append(context.estimate_tokens(old_context(hits)))
+            t0 = time.perf_counter()
+            passages, stats = context.pack(hits, budget)
+            pack_ms.append((time.perf_counter() - t0) * 1000)
+            new_tokens.append(context.estimate_tokens(context.render(passages)))
+            merged += stats["merged"] > 0
+            deduped += stats["duplicates"] > 0
+            dropped += stats["dropped"] + stats["truncated"] > 0
+        n = len(old_tokens)
+        old_mean, new_mean = float(np.mean(old_tokens)), float(np.mean(new_tokens))
+        print(f"{k:>5}  {old_mean:>10.0f}  {new_mean:>10.0f}  {1 - new_mean / old_mean:>9.1%}  {merged / n:>7.0%}  "
+              f"{deduped / n:>7.0%}  {dropped / n:>7.0%}  {percentile(pack_ms, 50):>7.2f}ms  {percentile(pack_ms, 99):>7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
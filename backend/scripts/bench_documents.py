@@ -0,0 +1,128 @@
+"""Latency and memory of document listing and status counts on a large documents table.
+
+Usage (from backend/):
+
+python -m scripts.bench_documents --documents 100000 --text-kb 1
+
+Fills a scratch SQLite database with --documents rows (statuses mostly
+"ingested", some "error" and in-flight ones) and, with --text-kb, a legacy
+`aggregated_text` column of that size per row, the way documents were stored
+before the text moved to `document_texts`. It then times, in-process:
+
+  old list         every Document row as ORM objects (the unpaginated /documents)
+  old list+text    the same with the wide legacy row (SELECT *)
+  old counts       every (status, id) pair counted in Python (the old /diagnostics)
+  GET /documents   first page, a page deep in the table, a status-filtered page
+  GET /diagnostics GROUP BY status plus the in-memory stats
+
+Each row reports p50/p99 over --repeat runs and the RSS growth of the first run.
+"""
+from __future__ import annotations
+import argparse, asyncio, gc, os, sqlite3, tempfile, time
+from scripts.bench_common import ensure_env, percentile, rss_mb
+
+ensure_env()
+DB_PATH = os.path.join(tempfile.gettempdir(), "bench_documents.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+import httpx  # noqa: E402
+from sqlalchemy import select, text  # noqa: E402
+from app.db.session import engine, Base, SessionLocal  # noqa: E402
+from app.db import models  # noqa: E402
+from app.main import app  # noqa: E402
+
+STATUSES = ["ingested"] * 90 + ["error"] * 6 + ["queued", "parsing", "embedding", "indexing"]
+
+
+def fill(n: int, text_kb: int, batch: int = 20_000):
+    conn = sqlite3.connect(DB_PATH)
+    if text_kb:
+        conn.execute("ALTER TABLE documents ADD COLUMN aggregated_text TEXT")
+    body = ("lorem ipsum dolor sit amet " * (text_kb * 40))[: text_kb * 1024] or None
+    for lo in range(0, n, batch):
+        rows = [
+            (i + 1, f"document-{i}.pdf", "application/pdf", f"obj/{i}", STATUSES[i % len(STATUSES)], body)
+            for i in range(lo, min(lo + batch, n))
+        ]
+        conn.executemany(
+            "INSERT INTO documents (id, filename, content_type, original_path, status, created_at, updated_at"
+            + (", aggregated_text" if text_kb else "") + ") VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP"
+            + (", ?)" if text_kb else ")"),
+            [r if text_kb else r[:-1] for r in rows],
+        )
+        conn.commit()
+    conn.close()
+
+
+async def old_list():
+    async with SessionLocal() as session:
+        res = await session.execute(select(models.Document).order_by(models.Document.created_at.desc()))
+        return len(res.scalars().all())
+
+
+async def old_list_wide():
+    async with SessionLocal() as session:
+        res = await session.execute(text("SELECT * FROM documents ORDER BY created_at DESC"))
+        return len(res.fetchall())
+
+
+async def old_counts():
+    async with SessionLocal() as session:
+        rows = (await session.execute(select(models.Document.status, models.Document.id))).fetchall()
+    by_status: dict = {}
+    for st, _id in rows:
+        by_status[st] = by_status.get(st, 0) + 1
+    return len(rows)
+
+
+async def measure(label: str, fn, repeat: int):
+    gc.collect()
+    before = rss_mb()
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    print(f"{label:<28} p50 {percentile(latencies, 50):>9.2f} ms  p99 {percentile(latencies, 99):>9.2f} ms  "
+          f"rss +{rss_mb() - before:>7.1f} MiB")
+
+
+async def main_async(args):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    t0 = time.perf_counter()
+    fill(args.documents, args.text_kb)
+    print(f"{args.documents} documents ({args.text_kb} KiB legacy text each) written in {time.perf_counter() - t0:.1f}s")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def get(path, **params):
+            r = await client.get(path, params=params)
+            r.raise_for_status()
+
+        middle = args.documents // 2
+        await measure("GET /documents", lambda: get("/documents"), args.repeat)
+        await measure("GET /documents deep page", lambda: get("/documents", before=middle), args.repeat)
+        await measure("GET /documents?status=error", lambda: get("/documents", status="error", before=middle), args.repeat)
+        await measure("GET /diagnostics", lambda: get("/diagnostics"), args.repeat)
+    await measure("old counts", old_counts, args.repeat)
+    await measure("old list", old_list, args.repeat)
+    if args.text_kb:
+        await measure("old list+text", old_list_wide, max(1, args.repeat // 5))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--documents", type=int, default=100_000)
+    ap.add_argument("--text-kb", type=int, default=1, help="legacy aggregated_text per row (0 to skip)")
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+    if os.path.exists(DB_PATH):
+        os.unlink(DB_PATH)
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        os.unlink(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Embedding throughput benchmark against a local mock Gemini server.
+
+Usage (from backend/):
+
+python -m scripts.bench_embeddings --chunks 400 --latency-ms 40 --mock-rps 20
+
+Compares a one-text-per-request, one-in-flight configuration (what ingestion
+used to do, paced at the old 150 ms per-chunk delay) with the batched,
+concurrent path and reports chunks/sec for each. Each configuration embeds
+fresh texts; the last run repeats the previous texts to show the warm
+embedding-cache path (memory tier only, nothing is written to disk).
+"""
+from __future__ import annotations
+import argparse, asyncio, time
+from scripts.bench_common import ensure_env, MockGeminiServer
+
+ensure_env()
+
+from app.core import runtime_state  # noqa: E402
+from app.services import embeddings  # noqa: E402
+
+
+async def run_config(label: str, texts: list[str], batch_size: int, concurrency: int, rps: float, burst: int, mock: MockGeminiServer):
+    s = embeddings.settings
+    s.embedding_batch_size = batch_size
+    s.embedding_max_concurrency = concurrency
+    s.embedding_requests_per_second = rps
+    s.embedding_burst = burst
+    before_req, before_429 = mock.requests, mock.rate_limited
+    t0 = time.perf_counter()
+    vecs = await embeddings.embed_texts(texts)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"{label:<34} {len(vecs) / elapsed:>10.1f} chunks/s  {elapsed:>7.2f}s  "
+        f"requests={mock.requests - before_req:<5} 429s={mock.rate_limited - before_429:<4} mode={getattr(vecs, '_embed_mode', '?')}"
+    )
+
+
+async def main_async(args):
+    def corpus(tag: str) -> list[str]:
+        return [f"{tag} chunk {i} " + "lorem ipsum dolor sit amet " * 30 for i in range(args.chunks)]
+
+    runtime_state.set_gemini_key("bench-key")
+    embeddings._cache = embeddings.EmbeddingCache()
+    with MockGeminiServer(latency_s=args.latency_ms / 1000.0, max_rps=args.mock_rps) as mock:
+        embeddings.settings.gemini_api_base = mock.base_url
+        print(f"{args.chunks} chunks, mock latency {args.latency_ms} ms, mock limit {args.mock_rps or 'none'} req/s")
+        await run_config("sequential (batch=1, inflight=1)", corpus("seq"), 1, 1, 1000 / 150, 1, mock)
+        await run_config(f"batched (batch={args.batch_size}, inflight={args.concurrency})", corpus("b100"), args.batch_size, args.concurrency, args.rps, args.burst, mock)
+        await run_config(f"batched (batch=20, inflight={args.concurrency})", corpus("b20"), 20, args.concurrency, args.rps, args.burst, mock)
+        await run_config("warm cache (repeat of batch=20)", corpus("b20"), 20, args.concurrency, args.rps, args.burst, mock)
+        print(f"cache: {embeddings.cache_stats()}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=400)
+    ap.add_argument("--latency-ms", type=float, default=40)
+    ap.add_argument("--mock-rps", type=float, default=None, help="Mock server answers 429 above this rate")
+    ap.add_argument("--batch-size", type=int, default=100)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--rps", type=float, default=5.0)
+    ap.add_argument("--burst", type=int, default=5)
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
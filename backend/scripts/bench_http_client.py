@@ -0,0 +1,75 @@
+"""Per-call httpx clients versus the shared pooled Gemini client, over TLS.
+
+Usage (from backend/):
+
+python -m scripts.bench_http_client --requests 400 --concurrency 8 --latency-ms 20
+
+Starts the mock Gemini server with a self-signed certificate and sends
+generateContent requests two ways: a new `httpx.AsyncClient` per request (as
+embeddings/rag used to) and `http_client.get_client()`. Reports throughput,
+latency percentiles and how many TCP+TLS handshakes the server saw. The
+stdlib mock only speaks HTTP/1.1, so GEMINI_HTTP2 is not exercised here.
+"""
+from __future__ import annotations
+import argparse, asyncio, os, time
+import httpx
+from scripts.bench_common import ensure_env, percentile, MockGeminiServer
+
+ensure_env()
+
+from app.core import http_client  # noqa: E402
+
+BODY = {"contents": [{"parts": [{"text": "What is the leave policy? " * 40}]}]}
+
+
+async def drive(label: str, post, args, mock: MockGeminiServer):
+    url = f"{mock.base_url}/models/mock:generateContent?key=bench"
+    sem = asyncio.Semaphore(args.concurrency)
+    latencies: list = []
+    before = mock.connections
+
+    async def one():
+        async with sem:
+            t0 = time.perf_counter()
+            r = await post(url)
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.requests)))
+    elapsed = time.perf_counter() - t0
+    print(
+        f"{label:<18} {args.requests / elapsed:>8.1f} req/s  p50 {percentile(latencies, 50):>7.1f} ms  "
+        f"p95 {percentile(latencies, 95):>7.1f} ms  handshakes {mock.connections - before}"
+    )
+
+
+async def main_async(args):
+    with MockGeminiServer(latency_s=args.latency_ms / 1000.0, tls=True) as mock:
+        os.environ["SSL_CERT_FILE"] = mock.cert_file or ""
+        print(f"{args.requests} requests, concurrency {args.concurrency}, mock latency {args.latency_ms} ms, TLS")
+
+        async def per_call(url):
+            async with httpx.AsyncClient(timeout=120) as client:
+                return await client.post(url, json=BODY)
+
+        await drive("per-call client", per_call, args, mock)
+
+        http_client.settings.gemini_max_connections = max(args.concurrency, 1)
+        await http_client.aclose()
+        await drive("shared pool", lambda url: http_client.get_client().post(url, json=BODY), args, mock)
+        print(f"pool stats: {http_client.pool_stats()}")
+        await http_client.aclose()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--latency-ms", type=float, default=20)
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Keyword search latency versus corpus size.
+
+Usage (from backend/):
+
+python -m scripts.bench_lexical --sizes 10000 100000 1000000
+
+Builds a synthetic corpus with a Zipf-distributed vocabulary, then times
+queries against the BM25 inverted index (`lexical.LexicalIndex`) and, up to
+--legacy-max chunks, against the former full-scan TF-IDF loop.
+"""
+from __future__ import annotations
+import argparse, collections, math, time
+import numpy as np
+from scripts.bench_common import ensure_env, percentile
+
+ensure_env()
+
+from app.services.lexical import LexicalIndex, tokenize  # noqa: E402
+
+
+def make_corpus(n: int, vocab: int, length: int, rng: np.random.Generator):
+    words = [f"w{i}" for i in range(vocab)]
+    ranks = np.minimum(rng.zipf(1.3, size=(n, length)), vocab) - 1
+    return [{"text": " ".join(words[j] for j in row), "document_id": i // 50, "page": i % 50} for i, row in enumerate(ranks)]
+
+
+class LegacyLexical:
+    """The per-query full scan `_lex_search` performed before the inverted index."""
+
+    def __init__(self, chunks):
+        self.chunks, self.tfs, self.df = [], [], collections.defaultdict(int)
+        for ch in chunks:
+            tf = collections.Counter(tokenize(ch["text"]))
+            self.chunks.append(ch)
+            self.tfs.append(tf)
+            for t in tf:
+                self.df[t] += 1
+
+    def search(self, query, top_k, document_ids=None):
+        q_set = set(tokenize(query))
+        total = len(self.chunks)
+        scored = []
+        for idx, (chunk, tf) in enumerate(zip(self.chunks, self.tfs)):
+            if document_ids and chunk.get("document_id") not in document_ids:
+                continue
+            score = 0.0
+            for term in q_set:
+                if term in tf:
+                    score += tf[term] * (math.log((1 + total) / (1 + self.df.get(term, 1))) + 1)
+            if score > 0:
+                scored.append((score, idx))
+        scored.sort(reverse=True)
+        return scored[:top_k]
+
+
+def time_queries(search, queries):
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        search(q)
+        lat.append((time.perf_counter() - t0) * 1000)
+    return lat
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--vocab", type=int, default=50_000)
+    ap.add_argument("--length", type=int, default=120, help="tokens per chunk")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--legacy-max", type=int, default=100_000)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    # Two mid-frequency terms plus one very common term per query.
+    queries = [f"w{rng.integers(50, 5000)} w{rng.integers(50, 5000)} w{rng.integers(0, 5)}" for _ in range(args.queries)]
+    print(f"vocab={args.vocab} tokens/chunk={args.length} queries={args.queries} top_k=5")
+    for n in args.sizes:
+        corpus = make_corpus(n, args.vocab, args.length, rng)
+        t0 = time.perf_counter()
+        index = LexicalIndex()
+        index.add(corpus)
+        build_s = time.perf_counter() - t0
+        lat = time_queries(lambda q: index.search(q, 5), queries)
+        print(f"{n:>9}  bm25-inverted  build {build_s:>7.1f}s  p50 {percentile(lat, 50):>8.2f} ms  p95 {percentile(lat, 95):>8.2f} ms")
+        if n <= args.legacy_max:
+            legacy = LegacyLexical(corpus)
+            lat_old = time_queries(lambda q: legacy.search(q, 5), queries[: max(5, args.queries // 10)])
+            print(f"{n:>9}  legacy-scan                     p50 {percentile(lat_old, 50):>8.2f} ms  p95 {percentile(lat_old, 95):>8.2f} ms")
+            del legacy
+        del index, corpus
+
+
+if __name__ == "__main__":
+    main()
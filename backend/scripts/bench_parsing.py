@@ -0,0 +1,73 @@
+"""PDF parsing/OCR throughput: serial versus page-range shards on a process pool.
+
+Usage (from backend/, needs the tesseract binary):
+
+python -m scripts.bench_parsing --pages 200 --workers 1 2 4 8 --dpi 150
+
+Builds a synthetic scanned PDF (every page is an image with no text layer,
+so each one goes through OCR), then times `parsing.parse_pdf` in-process and
+`parsing.parse_pdf_range` shards of --pages-per-task on pools of each size,
+reporting pages/s, speedup and speedup per core.
+"""
+from __future__ import annotations
+import argparse, multiprocessing, os, shutil, sys, tempfile, time
+from concurrent.futures import ProcessPoolExecutor
+from scripts.bench_common import ensure_env
+
+ensure_env()
+
+from app.core import executors  # noqa: E402
+from app.services import parsing  # noqa: E402
+
+
+def scanned_pdf(path: str, pages: int):
+    import fitz  # PyMuPDF
+    src = fitz.open()
+    page = src.new_page()
+    page.insert_textbox(fitz.Rect(54, 54, 558, 738), "Employees accrue two days of paid leave per month. " * 40, fontsize=11)
+    image = page.get_pixmap(dpi=150).tobytes("png")
+    doc = fitz.open()
+    for _ in range(pages):
+        doc.new_page().insert_image(fitz.Rect(0, 0, 612, 792), stream=image)
+    doc.save(path)
+
+
+def run_sharded(path: str, workers: int, pages_per_task: int, dpi: int, total: int) -> float:
+    ranges = parsing.page_ranges(total, pages_per_task)
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"), initializer=executors._init_cpu_worker) as pool:
+        list(pool.map(len, [[]] * workers))  # warm up workers before timing
+        t0 = time.perf_counter()
+        futures = [pool.submit(parsing.parse_pdf_range, path, a, b, dpi) for a, b in ranges]
+        pages = [p for f in futures for p in f.result()]
+        elapsed = time.perf_counter() - t0
+    assert [p for p, _ in pages] == list(range(1, total + 1))
+    return elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=200)
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    ap.add_argument("--pages-per-task", type=int, default=8)
+    ap.add_argument("--dpi", type=int, default=150)
+    args = ap.parse_args()
+    if not shutil.which("tesseract"):
+        sys.exit("tesseract binary not found; install tesseract-ocr to run this benchmark")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "scanned.pdf")
+        scanned_pdf(path, args.pages)
+        print(f"{args.pages} scanned pages, dpi={args.dpi}, pages/task={args.pages_per_task}, cores={os.cpu_count()}")
+        os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+        t0 = time.perf_counter()
+        parsing.parse_pdf(path, args.dpi)
+        serial = time.perf_counter() - t0
+        print(f"{'serial':<12} {serial:>8.1f}s  {args.pages / serial:>7.2f} pages/s")
+        for workers in sorted(set(args.workers)):
+            elapsed = run_sharded(path, workers, args.pages_per_task, args.dpi, args.pages)
+            speedup = serial / elapsed
+            print(f"{f'{workers} workers':<12} {elapsed:>8.1f}s  {args.pages / elapsed:>7.2f} pages/s  "
+                  f"speedup {speedup:>5.2f}x  per core {speedup / workers:>4.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Memory and recall of int8 / binary quantization in the vector tier.
+
+Usage (from backend/):
+
+python -m scripts.bench_quantization --chunks 200000 --dim 768 --rescore 1 2 4 8
+python -m scripts.bench_quantization --qdrant-url http://localhost:6333
+
+Builds the in-process `VectorIndex` over --chunks synthetic embeddings once
+per mode (none, int8, binary) and reports, per mode:
+
+  ram        vector data held in RAM (`VectorIndex.nbytes`), measured and per 1M chunks
+  anon       growth of the process's anonymous memory (RssAnon) while building
+  spilled    float32 originals in the memory-mapped spill file (page cache, reclaimable)
+  recall@k   overlap with the exact float32 top-k, for each --rescore factor
+  p50/p99    query latency at the largest --rescore factor
+
+--data picks the vectors: "spectrum" (default) mimics text embeddings, with a
+decaying variance spectrum in random directions and a shared mean
+component. "clusters" uses tight isotropic clusters, a hard case for 1-bit
+codes, and "gaussian" uses isotropic noise. Queries are fresh draws from the
+same distribution. With --qdrant-url the same vectors also go into one
+collection per mode created by `retrieval.ensure_collection`, and recall is
+measured against `exact=True` searches.
+"""
+from __future__ import annotations
+import argparse, asyncio, gc, time
+import numpy as np
+from scripts.bench_common import ensure_env, percentile
+
+ensure_env()
+
+from qdrant_client.http import models as qmodels  # noqa: E402
+from app.services import retrieval  # noqa: E402
+from app.services.vector_index import VectorIndex  # noqa: E402
+
+
+def anon_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def make_vectors(kind: str, n: int, dim: int, rng: np.random.Generator) -> np.ndarray:
+    if kind == "gaussian":
+        return rng.standard_normal((n, dim), dtype=np.float32)
+    if kind == "clusters":
+        centers = rng.standard_normal((max(8, n // 1000), dim), dtype=np.float32)
+        return centers[rng.integers(0, len(centers), n)] + 0.3 * rng.standard_normal((n, dim), dtype=np.float32)
+    # Decaying spectrum in random directions plus a common offset, like sentence embeddings.
+    basis = np.linalg.qr(np.random.default_rng(1).standard_normal((dim, dim)))[0].astype(np.float32)
+    decay = (np.arange(1, dim + 1, dtype=np.float32) ** -0.5)
+    mean = basis[:, -1] * 2.0
+    out = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 50_000):
+        stop = min(start + 50_000, n)
+        out[start:stop] = (rng.standard_normal((stop - start, dim), dtype=np.float32) * decay) @ basis.T + mean
+    return out
+
+
+def exact_top(vectors: np.ndarray, queries: np.ndarray, k: int):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    out = []
+    for q in queries:
+        s = normed @ (q / np.linalg.norm(q))
+        top = np.argpartition(-s, k - 1)[:k]
+        out.append(set(top[np.argsort(-s[top])].tolist()))
+    return out
+
+
+def bench_local(args, vectors, queries, truth):
+    chunks = [{"chunk_id": str(i), "document_id": i % 1000 + 1, "text": ""} for i in range(len(vectors))]
+    scale = 1_000_000 / len(vectors)
+    print(f"{'mode':<7} {'ram MiB':>8} {'per 1M':>8} {'anon MiB':>9} {'spilled':>8} {'build s':>8}  "
+          + "  ".join(f"{'recall x' + str(r):>10}" for r in args.rescore) + f"  {'p50 ms':>7} {'p99 ms':>7}")
+    for mode in ("none", "int8", "binary"):
+        gc.collect()
+        before = anon_mb()
+        t0 = time.perf_counter()
+        index = VectorIndex(mode)
+        for start in range(0, len(vectors), 10_000):
+            index.add(vectors[start:start + 10_000], chunks[start:start + 10_000])
+        build = time.perf_counter() - t0
+        anon = anon_mb() - before
+        spilled = 0 if mode == "none" else len(vectors) * args.dim * 4 / 2**20
+        recalls = []
+        for r in args.rescore:
+            index.rescore = r
+            hits = [index.search(q, args.top_k) for q in queries]
+            recalls.append(np.mean([len({int(h["chunk_id"]) for h in hs} & want) / args.top_k for hs, want in zip(hits, truth)]))
+        latencies = []
+        for q in queries:
+            t0 = time.perf_counter()
+            index.search(q, args.top_k)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        ram = index.nbytes / 2**20
+        print(f"{mode:<7} {ram:>8.1f} {ram * scale:>8.0f} {anon:>9.1f} {spilled:>8.0f} {build:>8.1f}  "
+              + "  ".join(f"{r:>10.3f}" for r in recalls)
+              + f"  {percentile(latencies, 50):>7.2f} {percentile(latencies, 99):>7.2f}")
+        del index
+        gc.collect()
+
+
+async def bench_qdrant(args, vectors, queries):
+    settings = retrieval.settings
+    client = retrieval.client = retrieval.AsyncQdrantClient(url=args.qdrant_url, timeout=300)
+    try:
+        for mode in ("none", "int8", "binary"):
+            settings.vector_quantization = mode
+            name = f"bench_quantization_{mode}"
+            await client.delete_collection(name)
+            retrieval.reset_collection_state()
+            await retrieval.ensure_collection(args.dim, name)
+            for start in range(0, len(vectors), 1000):
+                await client.upsert(collection_name=name, wait=True, points=[
+                    qmodels.PointStruct(id=i + 1, vector=vectors[i].tolist(), payload={"document_id": i % 1000 + 1})
+                    for i in range(start, min(start + 1000, len(vectors)))
+                ])
+            while (await client.get_collection(name)).status != qmodels.CollectionStatus.GREEN:
+                await asyncio.sleep(0.5)
+            recalls, latencies = [], []
+            for q in queries:
+                want = {p.id for p in await client.search(name, q.tolist(), limit=args.top_k,
+                                                          search_params=qmodels.SearchParams(exact=True))}
+                t0 = time.perf_counter()
+                got = await client.search(name, q.tolist(), limit=args.top_k, search_params=retrieval._search_params())
+                latencies.append((time.perf_counter() - t0) * 1000)
+                recalls.append(len({p.id for p in got} & want) / args.top_k)
+            print(f"qdrant {mode:<7} recall@{args.top_k} {np.mean(recalls):.3f}  "
+                  f"p50 {percentile(latencies, 50):.2f} ms  p99 {percentile(latencies, 99):.2f} ms")
+            await client.delete_collection(name)
+    finally:
+        settings.vector_quantization = "none"
+        await client.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=200_000)
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--data", choices=["spectrum", "clusters", "gaussian"], default="spectrum")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=10)
+    ap.add_argument("--rescore", type=int, nargs="+", default=[1, 2, 4, 8])
+    ap.add_argument("--qdrant-url", default=None)
+    args = ap.parse_args()
+    rng = np.random.default_rng(7)
+    vectors = make_vectors(args.data, args.chunks + args.queries, args.dim, rng)
+    vectors, queries = vectors[: args.chunks], vectors[args.chunks:]
+    print(f"{args.chunks} x {args.dim}-d {args.data} vectors, {args.queries} queries, top-{args.top_k}")
+    bench_local(args, vectors, queries, exact_top(vectors, queries, args.top_k))
+    if args.qdrant_url:
+        asyncio.run(bench_qdrant(args, vectors, queries))
+
+
+if __name__ == "__main__":
+    main()
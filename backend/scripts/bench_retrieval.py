@@ -0,0 +1,286 @@
+"""Latency, throughput and memory of the retrieval hot path and /ask on synthetic corpora.
+
+Usage (from backend/):
+
+python -m scripts.bench_retrieval --sizes 10000 100000 --concurrency 1 8 32 --json bench_results/HEAD.json
+python -m scripts.bench_retrieval --compare bench_results/before.json bench_results/after.json
+
+For each corpus size it generates Zipf-vocabulary chunks with hash embeddings
+(the offline `hash_embed` vectors, computed in bulk), indexes them in the
+app's in-process indexes and a local Qdrant stand-in (`MockQdrantServer`,
+sharing `retrieval._MEM_INDEX`), and measures:
+
+  lex      `retrieval._lex_search` (BM25 inverted index)
+  memory   `retrieval._memory_only_search` (NumPy cosine scan, the Qdrant-down path)
+  search   `retrieval.search`: query embedding, vector search through
+           `AsyncQdrantClient` over HTTP, keyword search and fusion
+  ask      POST /ask in-process (httpx ASGITransport), with embeddings and
+           generation served by `MockGeminiServer`
+
+Queries are a few words of a random chunk. lex and memory are synchronous and
+run back to back; search and ask are driven by --concurrency workers (closed
+loop), so their QPS shows how much the event loop overlaps. The answer cache is
+disabled and the embedding rate limit lifted so every /ask does the full work.
+Pass --qdrant-url to search a real Qdrant instead of the stand-in (the
+collection is recreated and filled).
+
+--json writes every row with the commit, machine and parameters; --compare
+prints the p50/p99/QPS change between two such files, row by row.
+"""
+from __future__ import annotations
+import argparse, asyncio, gc, hashlib, json, os, platform, subprocess, sys, time, uuid
+import numpy as np
+from scripts.bench_common import ensure_env, percentile, rss_mb, MockGeminiServer, MockQdrantServer
+
+ensure_env()
+
+import httpx  # noqa: E402
+from qdrant_client import AsyncQdrantClient  # noqa: E402
+from qdrant_client.http import models as qmodels  # noqa: E402
+from app.core import runtime_state, http_client  # noqa: E402
+from app.services import retrieval  # noqa: E402
+from app.services.embeddings import hash_embed  # noqa: E402
+
+settings = retrieval.settings
+TARGETS = ("lex", "memory", "search", "ask")
+
+
+def hash_vectors(texts) -> np.ndarray:
+    """`hash_embed` for many texts at once (the 32-byte digest tiled to 256 dims, L2-normalized)."""
+    raw = np.frombuffer(b"".join(hashlib.sha256(t.encode()).digest() for t in texts), dtype=np.uint8).reshape(-1, 32)
+    vecs = np.tile(raw, (1, 8)).astype(np.float32) / 255.0
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs
+
+
+def make_corpus(n: int, args, rng: np.random.Generator, start: int = 0):
+    words = np.array([f"w{i}" for i in range(args.vocab)])
+    ranks = np.minimum(rng.zipf(1.3, size=(n, args.length)), args.vocab) - 1
+    return [
+        {
+            "chunk_id": str(uuid.UUID(int=start + i + 1)),
+            "document_id": (start + i) // args.chunks_per_doc + 1,
+            "page": (start + i) % args.chunks_per_doc,
+            "text": " ".join(words[r]),
+        }
+        for i, r in enumerate(ranks)
+    ]
+
+
+def make_queries(chunks, count: int, rng: np.random.Generator):
+    queries = []
+    for i in rng.integers(0, len(chunks), size=count):
+        tokens = chunks[int(i)]["text"].split()
+        queries.append(" ".join(rng.choice(tokens, size=min(4, len(tokens)), replace=False)))
+    return queries
+
+
+def summarize(size: int, target: str, concurrency: int, latencies, elapsed: float, errors: int, **extra):
+    row = {
+        "size": size, "target": target, "concurrency": concurrency, "requests": len(latencies), "errors": errors,
+        "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95), "p99_ms": percentile(latencies, 99),
+        "mean_ms": sum(latencies) / len(latencies) if latencies else 0.0,
+        "qps": len(latencies) / elapsed if elapsed else 0.0, "rss_mb": rss_mb(), **extra,
+    }
+    print(f"{size:>9} {target:<7} c={concurrency:<4} p50 {row['p50_ms']:>8.2f}  p95 {row['p95_ms']:>8.2f}  "
+          f"p99 {row['p99_ms']:>8.2f} ms  {row['qps']:>8.1f} qps  errors {errors}"
+          + "".join(f"  {k}={v}" for k, v in extra.items()))
+    return row
+
+
+def run_sync(fn, queries, warmup: int):
+    for q in queries[:warmup]:
+        fn(q)
+    latencies = []
+    t0 = time.perf_counter()
+    for q in queries[warmup:]:
+        s = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - s) * 1000)
+    return latencies, time.perf_counter() - t0
+
+
+async def run_async(fn, queries, concurrency: int, warmup: int):
+    for q in queries[:warmup]:
+        await fn(q)
+    todo = iter(queries[warmup:])
+    latencies, errors, outcomes = [], [0], {}
+
+    async def worker():
+        for q in todo:
+            s = time.perf_counter()
+            try:
+                outcome = await fn(q)
+                latencies.append((time.perf_counter() - s) * 1000)
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            except Exception:
+                errors[0] += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, time.perf_counter() - t0, errors[0], outcomes
+
+
+async def load_qdrant(args, qdrant, vectors, chunks):
+    if qdrant is not None:
+        qdrant.load(settings.qdrant_collection, vectors, chunks)
+        return
+    # Real Qdrant: start from a fresh collection and upsert over the API.
+    client = retrieval.client
+    if await client.collection_exists(settings.qdrant_collection):
+        await client.delete_collection(settings.qdrant_collection)
+    retrieval.reset_collection_state()
+    await retrieval.ensure_collection(vectors.shape[1])
+    for lo in range(0, len(chunks), settings.qdrant_upsert_batch_size):
+        batch = range(lo, min(len(chunks), lo + settings.qdrant_upsert_batch_size))
+        await client.upsert(settings.qdrant_collection, points=[
+            qmodels.PointStruct(id=chunks[i]["chunk_id"], vector=vectors[i].tolist(), payload=chunks[i]) for i in batch
+        ])
+    retrieval._MEM_INDEX.add(vectors, chunks)
+
+
+async def bench_size(size: int, args, qdrant, gemini, asgi: httpx.AsyncClient, rng):
+    retrieval._MEM_INDEX.clear()
+    retrieval._LEX_INDEX.clear()
+    gc.collect()
+    before = rss_mb()
+    t0 = time.perf_counter()
+    chunks = []
+    for lo in range(0, size, args.batch):
+        part = make_corpus(min(args.batch, size - lo), args, rng, start=lo)
+        await load_qdrant(args, qdrant, hash_vectors([c["text"] for c in part]), part)
+        retrieval._LEX_INDEX.add(part)
+        chunks.extend(part)
+    build_s = time.perf_counter() - t0
+    index_mb = rss_mb() - before
+    print(f"{size} chunks indexed in {build_s:.1f}s, rss +{index_mb:.0f} MiB")
+    queries = make_queries(chunks, args.queries + args.warmup, rng)
+    del chunks
+    extra = {"build_s": round(build_s, 2), "index_rss_mb": round(index_mb, 1)}
+    fetch_k = settings.top_k * max(1, settings.fusion_overfetch)
+    rows = []
+    if "lex" in args.targets:
+        lat, elapsed = run_sync(lambda q: retrieval._lex_search(q, fetch_k, None), queries, args.warmup)
+        rows.append(summarize(size, "lex", 1, lat, elapsed, 0, **extra))
+    if "memory" in args.targets:
+        vecs = {q: hash_embed(q) for q in queries}
+        lat, elapsed = run_sync(lambda q: retrieval._memory_only_search(vecs[q], fetch_k, None), queries, args.warmup)
+        rows.append(summarize(size, "memory", 1, lat, elapsed, 0, **extra))
+
+    async def search(q):
+        results = await retrieval.search(q, settings.top_k)
+        return results[0]["mode"] if results else "empty"
+
+    async def ask(q):
+        r = await asgi.post("/ask", json={"question": q})
+        r.raise_for_status()
+        return r.json().get("answer_type")
+
+    for target, fn in (("search", search), ("ask", ask)):
+        if target not in args.targets:
+            continue
+        if target == "ask":
+            runtime_state.set_gemini_key("bench-key")
+        try:
+            for c in args.concurrency:
+                lat, elapsed, errors, outcomes = await run_async(fn, queries, c, args.warmup)
+                rows.append(summarize(size, target, c, lat, elapsed, errors, outcomes=outcomes, **extra))
+        finally:
+            runtime_state.clear_gemini_key()
+    return rows
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return out + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main_async(args):
+    settings.answer_cache_enabled = False
+    settings.embedding_cache_path = ""
+    settings.embedding_requests_per_second = 1e6
+    settings.embedding_burst = 1_000_000
+    from app.main import app
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    with MockGeminiServer(latency_s=args.gemini_latency_ms / 1000.0, vector_fn=hash_embed) as gemini:
+        settings.gemini_api_base = gemini.base_url
+        if args.qdrant_url:
+            qdrant = None
+            retrieval.client = AsyncQdrantClient(url=args.qdrant_url)
+        else:
+            qdrant = MockQdrantServer(retrieval._MEM_INDEX, latency_s=args.qdrant_latency_ms / 1000.0).__enter__()
+            retrieval.client = AsyncQdrantClient(url=qdrant.url)
+        retrieval.reset_collection_state()
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as asgi:
+                for size in args.sizes:
+                    rows += await bench_size(size, args, qdrant, gemini, asgi, rng)
+        finally:
+            if qdrant is not None:
+                qdrant.__exit__(None, None, None)
+            await http_client.aclose()
+    return rows
+
+
+def compare(before_path: str, after_path: str):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"before {before['meta']['commit']}  after {after['meta']['commit']}")
+    old = {(r["size"], r["target"], r["concurrency"]): r for r in before["results"]}
+    print(f"{'size':>9} {'target':<7} {'c':>4}  {'p50 ms':>19}  {'p99 ms':>19}  {'qps':>19}")
+    for r in after["results"]:
+        o = old.get((r["size"], r["target"], r["concurrency"]))
+        if o is None:
+            continue
+        cells = []
+        for field in ("p50_ms", "p99_ms", "qps"):
+            ratio = r[field] / o[field] if o[field] else float("nan")
+            cells.append(f"{o[field]:>7.1f} -> {r[field]:>7.1f} x{ratio:<4.2f}")
+        print(f"{r['size']:>9} {r['target']:<7} {r['concurrency']:>4}  " + "  ".join(cells))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    ap.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    ap.add_argument("--queries", type=int, default=300, help="measured queries per target and concurrency level")
+    ap.add_argument("--warmup", type=int, default=20)
+    ap.add_argument("--length", type=int, default=120, help="tokens per chunk")
+    ap.add_argument("--vocab", type=int, default=50_000)
+    ap.add_argument("--chunks-per-doc", type=int, default=50)
+    ap.add_argument("--batch", type=int, default=20_000, help="chunks generated and indexed at a time")
+    ap.add_argument("--gemini-latency-ms", type=float, default=0.0)
+    ap.add_argument("--qdrant-latency-ms", type=float, default=0.0)
+    ap.add_argument("--qdrant-url", help="benchmark against this Qdrant instead of the stand-in")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", help="write results here")
+    ap.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two --json result files and exit")
+    args = ap.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+    print(f"sizes={args.sizes} targets={args.targets} concurrency={args.concurrency} queries={args.queries} "
+          f"cores={os.cpu_count()} commit={git_commit()}")
+    rows = asyncio.run(main_async(args))
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        meta = {
+            "commit": git_commit(), "created_at": time.time(), "python": sys.version.split()[0],
+            "platform": platform.platform(), "cores": os.cpu_count(), "params": vars(args),
+        }
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": rows}, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
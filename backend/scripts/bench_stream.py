@@ -0,0 +1,70 @@
+"""Time-to-first-token of /ask/stream generation: streamed versus buffered.
+
+Usage (from backend/):
+
+python -m scripts.bench_stream --runs 10 --tokens 60 --token-delay-ms 15
+
+Against the mock Gemini server (which produces one word every
+--token-delay-ms), compares `rag.generate_answer` -- what /ask/stream used
+to await before replaying sentences -- with `rag.stream_answer`, reporting
+time to first token and total time.
+"""
+from __future__ import annotations
+import argparse, asyncio, time
+from scripts.bench_common import ensure_env, percentile, MockGeminiServer
+
+ensure_env()
+
+from app.core import runtime_state  # noqa: E402
+from app.services import rag  # noqa: E402
+
+CONTEXT = [{"page": 1, "text": "Employees accrue two days of paid leave per month.", "document_id": 1}]
+QUESTION = "How much leave do employees accrue?"
+
+
+async def buffered():
+    t0 = time.perf_counter()
+    await rag.generate_answer(QUESTION, CONTEXT)
+    total = (time.perf_counter() - t0) * 1000
+    return total, total  # the first sentence could only be sent after the full answer
+
+
+async def streamed():
+    t0 = time.perf_counter()
+    ttft = None
+    async for event in rag.stream_answer(QUESTION, CONTEXT):
+        if "delta" in event and ttft is None:
+            ttft = (time.perf_counter() - t0) * 1000
+        if "final" in event:
+            assert event["final"]["generation_mode"] == "gemini", event["final"]
+    total = (time.perf_counter() - t0) * 1000
+    return ttft if ttft is not None else total, total
+
+
+async def main_async(args):
+    runtime_state.set_gemini_key("bench-key")
+    with MockGeminiServer(latency_s=args.latency_ms / 1000.0, answer_tokens=args.tokens, token_delay_s=args.token_delay_ms / 1000.0) as mock:
+        rag.settings.gemini_api_base = mock.base_url
+        print(f"{args.runs} runs, {args.tokens} tokens at {args.token_delay_ms} ms, mock latency {args.latency_ms} ms")
+        for label, fn in (("buffered", buffered), ("streamed", streamed)):
+            ttfts, totals = [], []
+            for _ in range(args.runs):
+                ttft, total = await fn()
+                ttfts.append(ttft)
+                totals.append(total)
+            print(f"{label:<10} ttft p50 {percentile(ttfts, 50):>8.1f} ms  p95 {percentile(ttfts, 95):>8.1f} ms   "
+                  f"total p50 {percentile(totals, 50):>8.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=10)
+    ap.add_argument("--tokens", type=int, default=60)
+    ap.add_argument("--token-delay-ms", type=float, default=15)
+    ap.add_argument("--latency-ms", type=float, default=50)
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
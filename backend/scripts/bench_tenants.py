@@ -0,0 +1,167 @@
+"""Tenant-filtered search latency versus tenant count.
+
+Usage (from backend/):
+
+python -m scripts.bench_tenants --chunks 50000 --tenants 1 10 100 1000
+python -m scripts.bench_tenants --qdrant-url http://localhost:6333 --max-collections 100
+
+A fixed corpus (--chunks chunks of --dim random vectors and Zipf-vocabulary
+text, --documents documents) is split over N tenants, documents assigned
+round-robin, and each query searches the documents of one random tenant.
+
+Always measured, in-process (`multi_tenant` on, `tenants.owners` filled):
+
+  keyword        `_keyword_search` restricted to the tenant's documents
+  vector-fallbk  `_memory_only_search` restricted likewise
+
+with N = 0 as the unscoped baseline. With --qdrant-url the Qdrant layouts
+are measured too, through the app's own `_search_filter`:
+
+  shared         one collection, owner_id filter, no payload index (the layout before tenants)
+  shared+index   one collection, keyword index on owner_id and HNSW payload_m=16
+  per-tenant     one collection per tenant (up to --max-collections tenants)
+
+Collections are named `bench_tenants_*` and dropped afterwards. Each row
+reports p50/p99 latency over --queries searches.
+"""
+from __future__ import annotations
+import argparse, asyncio, time
+import numpy as np
+from scripts.bench_common import ensure_env, percentile
+
+ensure_env()
+
+from qdrant_client import AsyncQdrantClient  # noqa: E402
+from qdrant_client.http import models as qmodels  # noqa: E402
+from app.services import retrieval, tenants  # noqa: E402
+
+PREFIX = "bench_tenants"
+
+
+def make_corpus(n: int, dim: int, documents: int, rng: np.random.Generator):
+    words = np.array([f"w{i}" for i in range(20_000)])
+    vectors = rng.standard_normal((n, dim), dtype=np.float32)
+    chunks = [
+        {"chunk_id": f"{i:08d}-0000-0000-0000-000000000000", "document_id": i % documents + 1, "page": 1,
+         "text": " ".join(words[np.minimum(rng.zipf(1.2, size=60), len(words)) - 1])}
+        for i in range(n)
+    ]
+    return vectors, chunks
+
+
+def owner_of(document_id: int, tenants_n: int) -> str:
+    return f"t{document_id % tenants_n}"
+
+
+def row(label: str, n: int, latencies):
+    print(f"{label:<14} {n:>7}  p50 {percentile(latencies, 50):>8.2f} ms  p99 {percentile(latencies, 99):>8.2f} ms")
+
+
+async def bench_local(args, chunks, rng):
+    retrieval._MEM_INDEX.clear()
+    retrieval._LEX_INDEX.clear()
+    for start in range(0, len(chunks), 10_000):
+        retrieval._MEM_INDEX.add(args.vectors[start:start + 10_000], chunks[start:start + 10_000])
+        retrieval._LEX_INDEX.add(chunks[start:start + 10_000])
+    queries = [" ".join(chunks[int(i)]["text"].split()[:4]) for i in rng.integers(0, len(chunks), args.queries)]
+    qvecs = rng.standard_normal((args.queries, args.dim), dtype=np.float32).tolist()
+    for n in [0] + args.tenants:
+        retrieval.settings.multi_tenant = n > 0
+        tenants.owners.clear()
+        if n:
+            tenants.owners.update((d, owner_of(d, n)) for d in range(1, args.documents + 1))
+        owners = [owner_of(int(d), n) if n else None for d in rng.integers(1, args.documents + 1, args.queries)]
+        lex, vec = [], []
+        for q, qvec, owner in zip(queries, qvecs, owners):
+            t0 = time.perf_counter()
+            await retrieval._keyword_search(q, args.top_k, None, owner)
+            lex.append((time.perf_counter() - t0) * 1000)
+            t0 = time.perf_counter()
+            retrieval._memory_only_search(qvec, args.top_k, None, owner)
+            vec.append((time.perf_counter() - t0) * 1000)
+        row("keyword", n, lex)
+        row("vector-fallbk", n, vec)
+    retrieval.settings.multi_tenant = False
+
+
+async def _load(client: AsyncQdrantClient, name: str, vectors, chunks, owner, hnsw=None, indexed=False):
+    await client.recreate_collection(
+        collection_name=name,
+        vectors_config=qmodels.VectorParams(size=vectors.shape[1], distance=qmodels.Distance.COSINE),
+        hnsw_config=hnsw,
+    )
+    if indexed:
+        await client.create_payload_index(collection_name=name, field_name="owner_id", field_schema=qmodels.PayloadSchemaType.KEYWORD)
+        await client.create_payload_index(collection_name=name, field_name="document_id", field_schema=qmodels.PayloadSchemaType.INTEGER)
+    for start in range(0, len(chunks), 1000):
+        await client.upsert(collection_name=name, wait=True, points=[
+            qmodels.PointStruct(id=i + 1, vector=vectors[i].tolist(),
+                                payload={"document_id": chunks[i]["document_id"], "owner_id": owner(chunks[i]["document_id"])})
+            for i in range(start, min(start + 1000, len(chunks)))
+        ])
+    while (await client.get_collection(name)).status != qmodels.CollectionStatus.GREEN:
+        await asyncio.sleep(0.5)
+
+
+async def _timed_searches(client, searches):
+    latencies = []
+    for name, qvec, search_filter in searches:
+        t0 = time.perf_counter()
+        await client.search(collection_name=name, query_vector=qvec, limit=10, query_filter=search_filter)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies
+
+
+async def bench_qdrant(args, chunks, rng):
+    client = AsyncQdrantClient(url=args.qdrant_url, timeout=300)
+    settings = retrieval.settings
+    settings.multi_tenant = True
+    try:
+        for n in args.tenants:
+            owner = lambda d: owner_of(d, n)  # noqa: E731
+            picks = [owner_of(int(d), n) for d in rng.integers(1, args.documents + 1, args.queries)]
+            qvecs = rng.standard_normal((args.queries, args.dim), dtype=np.float32).tolist()
+            settings.qdrant_tenant_layout = "payload"
+            filters = [retrieval._search_filter(None, o) for o in picks]
+            for label, hnsw, indexed in (("shared", None, False), ("shared+index", qmodels.HnswConfigDiff(payload_m=16), True)):
+                name = f"{PREFIX}_{label.replace('+', '_')}"
+                await _load(client, name, args.vectors, chunks, owner, hnsw, indexed)
+                row(label, n, await _timed_searches(client, [(name, q, f) for q, f in zip(qvecs, filters)]))
+                await client.delete_collection(name)
+            if n > args.max_collections:
+                print(f"{'per-tenant':<14} {n:>7}  skipped (more than --max-collections)")
+                continue
+            by_owner = {}
+            for i, ch in enumerate(chunks):
+                by_owner.setdefault(owner(ch["document_id"]), []).append(i)
+            for o, rows in by_owner.items():
+                await _load(client, f"{PREFIX}__{o}", args.vectors[rows], [chunks[i] for i in rows], owner, None, True)
+            row("per-tenant", n, await _timed_searches(client, [(f"{PREFIX}__{o}", q, None) for q, o in zip(qvecs, picks)]))
+            for o in by_owner:
+                await client.delete_collection(f"{PREFIX}__{o}")
+    finally:
+        settings.multi_tenant = False
+        await client.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=50_000)
+    ap.add_argument("--documents", type=int, default=5_000)
+    ap.add_argument("--dim", type=int, default=256)
+    ap.add_argument("--tenants", type=int, nargs="+", default=[1, 10, 100, 1000])
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top-k", type=int, default=40, help="candidates per retriever (top_k * fusion_overfetch)")
+    ap.add_argument("--qdrant-url", default=None)
+    ap.add_argument("--max-collections", type=int, default=100)
+    args = ap.parse_args()
+    rng = np.random.default_rng(5)
+    args.vectors, chunks = make_corpus(args.chunks, args.dim, args.documents, rng)
+    print(f"{args.chunks} chunks in {args.documents} documents, dim {args.dim}")
+    asyncio.run(bench_local(args, chunks, rng))
+    if args.qdrant_url:
+        asyncio.run(bench_qdrant(args, chunks, rng))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Peak RSS of the upload path: buffered versus streaming.
+
+Usage (from backend/):
+
+python -m scripts.bench_upload_memory --size-mb 50 --concurrency 4
+
+Each mode runs in a fresh subprocess (peak RSS is per process) and pushes
+`--concurrency` simultaneous multipart bodies of `--size-mb` through it:
+
+  buffered   the former path: Starlette's form parser spools the file, the
+             route reads it into memory, wraps it in BytesIO for put_object
+  streaming  `uploads.stream_upload` feeding `storage`-style multipart reads
+
+The storage side is a sink that reads `upload_part_size_mb` parts and drops
+them, standing in for MinIO so only the application's own buffering shows up.
+"""
+from __future__ import annotations
+import argparse, asyncio, io, json, subprocess, sys, time
+from scripts.bench_common import ensure_env, peak_rss_mb, rss_mb
+
+ensure_env()
+
+BOUNDARY = "benchboundary"
+CHUNK = 64 * 1024  # typical ASGI body chunk
+
+
+def part_sink(part_size: int):
+    def put(stream, object_name, content_type):
+        while True:
+            part = stream.read(part_size)
+            if len(part) < part_size:
+                return object_name
+    return put
+
+
+async def body(size: int):
+    yield (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.pdf\"\r\n"
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode()
+    block = bytes(range(256)) * (CHUNK // 256)
+    sent = 0
+    while sent < size:
+        n = min(CHUNK, size - sent)
+        yield block[:n]
+        sent += n
+        await asyncio.sleep(0)  # let concurrent uploads interleave like real sockets
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def buffered_upload(size: int, part_size: int):
+    # What `UploadFile = File(...)` + `await file.read()` did: Starlette spools the
+    # part to a temp file, the route reads it back into one bytes object.
+    from starlette.datastructures import Headers
+    from starlette.formparsers import MultiPartParser
+    headers = Headers({"content-type": f"multipart/form-data; boundary={BOUNDARY}"})
+    form = await MultiPartParser(headers, body(size)).parse()
+    content = await form["file"].read()
+    part_sink(part_size)(io.BytesIO(content), "big.pdf", "application/pdf")
+    await form.close()
+
+
+async def streaming_upload(size: int, part_size: int, max_bytes: int):
+    from app.services import uploads
+    await uploads.stream_upload(f"multipart/form-data; boundary={BOUNDARY}", body(size), max_bytes, put=part_sink(part_size))
+
+
+def child(mode: str, size: int, concurrency: int):
+    from app.core.config import get_settings
+    settings = get_settings()
+    part_size = max(5, settings.upload_part_size_mb) * 1024 * 1024
+    max_bytes = size + 1
+
+    async def run():
+        if mode == "buffered":
+            jobs = [buffered_upload(size, part_size) for _ in range(concurrency)]
+        else:
+            jobs = [streaming_upload(size, part_size, max_bytes) for _ in range(concurrency)]
+        await asyncio.gather(*jobs)
+
+    base = rss_mb()
+    t0 = time.perf_counter()
+    asyncio.run(run())
+    print(json.dumps({"base": base, "peak": peak_rss_mb(), "seconds": time.perf_counter() - t0}))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--size-mb", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=4)
+    ap.add_argument("--child", choices=["buffered", "streaming"], help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    size = args.size_mb * 1024 * 1024
+    if args.child:
+        child(args.child, size, args.concurrency)
+        return
+    print(f"{args.concurrency} concurrent uploads of {args.size_mb} MiB")
+    for mode in ("buffered", "streaming"):
+        out = subprocess.run(
+            [sys.executable, "-m", "scripts.bench_upload_memory", "--child", mode,
+             "--size-mb", str(args.size_mb), "--concurrency", str(args.concurrency)],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{mode:<10} peak RSS {r['peak']:>8.1f} MiB  (+{r['peak'] - r['base']:>7.1f} over baseline)  {r['seconds']:>6.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Micro-benchmark for the in-process vector fallback index.
+
+Usage (from backend/):
+
+python -m scripts.bench_vector_index --sizes 10000 100000 1000000 --dim 768
+
+For each corpus size it builds the NumPy `VectorIndex` and (up to
+--legacy-max chunks) the former list-of-dicts store, then reports mean query
+latency and the resident-memory growth caused by building each index.
+"""
+from __future__ import annotations
+import argparse, gc, math, time
+import numpy as np
+from scripts.bench_common import ensure_env, rss_mb
+
+ensure_env()
+
+from app.services.vector_index import VectorIndex  # noqa: E402
+
+
+def legacy_search(index: list, qvec: list, top_k: int, document_ids):
+    """The pure-Python cosine scan `_memory_only_search` used before VectorIndex."""
+    def cosine(a, b):
+        return sum(x*y for x, y in zip(a, b)) / ((math.sqrt(sum(x*x for x in a)) or 1.0) * (math.sqrt(sum(y*y for y in b)) or 1.0))
+    candidates = index
+    if document_ids:
+        candidates = [c for c in candidates if c.get("document_id") in document_ids]
+    scored = [{"score": cosine(qvec, c["vector"]), "text": c["text"], "page": c["page"], "document_id": c["document_id"]} for c in candidates]
+    scored.sort(key=lambda x: x["score"], reverse=True)
+    return scored[:top_k]
+
+
+def build_vectors(n: int, dim: int, rng: np.random.Generator):
+    return rng.standard_normal((n, dim), dtype=np.float32)
+
+
+def timed(fn, queries: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(queries):
+        fn()
+    return (time.perf_counter() - t0) / queries * 1000
+
+
+def bench_size(n: int, args, rng):
+    vecs = build_vectors(n, args.dim, rng)
+    chunks = [{"text": f"chunk {i}", "page": i % 50, "document_id": i % args.documents} for i in range(n)]
+    q = rng.standard_normal(args.dim, dtype=np.float32).tolist()
+    filt = list(range(0, args.documents, 10))
+
+    gc.collect()
+    base = rss_mb()
+    index = VectorIndex()
+    for start in range(0, n, 10_000):
+        index.add(vecs[start:start + 10_000], chunks[start:start + 10_000])
+    new_mem = rss_mb() - base
+    new_ms = timed(lambda: index.search(q, 5, None), args.queries)
+    new_filt_ms = timed(lambda: index.search(q, 5, filt), args.queries)
+    print(f"{n:>9}  numpy   {new_ms:>10.2f} ms  filtered {new_filt_ms:>10.2f} ms  rss +{new_mem:>9.1f} MiB")
+    del index
+    gc.collect()
+
+    if n > args.legacy_max:
+        print(f"{n:>9}  legacy  skipped (> --legacy-max {args.legacy_max})")
+        return
+    base = rss_mb()
+    legacy = [{"vector": vecs[i].tolist(), **chunks[i]} for i in range(n)]
+    old_mem = rss_mb() - base
+    legacy_queries = max(1, args.queries // 20)
+    old_ms = timed(lambda: legacy_search(legacy, q, 5, None), legacy_queries)
+    old_filt_ms = timed(lambda: legacy_search(legacy, q, 5, filt), legacy_queries)
+    print(f"{n:>9}  legacy  {old_ms:>10.2f} ms  filtered {old_filt_ms:>10.2f} ms  rss +{old_mem:>9.1f} MiB  (speedup x{old_ms / max(new_ms, 1e-9):.0f})")
+    del legacy
+    gc.collect()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--documents", type=int, default=200)
+    ap.add_argument("--queries", type=int, default=50)
+    ap.add_argument("--legacy-max", type=int, default=100_000)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    print(f"dim={args.dim} documents={args.documents} top_k=5")
+    for n in args.sizes:
+        bench_size(n, args, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -50,15 +50,35 @@ def upload_file(path: Path, headers: dict) -> Tuple[int, str]:
     data = r.json()
     return data['document_id'], data['task_id']
 
-def poll_task(task_id: str, headers: dict, interval=2, timeout=1800):
+def format_progress(js: dict) -> str:
+    p = js.get('progress') or {}
+    parts = [f"{js.get('status')}", f"stage={js.get('stage')}"]
+    if p.get('pages_total'):
+        parts.append(f"pages {p.get('pages_parsed', 0)}/{p['pages_total']}")
+    if p.get('chunks_total'):
+        parts.append(f"chunks {p.get('chunks_embedded', 0)}/{p['chunks_total']}")
+    if js.get('attempts', 0) > 1:
+        parts.append(f"attempt {js['attempts']}")
+    if js.get('error'):
+        parts.append(f"error={js['error'][:120]}")
+    return ' '.join(parts)
+
+def poll_task(task_id: str, headers: dict, interval=2, timeout=1800, label: str = ''):
     start = time.time()
+    last = None
     while True:
         r = requests.get(f"{BACKEND}/tasks/{task_id}", headers=headers, timeout=30)
         if r.status_code == 404:
+            if (time.time() - start) > timeout:
+                return {'task_id': task_id, 'status': 'UNKNOWN'}
             time.sleep(interval)
             continue
         js = r.json()
         status = js.get('status')
+        line = format_progress(js)
+        if line != last:
+            print(f"  {label or task_id} {line}")
+            last = line
         if status in ('SUCCESS', 'FAILURE', 'REVOKED') or (time.time() - start) > timeout:
             return js
         time.sleep(interval)
@@ -117,7 +137,7 @@ def main():
     print('Polling tasks...')
     completed = 0
     for path, doc_id, task_id in results:
-        info = poll_task(task_id, headers)
+        info = poll_task(task_id, headers, label=path.name)
         status = info.get('status')
         print(f"Task {task_id} ({path.name}) -> {status}")
         completed += 1
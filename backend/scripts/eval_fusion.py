@@ -0,0 +1,160 @@
+"""Offline comparison of the hybrid fusion strategies: recall@k and latency.
+
+Usage (from backend/):
+
+python -m scripts.eval_fusion --chunks 20000 --queries 1000 --json fusion_eval.json
+
+Builds a synthetic corpus in the in-process `VectorIndex` and `LexicalIndex`
+(no Qdrant, no Gemini). Chunks belong to topics; a chunk's vector is its topic
+centroid plus noise and its text mixes topic words with Zipf-distributed
+filler. Each query targets one chunk: its vector is the chunk's vector with
+a random amount of extra noise, and its text is a few of the chunk's distinct
+words, some replaced by other words, so sometimes only one retriever finds the
+target. Recall@k is the fraction of queries whose target is in the top k.
+
+Strategies: vector-only, keyword-only, the min-max blend `retrieval.search`
+used before `services/fusion.py` (without over-fetch, as it ran), and
+rrf/zscore/convex with and without over-fetch. Latency is per query for both
+retrievals plus fusion. The in-process retrievers run back to back here, so
+it does not include the overlap `retrieval.search` gets from running the
+keyword search while the Qdrant request is in flight.
+"""
+from __future__ import annotations
+import argparse, json, time
+import numpy as np
+from scripts.bench_common import ensure_env, percentile
+
+ensure_env()
+
+from app.services import fusion  # noqa: E402
+from app.services.lexical import LexicalIndex  # noqa: E402
+from app.services.vector_index import VectorIndex  # noqa: E402
+
+
+def legacy_minmax(vector, keyword, top_k: int, hybrid_weight: float):
+    """The min-max blend `retrieval.search` used before the fusion module (merge by text + document)."""
+    def normalize(items):
+        if not items:
+            return
+        scs = [i["score"] for i in items]
+        mn, mx = min(scs), max(scs)
+        rng = (mx - mn) or 1.0
+        for i in items:
+            i["norm"] = (i["score"] - mn) / rng
+    normalize(vector)
+    normalize(keyword)
+    merged = {}
+    for it in vector:
+        merged[(it["text"], it.get("document_id"))] = it
+    for it in keyword:
+        key = (it["text"], it.get("document_id"))
+        if key in merged:
+            existing = merged[key]
+            existing["hybrid_score"] = (1 - hybrid_weight) * existing.get("norm", 0) + hybrid_weight * it.get("norm", 0)
+        else:
+            it["hybrid_score"] = hybrid_weight * it.get("norm", 0)
+            merged[key] = it
+    final = list(merged.values())
+    for f in final:
+        f.setdefault("hybrid_score", f.get("norm", 0))
+    final.sort(key=lambda x: x["hybrid_score"], reverse=True)
+    return final[:top_k]
+
+
+def build(args, rng: np.random.Generator):
+    words = np.array([f"w{i}" for i in range(args.vocab)])
+    topic_words = rng.integers(0, args.vocab, size=(args.topics, 30))
+    centroids = rng.standard_normal((args.topics, args.dim)).astype(np.float32)
+    topics = rng.integers(0, args.topics, size=args.chunks)
+    vectors = centroids[topics] + args.spread * rng.standard_normal((args.chunks, args.dim)).astype(np.float32)
+    chunks = []
+    for i in range(args.chunks):
+        filler = np.minimum(rng.zipf(1.3, size=args.length - 10), args.vocab) - 1
+        topical = rng.choice(topic_words[topics[i]], size=10)
+        tokens = words[np.concatenate([filler, topical])]
+        rng.shuffle(tokens)
+        chunks.append({"chunk_id": f"c{i}", "document_id": i // 50, "page": i % 50, "text": " ".join(tokens)})
+    vindex, lindex = VectorIndex(), LexicalIndex()
+    vindex.add(vectors, chunks)
+    lindex.add(chunks)
+    queries = []
+    for _ in range(args.queries):
+        target = int(rng.integers(args.chunks))
+        tokens = sorted(set(chunks[target]["text"].split()))
+        picked = list(rng.choice(tokens, size=args.query_terms, replace=False))
+        swap = rng.random(len(picked)) < rng.uniform(0.0, 0.9)
+        for j in np.flatnonzero(swap):
+            picked[j] = words[int(rng.integers(args.vocab))]
+        noise = rng.uniform(0.5, args.max_noise) * args.spread
+        qvec = vectors[target] + noise * rng.standard_normal(args.dim).astype(np.float32)
+        queries.append((f"c{target}", " ".join(picked), qvec.tolist()))
+    return vindex, lindex, queries
+
+
+def evaluate(name: str, run, queries, ks):
+    hits = {k: 0 for k in ks}
+    latencies = []
+    for target, text, qvec in queries:
+        t0 = time.perf_counter()
+        results = run(text, qvec)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        ids = [r.get("chunk_id") for r in results]
+        for k in ks:
+            hits[k] += target in ids[:k]
+    row = {"strategy": name, **{f"recall@{k}": hits[k] / len(queries) for k in ks},
+           "p50_ms": percentile(latencies, 50), "p95_ms": percentile(latencies, 95)}
+    print(f"{name:<22}" + "".join(f" {row[f'recall@{k}']:>9.3f}" for k in ks) + f" {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f}")
+    return row
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=20_000)
+    ap.add_argument("--queries", type=int, default=1000)
+    ap.add_argument("--top-k", type=int, default=10)
+    ap.add_argument("--overfetch", type=int, default=4)
+    ap.add_argument("--hybrid-weight", type=float, default=0.4)
+    ap.add_argument("--rrf-k", type=int, default=60)
+    ap.add_argument("--dim", type=int, default=64)
+    ap.add_argument("--topics", type=int, default=200)
+    ap.add_argument("--spread", type=float, default=0.6)
+    ap.add_argument("--max-noise", type=float, default=3.0, help="largest query noise, in multiples of --spread")
+    ap.add_argument("--vocab", type=int, default=30_000)
+    ap.add_argument("--length", type=int, default=120)
+    ap.add_argument("--query-terms", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--json", help="write the results here")
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    t0 = time.perf_counter()
+    vindex, lindex, queries = build(args, rng)
+    print(f"{args.chunks} chunks, {args.queries} queries built in {time.perf_counter() - t0:.1f}s")
+    top_k, w = args.top_k, args.hybrid_weight
+    ks = sorted({1, min(5, top_k), top_k})
+    fetch_k = top_k * args.overfetch
+
+    def fused(strategy: str, fetch: int):
+        def run(text, qvec):
+            return fusion.fuse(vindex.search(qvec, fetch), lindex.search(text, fetch), top_k,
+                               strategy=strategy, hybrid_weight=w, rrf_k=args.rrf_k)
+        return run
+
+    runs = {
+        "vector": lambda text, qvec: vindex.search(qvec, top_k),
+        "keyword": lambda text, qvec: lindex.search(text, top_k),
+        "minmax (legacy)": lambda text, qvec: legacy_minmax(vindex.search(qvec, top_k), lindex.search(text, top_k), top_k, w),
+    }
+    for strategy in fusion.STRATEGIES:
+        runs[strategy] = fused(strategy, top_k)
+        runs[f"{strategy} x{args.overfetch}"] = fused(strategy, fetch_k)
+
+    print(f"{'strategy':<22}" + "".join(f" {'recall@' + str(k):>9}" for k in ks) + f" {'p50 ms':>8} {'p95 ms':>8}")
+    rows = [evaluate(name, run, queries, ks) for name, run in runs.items()]
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"params": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
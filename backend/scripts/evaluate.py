@@ -1,58 +1,245 @@
-"""Evaluation harness for Document Q&A.
+"""Evaluation harness for Document Q&A: answer quality and latency in one run.
 
 Usage (inside backend container):
 
 python -m scripts.evaluate --questions data/questions.csv --output results.json
+python -m scripts.evaluate --questions data/regression.jsonl --output results.json --concurrency 16 --warmup 20
+python -m scripts.evaluate --questions data/regression.jsonl --output results.json --rate 20 --baseline last.json
 
-questions.csv format:
-question,expected_keywords (semicolon separated)
-"What is the leave policy?","leave;policy;days"
+questions.csv format (gold_chunk_ids and document_ids are optional, semicolon separated):
+question,expected_keywords,gold_chunk_ids,document_ids
+"What is the leave policy?","leave;policy;days","5d0c6f1e-...;9a51-...","3"
+
+A .jsonl file holds one object per line with the same fields as lists.
+Gold chunk ids are the `chunk_ids` /ask returns (e.g. from a reviewed run).
+
+Load modes:
+  closed loop (default)  --concurrency workers each send the next question when
+                         their previous one finishes
+  open loop (--rate R)   questions start at a fixed R per second whether or not
+                         earlier ones finished; latency is measured from the
+                         scheduled start, so queueing in the server is not hidden
+                         (no coordinated omission)
+
+--warmup sends that many throwaway questions first. --requests cycles the
+question set to reach a fixed number of requests.
+
+Per question it records keyword coverage of the answer, recall of the gold
+chunk ids in the answer's `chunk_ids`, client latency and the server's
+per-stage `timings` (embed / retrieve / generate, or cache). The summary has
+HDR-style histograms (see `LatencyHistogram`) per stage. With --baseline, the
+summary is compared with an earlier output and the exit status is 1 when
+quality drops by more than --quality-tolerance (absolute) or a p50/p99 grows
+by more than --latency-tolerance (relative) plus --latency-slack-ms.
 """
 from __future__ import annotations
-import csv, json, argparse, time, os
+import csv, json, argparse, asyncio, itertools, sys, time, os
 import httpx
+from scripts.bench_common import LatencyHistogram
+
+STAGES = ("total", "server", "embed", "retrieve", "generate", "cache")
+
+
+def _split(value) -> list:
+    if isinstance(value, list):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [k.strip() for k in (value or "").split(";") if k.strip()]
+
 
 def load_questions(path: str):
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            raw = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path) as f:
+            raw = list(csv.DictReader(f))
     rows = []
-    with open(path) as f:
-        r = csv.DictReader(f)
-        for row in r:
-            kws = [k.strip() for k in row.get("expected_keywords", "").split(";") if k.strip()]
-            rows.append({"question": row["question"], "expected_keywords": kws})
+    for row in raw:
+        rows.append({
+            "question": row["question"],
+            "expected_keywords": _split(row.get("expected_keywords")),
+            "gold_chunk_ids": _split(row.get("gold_chunk_ids")),
+            "document_ids": [int(d) for d in _split(row.get("document_ids"))] or None,
+        })
     return rows
 
+
 def score_answer(answer: str, keywords: list[str]):
     answer_l = answer.lower()
     hits = sum(1 for k in keywords if k.lower() in answer_l)
     return hits / max(1, len(keywords))
 
+
+def recall(returned: list[str], gold: list[str]):
+    if not gold:
+        return None
+    return len(set(gold) & set(returned)) / len(set(gold))
+
+
+async def ask(client: httpx.AsyncClient, api: str, q: dict, scheduled: float | None = None) -> dict:
+    sent = time.perf_counter()
+    start = scheduled if scheduled is not None else sent
+    body = {"question": q["question"]}
+    if q.get("document_ids"):
+        body["document_ids"] = q["document_ids"]
+    try:
+        r = await client.post(f"{api}/ask", json=body)
+        r.raise_for_status()
+        data = r.json()
+        error = None
+    except Exception as e:
+        data, error = {}, f"{type(e).__name__}: {e}"
+    done = time.perf_counter()
+    chunk_ids = data.get("chunk_ids") or []
+    return {
+        "question": q["question"],
+        "keywords": q["expected_keywords"],
+        "answer": data.get("answer"),
+        "answer_type": data.get("answer_type"),
+        "score": score_answer(data.get("answer") or "", q["expected_keywords"]),
+        "recall": recall(chunk_ids, q["gold_chunk_ids"]),
+        "chunk_ids": chunk_ids,
+        "cache": data.get("cache"),
+        "latency_ms": data.get("latency_ms"),
+        "client_ms": (done - start) * 1000,
+        "queue_ms": (sent - start) * 1000,
+        "timings": data.get("timings") or {},
+        "error": error,
+    }
+
+
+async def closed_loop(client, api, questions, concurrency: int):
+    todo = iter(questions)
+    results = []
+
+    async def worker():
+        for q in todo:
+            results.append(await ask(client, api, q))
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return results
+
+
+async def open_loop(client, api, questions, rate: float):
+    t0 = time.perf_counter()
+    tasks = []
+    for i, q in enumerate(questions):
+        scheduled = t0 + i / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(ask(client, api, q, scheduled)))
+    return await asyncio.gather(*tasks)
+
+
+def summarize(results: list[dict], elapsed: float) -> dict:
+    hists = {stage: LatencyHistogram() for stage in STAGES}
+    for r in results:
+        if r["error"]:
+            continue
+        hists["total"].record(r["client_ms"])
+        if r["latency_ms"] is not None:
+            hists["server"].record(r["latency_ms"])
+        for stage in STAGES[2:]:
+            if f"{stage}_ms" in r["timings"]:
+                hists[stage].record(r["timings"][f"{stage}_ms"])
+    ok = [r for r in results if not r["error"]]
+    recalls = [r["recall"] for r in ok if r["recall"] is not None]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_qps": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "keyword_coverage": sum(r["score"] for r in ok) / max(1, len(ok)),
+        "recall": sum(recalls) / len(recalls) if recalls else None,
+        "recall_hit_rate": sum(1 for x in recalls if x > 0) / len(recalls) if recalls else None,
+        "out_of_scope": sum(1 for r in ok if r["answer_type"] == "out_of_scope"),
+        "cache_hits": sum(1 for r in ok if r["cache"]),
+        "latency": {stage: h.summary() for stage, h in hists.items() if h.total},
+        "histograms": {stage: h.buckets() for stage, h in hists.items() if h.total},
+        "_hists": hists,
+    }
+
+
+def compare(summary: dict, baseline: dict, quality_tol: float, latency_tol: float, slack_ms: float) -> list[str]:
+    problems = []
+    for key in ("keyword_coverage", "recall"):
+        old, new = baseline.get(key), summary.get(key)
+        if old is not None and new is not None and new < old - quality_tol:
+            problems.append(f"{key} {old:.3f} -> {new:.3f}")
+    for stage, stats in summary["latency"].items():
+        old_stats = baseline.get("latency", {}).get(stage)
+        if not old_stats:
+            continue
+        for p in ("p50_ms", "p99_ms"):
+            if stats[p] > old_stats[p] * (1 + latency_tol) + slack_ms:
+                problems.append(f"{stage} {p} {old_stats[p]:.1f} -> {stats[p]:.1f}")
+    return problems
+
+
+async def run(args) -> dict:
+    qs = load_questions(args.questions)
+    if args.requests:
+        qs = list(itertools.islice(itertools.cycle(qs), args.requests))
+    headers = {"x-api-key": args.api_key} if args.api_key else {}
+    limits = httpx.Limits(max_connections=max(args.concurrency, 100), max_keepalive_connections=max(args.concurrency, 20))
+    async with httpx.AsyncClient(timeout=args.timeout, headers=headers, limits=limits) as client:
+        if args.warmup:
+            warm = [{"question": f"warmup request {i}", "expected_keywords": [], "gold_chunk_ids": []} for i in range(args.warmup)]
+            await closed_loop(client, args.api, warm, args.concurrency)
+        t0 = time.perf_counter()
+        if args.rate:
+            results = await open_loop(client, args.api, qs, args.rate)
+        else:
+            results = await closed_loop(client, args.api, qs, args.concurrency)
+        elapsed = time.perf_counter() - t0
+    return {"results": list(results), "summary": summarize(list(results), elapsed)}
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--questions", required=True)
     ap.add_argument("--output", required=True)
     ap.add_argument("--api", default=os.environ.get("API_URL", "http://localhost:8000"))
+    ap.add_argument("--api-key", default=os.environ.get("API_KEY"))
+    ap.add_argument("--concurrency", type=int, default=1, help="closed-loop workers (also used for warmup)")
+    ap.add_argument("--rate", type=float, help="open-loop arrival rate in requests per second")
+    ap.add_argument("--warmup", type=int, default=0)
+    ap.add_argument("--requests", type=int, help="cycle the question set to this many requests")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--baseline", help="earlier --output to compare against")
+    ap.add_argument("--quality-tolerance", type=float, default=0.02)
+    ap.add_argument("--latency-tolerance", type=float, default=0.2)
+    ap.add_argument("--latency-slack-ms", type=float, default=5.0, help="absolute growth ignored on top of the tolerance")
     args = ap.parse_args()
-    qs = load_questions(args.questions)
-    results = []
-    with httpx.Client(timeout=60) as client:
-        for q in qs:
-            t0 = time.time()
-            r = client.post(f"{args.api}/ask", json={"question": q["question"]})
-            data = r.json()
-            latency = data.get("latency_ms", int((time.time() - t0) * 1000))
-            score = score_answer(data.get("answer", ""), q["expected_keywords"])
-            results.append({
-                "question": q["question"],
-                "keywords": q["expected_keywords"],
-                "answer": data.get("answer"),
-                "answer_type": data.get("answer_type"),
-                "score": score,
-                "latency_ms": latency
-            })
+
+    out = asyncio.run(run(args))
+    summary = out["summary"]
+    hists = summary.pop("_hists")
+    mode = f"open loop {args.rate}/s" if args.rate else f"closed loop x{args.concurrency}"
     with open(args.output, "w") as f:
-        json.dump({"results": results}, f, indent=2)
-    avg = sum(r["score"] for r in results)/max(1,len(results))
-    print(f"Average keyword coverage: {avg:.2%} across {len(results)} questions")
+        json.dump({"meta": {"api": args.api, "mode": mode, "questions": args.questions, "created_at": time.time()}, **out}, f, indent=2)
+
+    print(f"{summary['requests']} requests ({mode}) in {summary['elapsed_s']:.1f}s, "
+          f"{summary['throughput_qps']:.1f} qps, {summary['errors']} errors, {summary['cache_hits']} cache hits")
+    print(f"Average keyword coverage: {summary['keyword_coverage']:.2%}")
+    if summary["recall"] is not None:
+        print(f"Gold chunk recall: {summary['recall']:.2%} (any gold chunk used: {summary['recall_hit_rate']:.2%})")
+    for stage, stats in summary["latency"].items():
+        print(f"{stage:<9} p50 {stats['p50_ms']:>9.1f}  p90 {stats['p90_ms']:>9.1f}  p99 {stats['p99_ms']:>9.1f}  "
+              f"max {stats['max_ms']:>9.1f} ms  (n={stats['count']})")
+    print("total latency histogram:")
+    print(hists["total"].render())
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("summary", {})
+        problems = compare(summary, baseline, args.quality_tolerance, args.latency_tolerance, args.latency_slack_ms)
+        if problems:
+            print("Regressions against baseline: " + "; ".join(problems))
+            sys.exit(1)
+        print("No regressions against baseline.")
+
 
 if __name__ == "__main__":
     main()
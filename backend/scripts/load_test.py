@@ -0,0 +1,113 @@
+"""/ask latency under concurrent uploads.
+
+Usage (against a running stack):
+
+python -m scripts.load_test --duration 30 --ask-concurrency 8 --uploaders 2 --pdf-pages 200
+
+Runs two phases of equal length: /ask traffic alone, then /ask traffic while
+`--uploaders` loops keep uploading a synthetic multi-page PDF. With parsing,
+MinIO and Qdrant calls off the event loop, the /ask p99 of both phases
+should stay close.
+
+Environment variables:
+  BACKEND_URL (default http://localhost:8000)
+  API_KEY (optional if using API key auth)
+"""
+from __future__ import annotations
+import argparse, asyncio, os, time
+import httpx
+from scripts.bench_common import percentile
+
+BACKEND = os.environ.get("BACKEND_URL", "http://localhost:8000")
+API_KEY = os.environ.get("API_KEY")
+
+QUESTIONS = [
+    "What is the leave policy?",
+    "How many vacation days do employees get?",
+    "Who approves travel expenses?",
+    "What is the notice period for resignation?",
+]
+
+
+def synthetic_pdf(pages: int) -> bytes:
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_text((72, 72), f"Page {i + 1}. " + "Employees accrue leave monthly. " * 40, fontsize=9)
+    return doc.tobytes()
+
+
+async def ask_loop(client: httpx.AsyncClient, stop_at: float, latencies: list, errors: list):
+    i = 0
+    while time.monotonic() < stop_at:
+        t0 = time.perf_counter()
+        try:
+            r = await client.post(f"{BACKEND}/ask", json={"question": QUESTIONS[i % len(QUESTIONS)]})
+            r.raise_for_status()
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            errors.append(str(e))
+        i += 1
+
+
+async def upload_loop(client: httpx.AsyncClient, stop_at: float, payload: bytes, done: list):
+    while time.monotonic() < stop_at:
+        try:
+            r = await client.post(f"{BACKEND}/upload", files={"file": ("load-test.pdf", payload, "application/pdf")}, timeout=600)
+            r.raise_for_status()
+            done.append(r.json().get("document_id"))
+        except Exception as e:
+            print(f"upload failed: {e}")
+            await asyncio.sleep(1)
+
+
+async def phase(label: str, args, payload: bytes | None):
+    headers = {"x-api-key": API_KEY} if API_KEY else {}
+    latencies: list = []
+    errors: list = []
+    uploaded: list = []
+    limits = httpx.Limits(max_connections=args.ask_concurrency + args.uploaders + 4)
+    async with httpx.AsyncClient(headers=headers, timeout=120, limits=limits) as client:
+        stop_at = time.monotonic() + args.duration
+        jobs = [ask_loop(client, stop_at, latencies, errors) for _ in range(args.ask_concurrency)]
+        if payload is not None:
+            jobs += [upload_loop(client, stop_at, payload, uploaded) for _ in range(args.uploaders)]
+        await asyncio.gather(*jobs)
+    print(
+        f"{label:<20} asks={len(latencies):<6} errors={len(errors):<4} uploads={len(uploaded):<4} "
+        f"p50={percentile(latencies, 50):>8.1f} ms  p95={percentile(latencies, 95):>8.1f} ms  p99={percentile(latencies, 99):>8.1f} ms"
+    )
+    return uploaded
+
+
+async def cleanup(doc_ids: list):
+    headers = {"x-api-key": API_KEY} if API_KEY else {}
+    async with httpx.AsyncClient(headers=headers, timeout=60) as client:
+        for doc_id in doc_ids:
+            await client.delete(f"{BACKEND}/documents/{doc_id}")
+
+
+async def main_async(args):
+    payload = synthetic_pdf(args.pdf_pages)
+    print(f"backend={BACKEND} duration={args.duration}s ask_concurrency={args.ask_concurrency} "
+          f"uploaders={args.uploaders} pdf={len(payload) / 1e6:.1f} MB ({args.pdf_pages} pages)")
+    await phase("ask only", args, None)
+    uploaded = await phase("ask + uploads", args, payload)
+    if not args.keep:
+        await cleanup(uploaded)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--ask-concurrency", type=int, default=8)
+    ap.add_argument("--uploaders", type=int, default=2)
+    ap.add_argument("--pdf-pages", type=int, default=200)
+    ap.add_argument("--keep", action="store_true", help="Keep uploaded load-test documents")
+    args = ap.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
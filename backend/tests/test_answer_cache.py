@@ -0,0 +1,57 @@
+from app.services.answer_cache import AnswerCache
+
+
+def _answer(text, docs):
+    return {"answer": text, "answer_type": "factual", "generation_mode": "gemini", "document_ids_used": docs, "latency_ms": 900}
+
+
+def test_exact_and_semantic_hits_are_scoped_by_document_set():
+    cache = AnswerCache(max_entries=10, ttl_s=60, similarity=0.95)
+    cache.put("How many leave days?", [2, 1], [1.0, 0.0, 0.0], _answer("24", [1]), 900, [1], cache.epoch)
+
+    hit = cache.get_exact("  how many LEAVE days ", [1, 2], elapsed_ms=1)
+    assert hit["answer"] == "24" and hit["cache"] == "exact"
+    assert cache.get_exact("How many leave days?", [1]) is None  # different document set
+    assert cache.get_exact("How many leave days?", None) is None
+
+    near = cache.get_similar([0.99, 0.05, 0.0], [1, 2], elapsed_ms=50)
+    assert near["cache"] == "semantic"
+    assert cache.get_similar([0.0, 1.0, 0.0], [1, 2]) is None
+    stats = cache.stats()
+    assert (stats["hits_exact"], stats["hits_semantic"], stats["misses"]) == (1, 1, 1)
+    assert stats["latency_saved_ms"] == 899 + 850
+
+
+def test_invalidation_ttl_and_lru():
+    cache = AnswerCache(max_entries=2, ttl_s=60, similarity=0.95)
+    cache.put("scoped to 3", [3], None, _answer("a", [3]), 500, [3], cache.epoch)
+    cache.put("unscoped citing 4", None, None, _answer("b", [4]), 500, [4], cache.epoch)
+    cache.invalidate_documents([5])  # a new document changes unscoped answers only
+    assert cache.get_exact("scoped to 3", [3]) is not None
+    assert cache.get_exact("unscoped citing 4", None) is None
+    cache.invalidate_documents([3])
+    assert cache.get_exact("scoped to 3", [3]) is None
+
+    stale_epoch = cache.epoch
+    cache.invalidate_documents([7])
+    cache.put("computed during ingest", [7], None, _answer("c", [7]), 500, [7], stale_epoch)
+    assert cache.get_exact("computed during ingest", [7]) is None
+
+    for q in ("one", "two", "three"):
+        cache.put(q, [1], None, _answer(q, [1]), 500, [1], cache.epoch)
+    assert cache.get_exact("one", [1]) is None and cache.get_exact("three", [1]) is not None
+
+    expired = AnswerCache(ttl_s=-1)
+    expired.put("old", None, None, _answer("x", []), 500, [], expired.epoch)
+    assert expired.get_exact("old", None) is None
+
+
+def test_owners_do_not_share_entries():
+    cache = AnswerCache(max_entries=10, ttl_s=60, similarity=0.95)
+    cache.put("How many leave days?", None, [1.0, 0.0], _answer("24", [1]), 900, [1], cache.epoch, owner_id="acme")
+    assert cache.get_exact("How many leave days?", None, owner_id="acme") is not None
+    assert cache.get_exact("How many leave days?", None, owner_id="globex") is None
+    assert cache.get_exact("How many leave days?", None) is None
+    assert cache.get_similar([1.0, 0.0], None, owner_id="globex") is None
+    cache.invalidate_documents([9])
+    assert cache.get_exact("How many leave days?", None, owner_id="acme") is None
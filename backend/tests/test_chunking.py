@@ -0,0 +1,16 @@
+from app.services.chunking import iter_chunks
+
+
+def test_chunks_keep_pages_and_offsets_across_boundaries():
+    pages = [{"page": i + 1, "text": f"Page {i + 1} sentence one. " + "filler words here. " * 30} for i in range(5)]
+    full = "\n".join(p["text"] for p in pages)
+    chunks = list(iter_chunks(pages, chunk_size=200, chunk_overlap=40))
+    assert [c["position"] for c in chunks] == list(range(len(chunks)))
+    for c in chunks:
+        assert full[c["char_start"]:c["char_end"]] == c["text"]
+        assert len(c["text"]) <= 200
+        assert c["page"] == c["page_start"] <= c["page_end"]
+    assert chunks[0]["page"] == 1 and chunks[-1]["page_end"] == 5
+    assert any(c["page_start"] < c["page_end"] for c in chunks)  # a chunk spans a page break
+    # Consecutive chunks overlap.
+    assert all(b["char_start"] < a["char_end"] for a, b in zip(chunks, chunks[1:]))
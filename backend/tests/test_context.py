@@ -0,0 +1,37 @@
+from app.services import chunking, context
+
+
+def _doc_chunks(document_id, text, size=400, overlap=120):
+    chunks = list(chunking.iter_chunks([{"page": 1, "text": text}], size, overlap))
+    for i, ch in enumerate(chunks):
+        ch["document_id"], ch["chunk_id"] = document_id, f"{document_id}-{i}"
+    return chunks
+
+
+_WORDS = "travel allowance region night hotel receipt manager approval claim budget limit policy meal taxi flight week".split()
+TEXT = " ".join(
+    f"Clause {i}: the {_WORDS[i % 16]} {_WORDS[i * 7 % 16]} rule covers {_WORDS[i * 5 % 16]} and {_WORDS[i * 3 % 16]} up to {i * 3} euros."
+    for i in range(60)
+)
+
+
+def test_overlapping_chunks_are_stitched_back_together():
+    chunks = _doc_chunks(1, TEXT)[:4]
+    # Relevance order differs from document order.
+    passages, stats = context.pack([chunks[2], chunks[0], chunks[1], chunks[3]], budget_tokens=10_000)
+    assert stats["merged"] == 3 and len(passages) == 1
+    assert passages[0]["text"] == TEXT[chunks[0]["char_start"]:chunks[3]["char_end"]]
+    assert sorted(passages[0]["chunk_ids"]) == ["1-0", "1-1", "1-2", "1-3"]
+
+
+def test_near_duplicates_dropped_and_budget_respected():
+    original = _doc_chunks(1, TEXT)
+    copy = dict(original[5], document_id=2, chunk_id="2-5", text=original[5]["text"].replace("euros", "EUR", 1))
+    passages, stats = context.pack([original[5], copy, original[12]], budget_tokens=10_000)
+    assert stats["duplicates"] == 1 and [p["chunk_ids"] for p in passages] == [["1-5"], ["1-12"]]
+
+    many = original[::4]
+    passages, stats = context.pack(many, budget_tokens=300)
+    assert stats["context_tokens"] <= 300
+    assert stats["passages"] + stats["dropped"] == len(many) and stats["dropped"] > 0
+    assert passages[0]["chunk_ids"] == [many[0]["chunk_id"]]
@@ -0,0 +1,35 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.main import app
+
+
+async def _seed(statuses):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        docs = [models.Document(filename=f"page-{i}.txt", content_type="text/plain", original_path="x", status=st)
+                for i, st in enumerate(statuses)]
+        session.add_all(docs)
+        await session.commit()
+        return [d.id for d in docs]
+
+
+def test_documents_keyset_pages_and_status_counts():
+    ids = asyncio.run(_seed(["ingested", "error", "ingested", "queued", "ingested"]))
+    with TestClient(app) as client:
+        seen, cursor = [], None
+        while True:
+            params = {"status": "ingested", "limit": 2, **({"before": cursor} if cursor else {})}
+            r = client.get("/documents", params=params)
+            page = r.json()
+            seen += [d["id"] for d in page if d["id"] in ids]
+            cursor = r.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        assert seen == [ids[4], ids[2], ids[0]]
+        assert all(set(d) == {"id", "filename", "status"} for d in page)
+        diag = client.get("/diagnostics").json()
+    assert diag["documents_by_status"]["ingested"] >= 3 and diag["documents_by_status"]["queued"] >= 1
+    assert diag["documents_total"] == sum(diag["documents_by_status"].values())
@@ -0,0 +1,32 @@
+import asyncio
+from app.core import runtime_state
+from app.services import embeddings
+
+
+def test_hash_mode_without_key():
+    runtime_state.clear_gemini_key()
+    embeddings.settings.gemini_api_key = ""
+    vecs = asyncio.run(embeddings.embed_texts(["alpha", "beta"]))
+    assert getattr(vecs, "_embed_mode") == "hash"
+    assert len(vecs) == 2 and len(vecs[0]) == 256
+
+
+def test_token_bucket_backs_off_and_recovers():
+    bucket = embeddings.TokenBucket(rate=8.0, capacity=2)
+    bucket.on_rate_limited(0.0)
+    assert bucket.rate == 4.0
+    bucket.on_success()
+    assert 4.0 < bucket.rate <= 8.0
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    cache = embeddings.EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    k = cache.key("same  text ")
+    assert k == cache.key("same text")
+    cache.put_many("model-a", {k: [0.5, 0.25]})
+    assert cache.get_many("model-a", [k]) == {k: [0.5, 0.25]}
+    assert cache.get_many("model-b", [k]) == {}
+    # a fresh instance only has the disk tier to answer from
+    reopened = embeddings.EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    assert reopened.get_many("model-a", [k]) == {k: [0.5, 0.25]}
+    assert reopened.stats()["disk_hits"] == 1
@@ -0,0 +1,66 @@
+import asyncio
+import pytest
+from app.services import fusion, retrieval
+
+
+def _hit(chunk_id, score, mode, **extra):
+    return {"chunk_id": chunk_id, "score": score, "text": f"text {chunk_id}", "page": 1, "document_id": 1, "mode": mode, **extra}
+
+
+def _lists():
+    vector = [_hit("a", 0.82, "vector"), _hit("b", 0.80, "vector"), _hit("c", 0.40, "vector")]
+    keyword = [_hit("c", 9.0, "keyword", max_score=10.0), _hit("d", 1.0, "keyword", max_score=10.0)]
+    return vector, keyword
+
+
+@pytest.mark.parametrize("strategy", fusion.STRATEGIES)
+def test_fuse_merges_by_chunk_id_and_bounds_scores(strategy):
+    vector, keyword = _lists()
+    fused = fusion.fuse(vector, keyword, 10, strategy=strategy, hybrid_weight=0.5)
+    assert sorted(r["chunk_id"] for r in fused) == ["a", "b", "c", "d"]
+    assert all(0.0 <= r["hybrid_score"] <= 1.0 for r in fused)
+    c = next(r for r in fused if r["chunk_id"] == "c")
+    assert (c["vector_rank"], c["keyword_rank"]) == (3, 1)
+    # Found by both retrievers, "c" beats the weak keyword-only hit.
+    assert [r["chunk_id"] for r in fused].index("c") < [r["chunk_id"] for r in fused].index("d")
+
+
+def test_weight_and_lone_keyword_hit():
+    vector, keyword = _lists()
+    assert fusion.fuse(vector, keyword, 1, strategy="rrf", hybrid_weight=0.0)[0]["chunk_id"] == "a"
+    vector, keyword = _lists()
+    assert fusion.fuse(vector, keyword, 1, strategy="rrf", hybrid_weight=1.0)[0]["chunk_id"] == "c"
+    # A single weak keyword hit is not inflated to a perfect score the way min-max did.
+    weak = fusion.fuse([], [_hit("d", 1.0, "keyword", max_score=10.0)], 5, strategy="convex")
+    assert weak[0]["hybrid_score"] == pytest.approx(0.1)
+    with pytest.raises(ValueError):
+        fusion.fuse([], [], 5, strategy="minmax")
+    assert fusion.parse_strategy("ZSCORE", "rrf") == "zscore" and fusion.parse_strategy("bogus", "rrf") == "rrf"
+
+
+def test_search_overfetches_both_retrievers(monkeypatch):
+    vector, keyword = _lists()
+    calls = {}
+
+    async def fake_vector(qvec, top_k, document_ids, embed_mode, owner_id=None):
+        calls["vector"] = top_k
+        return [dict(v) for v in vector]
+
+    def fake_lex(query, top_k, document_ids):
+        calls["keyword"] = top_k
+        return [dict(k) for k in keyword]
+
+    monkeypatch.setattr(retrieval, "_vector_search", fake_vector)
+    monkeypatch.setattr(retrieval, "_lex_search", fake_lex)
+    monkeypatch.setattr(retrieval.settings, "fusion_overfetch", 4)
+    results = asyncio.run(retrieval.search("q", 2, query_vectors=[[1.0, 0.0]], fusion_strategy="convex", hybrid_weight=0.5))
+    assert calls == {"vector": 8, "keyword": 8}
+    assert len(results) == 2 and results[0]["chunk_id"] == "c"
+
+
+@pytest.mark.parametrize("strategy", fusion.STRATEGIES)
+def test_relevance_is_absolute_whatever_the_strategy(strategy):
+    far = fusion.fuse([_hit("a", 0.1, "vector"), _hit("b", 0.05, "vector")], [], 5, strategy=strategy)
+    assert [r["relevance"] for r in far] == pytest.approx([0.1, 0.05])
+    near = fusion.fuse([], [_hit("d", 9.0, "keyword", max_score=10.0)], 5, strategy=strategy)
+    assert near[0]["relevance"] == pytest.approx(0.9)
@@ -0,0 +1,46 @@
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+from app.core import http_client
+
+
+def test_shared_client_reuses_connections():
+    accepted = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            accepted.append(1)
+            super().setup()
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    async def run():
+        for _ in range(5):
+            (await http_client.get_client().get(url)).raise_for_status()
+        stats = http_client.pool_stats()
+        await http_client.aclose()
+        return stats
+
+    try:
+        stats = asyncio.run(run())
+        assert len(accepted) == 1
+        assert stats["requests"] == 5 and stats["connections"] == 1 and stats["idle"] == 1
+        # A new event loop gets its own client instead of the closed loop's pool.
+        asyncio.run(run())
+        assert len(accepted) == 2
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,114 @@
+import asyncio
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.services import jobs, tasks
+
+
+async def _make_document() -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        doc = models.Document(filename="t.txt", content_type="text/plain", original_path="x", status="queued")
+        session.add(doc)
+        await session.commit()
+        return doc.id
+
+
+def test_job_retries_then_succeeds(monkeypatch):
+    calls = []
+
+    async def flaky_ingest(document_id, object_name, content_type, gemini_key=None, progress=None):
+        calls.append(document_id)
+        await progress.stage("parsing")
+        await progress.update(pages_parsed=3, pages_total=3)
+        if len(calls) == 1:
+            raise RuntimeError("transient")
+        return {"document_id": document_id, "chunks": 1, "error": None}
+
+    monkeypatch.setattr(tasks, "ingest_document", flaky_ingest)
+    monkeypatch.setattr(jobs.settings, "ingest_retry_backoff_s", 0.01)
+
+    async def scenario():
+        doc_id = await _make_document()
+        queue = jobs.IngestQueue()
+        await queue.start(workers=1)
+        job_id = await queue.submit(doc_id, "x", "text/plain")
+        for _ in range(200):
+            job = await queue.get(job_id)
+            if job["status"] in (jobs.SUCCESS, jobs.FAILURE):
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job["status"] == jobs.SUCCESS
+    assert job["attempts"] == 2
+    assert job["progress"]["pages_total"] == 3
+
+
+def test_cancel_for_document_waits_for_the_running_job(monkeypatch):
+    checkpoints = {"on": True}
+
+    async def slow_ingest(document_id, object_name, content_type, gemini_key=None, progress=None):
+        for _ in range(500):
+            if checkpoints["on"]:
+                progress.check_cancelled()
+            await asyncio.sleep(0.01)
+        return {"document_id": document_id, "chunks": 1, "error": None}
+
+    monkeypatch.setattr(tasks, "ingest_document", slow_ingest)
+
+    async def scenario():
+        queue = jobs.IngestQueue()
+        await queue.start(workers=1)
+        results = []
+        for checked in (True, False):
+            checkpoints["on"] = checked
+            doc_id = await _make_document()
+            job_id = await queue.submit(doc_id, "x", "text/plain")
+            while (await queue.get(job_id))["status"] != jobs.STARTED:
+                await asyncio.sleep(0.01)
+            stopped = await queue.cancel_for_document(doc_id, wait_s=0.5)
+            results.append((stopped, (await queue.get(job_id))["status"]))
+        await queue.stop()
+        return results
+
+    (stopped, status), (stuck, stuck_status) = asyncio.run(scenario())
+    assert stopped and status == jobs.REVOKED
+    assert not stuck and stuck_status == jobs.STARTED
+
+
+def test_jobs_shared_by_two_processes_run_once_and_cancel_across_them(monkeypatch):
+    runs = []
+
+    async def slow_ingest(document_id, object_name, content_type, gemini_key=None, progress=None):
+        runs.append(document_id)
+        for _ in range(300):
+            progress.check_cancelled()
+            await asyncio.sleep(0.01)
+        return {"document_id": document_id, "chunks": 1, "error": None}
+
+    monkeypatch.setattr(tasks, "ingest_document", slow_ingest)
+    monkeypatch.setattr(jobs.settings, "ingest_lease_s", 0.3)
+
+    async def scenario():
+        # Two queues stand in for two uvicorn workers sharing the jobs table.
+        first, second = jobs.IngestQueue(), jobs.IngestQueue()
+        doc_id = await _make_document()
+        job_id = await first.submit(doc_id, "x", "text/plain", run_inline=False)
+        await second.start(workers=1)
+        second._schedule(job_id)
+        while (await first.get(job_id))["status"] != jobs.STARTED:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.5)  # past the lease: renewals keep it from being taken over
+        await second._recover()
+        stopped = await second.cancel_for_document(doc_id, wait_s=2.0)
+        job = await first.get(job_id)
+        await first.stop()
+        await second.stop()
+        return doc_id, stopped, job
+
+    doc_id, stopped, job = asyncio.run(scenario())
+    assert runs == [doc_id]
+    assert stopped and job["status"] == jobs.REVOKED and job["attempts"] == 1
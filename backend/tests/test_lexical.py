@@ -0,0 +1,40 @@
+from app.services.lexical import LexicalIndex
+
+
+def _index():
+    index = LexicalIndex()
+    index.add([
+        {"text": "annual leave policy grants twenty days of leave", "document_id": 1, "page": 1},
+        {"text": "the expense policy covers travel and meals", "document_id": 1, "page": 2},
+        {"text": "the leave request form goes to the manager", "document_id": 2, "page": 1},
+        {"text": "the the the the the", "document_id": 3, "page": 1},
+    ])
+    return index
+
+
+def test_bm25_ranking_and_filter():
+    index = _index()
+    hits = index.search("leave policy", 3)
+    assert [h["page"] for h in hits][:2] == [1, 2] and hits[0]["document_id"] == 1
+    assert {h["document_id"] for h in index.search("leave", 5, document_ids=[2])} == {2}
+    assert index.search("unknownterm", 5) == []
+
+
+def test_delete_document_removes_postings():
+    index = _index()
+    index.delete_document(1)
+    assert len(index) == 2
+    assert [h["document_id"] for h in index.search("leave policy", 5)] == [2]
+    index.compact()
+    assert [h["document_id"] for h in index.search("leave", 5)] == [2]
+
+
+def test_readding_chunk_id_replaces_entry():
+    index = LexicalIndex()
+    index.add([{"text": "leave policy", "document_id": 1, "page": 1, "chunk_id": "a"}])
+    index.add([{"text": "leave policy", "document_id": 1, "page": 1, "chunk_id": "a"}])
+    index.update_pages({"a": 4})
+    assert len(index) == 1
+    assert [(h["chunk_id"], h["page"]) for h in index.search("leave", 5)] == [("a", 4)]
+    index.delete_chunks(["a"])
+    assert index.search("leave", 5) == []
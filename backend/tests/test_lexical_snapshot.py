@@ -0,0 +1,135 @@
+import asyncio
+import uuid
+from sqlalchemy import delete
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.services import lexical_snapshot, lexical_sync
+from app.services.lexical import LexicalIndex, tokenize_batch
+
+ROWS = [
+    (1, "c1", 1, 1, "annual leave policy grants twenty days of leave"),
+    (2, "c2", 1, 2, "the expense policy covers travel and meals"),
+    (3, None, 2, 1, "!!"),
+    (4, "c4", 2, 1, "the leave request form goes to the manager"),
+    (5, "c5", 3, 1, "the the the the the"),
+]
+
+
+def _snapshot(tmp_path, rows=ROWS):
+    builder = lexical_snapshot.SnapshotBuilder(str(tmp_path))
+    builder.add_batch(tokenize_batch([r[4] for r in rows[:2]]), rows[:2])
+    builder.add_batch(tokenize_batch([r[4] for r in rows[2:]]), rows[2:])
+    return lexical_snapshot.Snapshot(builder.write())
+
+
+def _memory(rows=ROWS):
+    index = LexicalIndex()
+    index.add([{"chunk_id": c, "document_id": d, "page": p, "text": t} for _, c, d, p, t in rows])
+    return index
+
+
+def _results(index, query, **kw):
+    return [(h["chunk_id"], round(h["score"], 6), h["text"]) for h in index.search(query, 5, **kw)]
+
+
+def test_mapped_snapshot_matches_in_memory_index(tmp_path):
+    snapshot = _snapshot(tmp_path)
+    assert snapshot.count == 4 and snapshot.max_row_id == 5
+    assert lexical_snapshot.current(str(tmp_path)) == snapshot.path
+    index = LexicalIndex()
+    index.attach(snapshot)
+    memory = _memory()
+    for query in ("leave policy", "the manager", "travel", "nothing"):
+        assert _results(index, query) == _results(memory, query)
+    assert _results(index, "leave", document_ids=[2]) == _results(memory, "leave", document_ids=[2])
+
+    # Changes on top of the snapshot behave like the in-memory index.
+    for ix in (index, memory):
+        ix.add([{"chunk_id": "c1", "document_id": 1, "page": 7, "text": "annual leave policy grants thirty days"}])
+        ix.add([{"chunk_id": "c9", "document_id": 4, "page": 1, "text": "parking policy"}])
+        ix.delete_document(2)
+        ix.update_pages({"c2": 3})
+    assert _results(index, "policy") == _results(memory, "policy")
+    assert sorted(index.chunk_ids().tolist()) == [b"c1", b"c2", b"c5", b"c9"]
+    assert index.changes_since_snapshot == 4  # two adds, the replaced c1 and deleted c4
+    index.compact()
+    memory.compact()
+    assert index.snapshot is snapshot and index.changes_since_snapshot == 4
+    assert _results(index, "policy") == _results(memory, "policy")
+    assert sorted(index.chunk_ids().tolist()) == [b"c1", b"c2", b"c5", b"c9"]
+    index.add([{"chunk_id": "c10", "document_id": 5, "page": 2, "text": "policy on leave carryover"}])
+    index.delete_chunks(["c9"])
+    memory.add([{"chunk_id": "c10", "document_id": 5, "page": 2, "text": "policy on leave carryover"}])
+    memory.delete_chunks(["c9"])
+    assert _results(index, "policy leave") == _results(memory, "policy leave")
+
+
+def test_restore_rebuilds_then_maps_and_catches_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(lexical_sync.settings, "lexical_index_dir", str(tmp_path))
+
+    async def add_rows(document_id, texts):
+        async with SessionLocal() as session:
+            doc = models.Document(id=document_id, filename="x.txt", content_type="text/plain", status="ingested")
+            session.add(doc)
+            for i, text in enumerate(texts):
+                session.add(models.Chunk(document_id=document_id, chunk_id=str(uuid.uuid4()), page=i, text=text))
+            await session.commit()
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await add_rows(9101, [f"handbook section {i} about remote work" for i in range(20)])
+        first = await lexical_sync.restore(LexicalIndex())
+        await add_rows(9102, ["a note about bicycle parking"])
+        index = LexicalIndex()
+        second = await lexical_sync.restore(index)
+        async with SessionLocal() as session:
+            await session.execute(delete(models.Chunk).where(models.Chunk.text == "handbook section 3 about remote work"))
+            await session.commit()
+        deleted = await lexical_sync.catch_up(index, lexical_sync._seen_row_id, lexical_sync._seen_rows)
+        return first, second, deleted, index
+
+    first, second, deleted, index = asyncio.run(run())
+    assert first["mode"] == "rebuilt"
+    assert second["mode"] == "mapped" and second["version"] == first["version"] and second["added"] == 1
+    assert deleted == {"added": 0, "updated": 0, "removed": 1}
+    assert len(index) == 20
+    assert index.search("bicycle", 3)[0]["document_id"] == 9102
+    assert {h["document_id"] for h in index.search("remote work", 3)} == {9101}
+
+
+def test_reused_row_ids_are_detected_and_caught_up(tmp_path, monkeypatch):
+    from sqlalchemy import create_engine, text
+
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(text("CREATE TABLE chunks (id INTEGER PRIMARY KEY, document_id INTEGER, text TEXT)"))
+        assert models.chunk_row_ids_reused(conn)
+    with create_engine(f"sqlite:///{tmp_path / 'new.db'}").begin() as conn:
+        Base.metadata.create_all(conn)
+        assert not models.chunk_row_ids_reused(conn)
+
+    monkeypatch.setattr(lexical_sync.settings, "lexical_index_dir", str(tmp_path / "index"))
+    monkeypatch.setattr(lexical_sync, "_ids_reused", True)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with SessionLocal() as session:
+            session.add(models.Document(id=9103, filename="x.txt", content_type="text/plain", status="ingested"))
+            session.add(models.Chunk(document_id=9103, chunk_id=str(uuid.uuid4()), page=1, text="quarterly audit checklist"))
+            await session.commit()
+        index = LexicalIndex()
+        await lexical_sync.restore(index)
+        async with SessionLocal() as session:
+            top = (await session.execute(delete(models.Chunk).where(models.Chunk.document_id == 9103)
+                                         .returning(models.Chunk.id))).scalar_one()
+            # What SQLite without AUTOINCREMENT does: the next row takes the freed id.
+            session.add(models.Chunk(id=top, document_id=9103, chunk_id=str(uuid.uuid4()), page=2, text="vendor onboarding steps"))
+            await session.commit()
+        changes = await lexical_sync.catch_up(index, lexical_sync._seen_row_id, lexical_sync._seen_rows)
+        return changes, index
+
+    changes, index = asyncio.run(run())
+    assert changes == {"added": 1, "updated": 0, "removed": 1}
+    assert index.search("vendor onboarding", 1)[0]["page"] == 2 and not index.search("audit checklist", 1)
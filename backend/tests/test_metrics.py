@@ -0,0 +1,34 @@
+from fastapi.testclient import TestClient
+from app.core import metrics
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_render_counter_and_histogram():
+    counter = metrics.Counter("test_events_total", "Events.", ("kind",))
+    hist = metrics.Histogram("test_wait_seconds", "Waits.", buckets=(0.1, 1.0))
+    try:
+        counter.inc(kind="a")
+        counter.inc(2, kind='b"q')
+        for v in (0.05, 0.5, 5.0):
+            hist.observe(v)
+        text = metrics.render()
+    finally:
+        metrics._REGISTRY.remove(counter)
+        metrics._REGISTRY.remove(hist)
+    assert "# TYPE test_events_total counter" in text
+    assert 'test_events_total{kind="a"} 1' in text
+    assert 'test_events_total{kind="b\\"q"} 2' in text
+    assert 'test_wait_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_wait_seconds_bucket{le="1"} 2' in text
+    assert 'test_wait_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_wait_seconds_count 3" in text and "test_wait_seconds_sum 5.55" in text
+
+
+def test_metrics_endpoint_reports_ask_stages():
+    client.post("/ask", json={"question": "Who approves travel?"})
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    assert 'ask_stage_duration_seconds_count{stage="retrieve"}' in r.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/ask",status="200"}' in r.text
@@ -8,4 +8,19 @@ def test_out_of_scope_empty_index():
     r = client.post("/ask", json={"question": "What is the capital of France?"})
     assert r.status_code == 200
     data = r.json()
-    assert data["answer_type"] == "out_of_scope"
\ No newline at end of file
+    assert data["answer_type"] == "out_of_scope"
+
+
+def test_unrelated_question_over_populated_index_is_out_of_scope(monkeypatch):
+    from app.services import retrieval
+
+    async def far_vectors(qvec, top_k, document_ids, embed_mode, owner_id=None):
+        # Nearest neighbours always exist once documents are indexed, however unrelated.
+        return [{"chunk_id": f"c{i}", "score": 0.12 - i * 0.01, "text": f"invoice line {i}", "page": 1,
+                 "document_id": 1, "mode": "vector"} for i in range(5)]
+
+    monkeypatch.setattr(retrieval, "_vector_search", far_vectors)
+    monkeypatch.setattr(retrieval, "_lex_search", lambda query, top_k, document_ids: [])
+    for strategy in ("rrf", "zscore", "convex"):
+        data = client.post("/ask", json={"question": "How tall is Mount Everest?", "fusion": strategy}).json()
+        assert data["answer_type"] == "out_of_scope"
@@ -0,0 +1,22 @@
+import asyncio
+import fitz
+from app.core import executors
+from app.services import parsing, tasks
+
+
+def _pdf(path, pages: int):
+    doc = fitz.open()
+    for i in range(pages):
+        doc.new_page().insert_text((72, 72), f"Page number {i + 1} body text")
+    doc.save(path)
+
+
+def test_sharded_pdf_parse_keeps_page_order(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.pdf")
+    _pdf(path, 20)
+    monkeypatch.setattr(executors.settings, "parse_workers", 0)
+    monkeypatch.setattr(tasks.settings, "parse_pages_per_task", 3)
+    pages = asyncio.run(tasks._parse("application/pdf", path, tasks.ProgressReporter()))
+    assert [p for p, _ in pages] == list(range(1, 21))
+    assert pages == parsing.parse_pdf(path)
+    assert "Page number 7" in pages[6][1]
@@ -0,0 +1,140 @@
+import asyncio
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.services import retrieval, storage, tasks
+
+
+def _write(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+class _Qdrant:
+    """Stands in for the Qdrant client; `up = False` makes every call fail like an outage."""
+
+    def __init__(self):
+        self.up = True
+        self.points = set()
+
+    def _check(self):
+        if not self.up:
+            raise ConnectionError("qdrant down")
+
+    async def upsert(self, collection_name, points):
+        self._check()
+        self.points.update(p.id for p in points)
+
+    async def batch_update_points(self, collection_name, update_operations):
+        self._check()
+
+    async def delete(self, collection_name, points_selector):
+        self._check()
+
+
+def _fake_qdrant(monkeypatch) -> _Qdrant:
+    qdrant = _Qdrant()
+
+    async def ensure_collection(vector_size=None, collection=None):
+        qdrant._check()
+
+    monkeypatch.setattr(retrieval, "client", qdrant)
+    monkeypatch.setattr(retrieval, "ensure_collection", ensure_collection)
+    return qdrant
+
+
+async def _new_document(object_name):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with SessionLocal() as session:
+        doc = models.Document(filename="p.txt", content_type="text/plain", original_path=object_name, status="queued")
+        session.add(doc)
+        await session.commit()
+        return doc.id
+
+
+def test_reingest_only_embeds_changed_chunks(tmp_path, monkeypatch):
+    paragraphs = [f"Paragraph {i}. " + "Policy text about leave and travel. " * 8 for i in range(12)]
+    files = {
+        "v1": "\n\n".join(paragraphs),
+        "v2": "\n\n".join(paragraphs[:5] + ["A brand new paragraph about parking. " * 3] + paragraphs[5:]),
+    }
+    monkeypatch.setattr(storage, "download_to_tempfile", lambda name: _write(tmp_path, name + ".txt", files[name]))
+    embedded = []
+    real_embed = retrieval.embed_texts
+
+    async def counting_embed(texts):
+        embedded.append(len(texts))
+        return await real_embed(texts)
+
+    monkeypatch.setattr(retrieval, "embed_texts", counting_embed)
+    monkeypatch.setattr(tasks.settings, "chunk_size", 400)
+    _fake_qdrant(monkeypatch)
+
+    async def run():
+        doc_id = await _new_document("v1")
+        first = await tasks.ingest_document(doc_id, "v1", "text/plain")
+        again = await tasks.ingest_document(doc_id, "v1", "text/plain")
+        edited = await tasks.ingest_document(doc_id, "v2", "text/plain")
+        async with SessionLocal() as session:
+            rows = (await session.execute(models.Chunk.__table__.select().where(models.Chunk.document_id == doc_id))).fetchall()
+            stored = await session.get(models.DocumentText, doc_id)
+            doc = await session.get(models.Document, doc_id)
+        return first, again, edited, rows, stored.text, doc.status
+
+    first, again, edited, rows, stored, status = asyncio.run(run())
+    assert status == "ingested" and "parking" in stored
+    assert sorted(r.position for r in rows) == list(range(len(rows)))
+    assert first["error"] is None and first["embedded"] == first["chunks"]
+    assert again["embedded"] == 0
+    assert 0 < edited["embedded"] < edited["chunks"]
+    assert len(rows) == edited["chunks"]
+    assert sum(embedded) == first["chunks"] + edited["embedded"]
+    # No duplicates in the in-process indexes after three ingestions.
+    assert len(retrieval._LEX_INDEX) == edited["chunks"]
+    hits = retrieval._LEX_INDEX.search("parking", 3)
+    assert hits and hits[0]["chunk_id"] in {r.chunk_id for r in rows}
+
+
+def test_chunks_missing_from_qdrant_are_upserted_on_the_next_ingestion(tmp_path, monkeypatch):
+    text = "\n\n".join(f"Section {i}. " + "Rules about expense approval. " * 8 for i in range(6))
+    monkeypatch.setattr(storage, "download_to_tempfile", lambda name: _write(tmp_path, name + ".txt", text))
+    monkeypatch.setattr(tasks.settings, "chunk_size", 400)
+    qdrant = _fake_qdrant(monkeypatch)
+
+    async def pending(doc_id):
+        async with SessionLocal() as session:
+            rows = (await session.execute(models.Chunk.__table__.select().where(models.Chunk.document_id == doc_id))).fetchall()
+        return {r.chunk_id for r in rows if r.vector_pending}, {r.chunk_id for r in rows}
+
+    async def run():
+        doc_id = await _new_document("doc")
+        qdrant.up = False
+        down = await tasks.ingest_document(doc_id, "doc", "text/plain")
+        during = await pending(doc_id)
+        qdrant.up = True
+        up = await tasks.ingest_document(doc_id, "doc", "text/plain")
+        return down, during, up, await pending(doc_id)
+
+    down, (pending_down, ids), up, (pending_up, _) = asyncio.run(run())
+    assert down["error"] is None and pending_down == ids
+    assert up["embedded"] == up["chunks"] and pending_up == set()
+    assert ids <= qdrant.points
+
+
+def test_legacy_aggregated_text_moves_out_of_documents(tmp_path):
+    from sqlalchemy import create_engine, inspect, text
+
+    engine_ = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine_.begin() as conn:
+        conn.execute(text("CREATE TABLE documents (id INTEGER PRIMARY KEY, filename VARCHAR, status VARCHAR, aggregated_text TEXT)"))
+        conn.execute(text("INSERT INTO documents VALUES (1, 'a.txt', 'ingested', 'old text'), (2, 'b.txt', 'queued', NULL)"))
+        Base.metadata.create_all(conn)
+        models.upgrade_schema(conn)
+        models.upgrade_schema(conn)  # idempotent
+        moved = conn.execute(text("SELECT document_id, text FROM document_texts")).fetchall()
+        left = conn.execute(text("SELECT count(*) FROM documents WHERE aggregated_text IS NOT NULL")).scalar()
+        indexes = {ix["name"] for ix in inspect(conn).get_indexes("documents")}
+        columns = {c["name"] for c in inspect(conn).get_columns("documents")}
+    assert [tuple(r) for r in moved] == [(1, "old text")] and left == 0
+    assert {"ix_documents_status_id", "ix_documents_owner_id_id"} <= indexes and "owner_id" in columns
@@ -0,0 +1,15 @@
+from fastapi.testclient import TestClient
+from app.api import routes
+from app.main import app
+
+client = TestClient(app)
+
+
+def test_ask_reports_stage_timings(monkeypatch):
+    async def search(*args, **kwargs):
+        return []
+
+    monkeypatch.setattr(routes.retrieval, "search", search)
+    data = client.post("/ask", json={"question": "Who signs the expense reports?"}).json()
+    assert data["chunk_ids"] == []
+    assert {"embed_ms", "retrieve_ms"} <= set(data["timings"])
@@ -0,0 +1,67 @@
+import asyncio
+import json
+import httpx
+from app.core import http_client, runtime_state
+from app.services import rag
+
+CONTEXT = [{"page": 2, "text": "Employees accrue two days of paid leave per month.", "document_id": 1}]
+
+
+def _sse(pieces):
+    events = [{"candidates": [{"content": {"parts": [{"text": p}]}}]} for p in pieces]
+    return "".join(f"data: {json.dumps(e)}\r\n\r\n" for e in events).encode()
+
+
+def _collect(monkeypatch, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http_client, "get_client", lambda: client)
+    runtime_state.set_gemini_key("test-key")
+
+    async def run():
+        return [e async for e in rag.stream_answer("How much leave do employees accrue?", CONTEXT)]
+
+    try:
+        return asyncio.run(run())
+    finally:
+        runtime_state.clear_gemini_key()
+
+
+def test_stream_forwards_tokens_and_parses_trailing_metadata(monkeypatch):
+    body = _sse(["Two days ", "per month", ".\n###", 'META {"answer_type": "factual", "sources": ["page:2"]}'])
+    events = _collect(monkeypatch, lambda request: httpx.Response(200, content=body))
+    deltas = [e["delta"] for e in events if "delta" in e]
+    final = events[-1]["final"]
+    assert len(deltas) >= 2
+    assert "".join(deltas).strip() == final["answer"] == "Two days per month."
+    assert final["answer_type"] == "factual" and final["sources"] == ["page:2"]
+    assert final["generation_mode"] == "gemini"
+
+
+def test_stream_falls_back_to_extractive_answer(monkeypatch):
+    events = _collect(monkeypatch, lambda request: httpx.Response(500))
+    assert len(events) == 1
+    final = events[0]["final"]
+    assert final["generation_mode"] == "fallback"
+    assert "leave" in final["answer"]
+
+
+def test_stream_endpoint_sends_each_delta_once(monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.api import stream
+    from app.main import app
+
+    async def search(*args, **kwargs):
+        return [dict(CONTEXT[0], chunk_id="c1", relevance=0.9)]
+
+    async def answer(question, context):
+        for piece in ("Two days ", "per month", "."):
+            yield {"delta": piece}
+        yield {"final": {"answer": "Two days per month.", "answer_type": "factual", "sources": ["page:2"]}}
+
+    monkeypatch.setattr(stream.retrieval, "search", search)
+    monkeypatch.setattr(stream.rag, "stream_answer", answer)
+    body = TestClient(app).post("/ask/stream", json={"question": "How much leave?", "fusion": "rrf"}).text
+    events = [json.loads(block[len("data: "):]) for block in body.split("\n\n") if block.startswith("data: ")]
+    deltas = [e for e in events if "delta" in e]
+    assert [set(e) for e in deltas] == [{"delta"}] * 3
+    assert "".join(e["delta"] for e in deltas) == events[-1]["answer"] == "Two days per month."
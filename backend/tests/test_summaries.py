@@ -0,0 +1,95 @@
+import asyncio
+import json
+import httpx
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.services import rag, summaries
+
+
+def _chunks(texts):
+    return [{"text": t, "page": i // 3 + 1, "page_end": None, "char_start": None, "char_end": None} for i, t in enumerate(texts)]
+
+
+def test_sections_are_stable_around_an_edit():
+    texts = [f"Paragraph {i} about budgets, travel and approvals. " * 8 for i in range(120)]
+    before = summaries.split_sections(_chunks(texts), 2000, 400)
+    edited = list(texts)
+    edited[60] = "A rewritten paragraph about parking permits. " * 9
+    after = summaries.split_sections(_chunks(edited), 2000, 400)
+    assert len(before) > 5 and "".join(s["text"] for s in before) == "".join(texts)
+    changed = {s["text"] for s in after} - {s["text"] for s in before}
+    assert 1 <= len(changed) <= 2
+
+
+def test_overlap_is_trimmed():
+    chunks = [
+        {"text": "abcdef", "page": 1, "page_end": None, "char_start": 0, "char_end": 6},
+        {"text": "efghij", "page": 1, "page_end": None, "char_start": 4, "char_end": 10},
+    ]
+    assert summaries.split_sections(chunks, 1000, 6)[0]["text"] == "abcdefghij"
+
+
+def test_summaries_are_cached_and_recomputed_only_where_changed(monkeypatch):
+    calls = []
+
+    async def fake_complete(prompt, stage, timeout=None):
+        calls.append(stage)
+        if prompt.startswith("You are a summarization assistant"):
+            return json.dumps({"answer": "whole document", "sources": ["1"]}), {"prompt_tokens": 10, "output_tokens": 5}
+        return f"summary {len(calls)}", {"prompt_tokens": 10, "output_tokens": 5}
+
+    monkeypatch.setattr(summaries.rag, "complete", fake_complete)
+    monkeypatch.setattr(summaries.settings, "summary_section_chars", 2000)
+    monkeypatch.setattr(summaries.settings, "summary_reduce_fanin", 3)
+    monkeypatch.setattr(summaries.settings, "chunk_size", 400)
+    texts = [f"Paragraph {i} about budgets, travel and approvals. " * 8 for i in range(120)]
+
+    async def write_chunks(doc_id, texts):
+        async with SessionLocal() as session:
+            await session.execute(models.Chunk.__table__.delete().where(models.Chunk.document_id == doc_id))
+            session.add_all([models.Chunk(document_id=doc_id, position=i, page=i // 3 + 1, text=t) for i, t in enumerate(texts)])
+            await session.commit()
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with SessionLocal() as session:
+            doc = models.Document(filename="s.txt", content_type="text/plain", original_path="s", status="ingested")
+            session.add(doc)
+            await session.commit()
+            doc_id = doc.id
+        await write_chunks(doc_id, texts)
+        first = await summaries.summarize_document(doc_id)
+        first_calls = len(calls)
+        again = await summaries.summarize_document(doc_id)
+        edited = list(texts)
+        edited[60] = "A rewritten paragraph about parking permits. " * 9
+        await write_chunks(doc_id, edited)
+        third = await summaries.summarize_document(doc_id)
+        async with SessionLocal() as session:
+            stored = (await session.execute(models.SectionSummary.__table__.select().where(models.SectionSummary.document_id == doc_id))).fetchall()
+        return first, first_calls, again, third, len(stored)
+
+    first, first_calls, again, third, stored = asyncio.run(run())
+    sections = first["usage"]["sections"]
+    assert first["answer"] == "whole document" and first["usage"]["model_calls"] == first_calls > sections
+    assert first["usage"]["prompt_tokens"] == 10 * first_calls
+    assert again["usage"]["model_calls"] == 0 and again["answer"] == "whole document"
+    # One or two changed sections plus the reduce path above them.
+    assert 2 <= third["usage"]["model_calls"] <= 6 < first_calls
+    assert stored == first_calls
+
+
+def test_complete_keeps_the_client_timeout_unless_given(monkeypatch):
+    seen = []
+
+    class Client:
+        async def post(self, url, json, timeout):
+            seen.append(timeout)
+            body = {"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}
+            return httpx.Response(200, json=body, request=httpx.Request("POST", url))
+
+    monkeypatch.setattr(rag.http_client, "get_client", lambda: Client())
+    assert asyncio.run(rag.complete("p", "test"))[0] == "ok"
+    asyncio.run(rag.complete("p", "test", 12.0))
+    assert seen == [httpx.USE_CLIENT_DEFAULT, 12.0]
@@ -0,0 +1,68 @@
+import asyncio
+from fastapi.testclient import TestClient
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.main import app
+from app.services import retrieval, storage, tasks, tenants
+
+
+def test_owner_map_scopes_documents():
+    owners = tenants.OwnerMap()
+    owners.update([(1, "acme"), (2, "globex"), (3, None), (4, "acme")])
+    assert owners.scope("acme", None) == [1, 4]
+    assert owners.scope("acme", [2, 4]) == [4]
+    assert owners.scope(None, None) == [3]
+    owners.set(4, "globex")
+    owners.forget(1)
+    assert owners.scope("acme", None) == [] and owners.scope("globex", None) == [2, 4]
+
+
+def test_search_listing_and_documents_are_scoped_by_owner(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval.settings, "multi_tenant", True)
+    texts = {
+        "acme": "Acme parking permits are issued by the facilities desk. " * 6,
+        "globex": "Globex parking permits are issued by the security office. " * 6,
+        None: "Shared parking permits are issued at the front gate. " * 6,
+    }
+
+    def download(name):
+        path = tmp_path / f"{name}.txt"
+        path.write_text(texts[None if name == "shared" else name])
+        return str(path)
+
+    monkeypatch.setattr(storage, "download_to_tempfile", download)
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        ids = {}
+        async with SessionLocal() as session:
+            for owner in texts:
+                doc = models.Document(filename=f"{owner}.txt", content_type="text/plain", original_path=owner or "shared",
+                                      status="queued", owner_id=owner)
+                session.add(doc)
+                await session.commit()
+                ids[owner] = doc.id
+        for owner, doc_id in ids.items():
+            await tasks.ingest_document(doc_id, owner or "shared", "text/plain")
+        async with SessionLocal() as session:
+            rows = (await session.execute(models.Chunk.__table__.select().where(models.Chunk.document_id == ids["acme"]))).fetchall()
+        hits = {owner: await retrieval.search("parking permits issued", 5, owner_id=owner) for owner in texts}
+        hits["nobody"] = await retrieval.search("parking permits issued", 5, owner_id="nobody")
+        return ids, rows, hits
+
+    ids, rows, hits = asyncio.run(run())
+    assert rows and all(r.owner_id == "acme" for r in rows)
+    for owner in ("acme", "globex"):
+        assert hits[owner] and {h["document_id"] for h in hits[owner]} == {ids[owner]}
+    # Unowned documents left by other tests may match as well.
+    unowned = {h["document_id"] for h in hits[None]}
+    assert ids[None] in unowned and not unowned & {ids["acme"], ids["globex"]}
+    assert hits["nobody"] == []
+
+    with TestClient(app) as client:
+        listed = {d["id"] for d in client.get("/documents", headers={"X-Owner-Id": "acme"}).json()}
+        assert ids["acme"] in listed and not listed & {ids["globex"], ids[None]}
+        assert ids[None] in {d["id"] for d in client.get("/documents").json()}
+        assert client.delete(f"/documents/{ids['acme']}", headers={"X-Owner-Id": "globex"}).status_code == 404
+        assert client.get("/documents", headers={"X-Owner-Id": "bad id!"}).status_code == 400
@@ -0,0 +1,94 @@
+import asyncio
+import hashlib
+import os
+import pytest
+from app.services import storage, uploads
+
+BOUNDARY = "testboundary"
+
+
+def _body(payload: bytes, filename: str = "a.txt", content_type: str = "text/plain") -> bytes:
+    return (
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"note\"\r\n\r\nhello\r\n"
+        f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode() + payload + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def _chunks(data: bytes, size: int = 7919):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class _Sink:
+    """Reads the stream the way MinIO does: fixed-size parts until EOF."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.error = None
+
+    def __call__(self, stream, object_name, content_type):
+        try:
+            while True:
+                part = stream.read(65536)
+                self.data += part
+                if len(part) < 65536:
+                    return object_name
+        except Exception as e:
+            self.error = e
+            raise
+
+
+def test_stream_upload_round_trip():
+    payload = bytes(range(256)) * 4000
+    sink = _Sink()
+    stored = asyncio.run(uploads.stream_upload(
+        f"multipart/form-data; boundary={BOUNDARY}", _chunks(_body(payload)), 10 * 1024 * 1024, put=sink,
+    ))
+    assert bytes(sink.data) == payload
+    assert stored.size == len(payload)
+    assert stored.sha256 == hashlib.sha256(payload).hexdigest()
+    assert stored.filename == "a.txt" and stored.content_type == "text/plain"
+    assert stored.object_name.endswith("_a.txt")
+
+
+def test_stream_upload_enforces_limit_and_aborts_storage():
+    sink = _Sink()
+    with pytest.raises(uploads.UploadTooLarge):
+        asyncio.run(uploads.stream_upload(
+            f"multipart/form-data; boundary={BOUNDARY}", _chunks(_body(b"x" * 200_000)), 100_000, put=sink,
+        ))
+    assert isinstance(sink.error, uploads.UploadTooLarge)
+
+
+class _Response:
+    def __init__(self, fail_after: int):
+        self.fail_after, self.released = fail_after, False
+
+    def stream(self, chunk_size):
+        for _ in range(self.fail_after):
+            yield b"x" * chunk_size
+        raise ConnectionError("reset")
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        self.released = True
+
+
+@pytest.mark.parametrize("fail_in", ["get_object", "stream"])
+def test_download_to_tempfile_cleans_up_on_failure(tmp_path, monkeypatch, fail_in):
+    response = _Response(fail_after=2)
+
+    def get_object(bucket, name):
+        if fail_in == "get_object":
+            raise ConnectionError("refused")
+        return response
+
+    monkeypatch.setattr(storage.settings, "ingest_tmp_dir", str(tmp_path))
+    monkeypatch.setattr(storage._client, "get_object", get_object)
+    with pytest.raises(ConnectionError):
+        storage.download_to_tempfile("doc.pdf", chunk_size=4)
+    assert os.listdir(tmp_path) == []
+    assert response.released == (fail_in == "stream")
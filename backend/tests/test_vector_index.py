@@ -0,0 +1,146 @@
+import asyncio
+import uuid
+import numpy as np
+from app.db.session import engine, Base, SessionLocal
+from app.db import models
+from app.services import vector_sync
+from app.services.vector_index import VectorIndex
+
+
+def test_search_filter_and_delete():
+    index = VectorIndex()
+    index.add(
+        [[1.0, 0.0], [0.0, 2.0], [0.9, 0.1], [1.0, 0.0, 0.0]],
+        [{"text": "a", "document_id": 1}, {"text": "b", "document_id": 2}, {"text": "c", "document_id": 2}, {"text": "d", "document_id": 3}],
+    )
+    assert len(index) == 4
+    assert [r["text"] for r in index.search([1.0, 0.0], 2)] == ["a", "c"]
+    assert [r["text"] for r in index.search([1.0, 0.0], 5, document_ids=[2])] == ["c", "b"]
+    # only the segment matching the query dimension is scanned
+    assert [r["text"] for r in index.search([0.0, 0.0, 1.0], 5)] == ["d"]
+    index.delete_document(2)
+    assert [r["text"] for r in index.search([0.0, 1.0], 5)] == ["a"]
+
+
+def test_chunk_ids_are_unique():
+    index = VectorIndex()
+    index.add([[1.0, 0.0]], [{"text": "a", "document_id": 1, "chunk_id": "x"}])
+    index.add([[0.0, 1.0]], [{"text": "a2", "document_id": 1, "chunk_id": "x"}])
+    assert len(index) == 1
+    assert index.search([0.0, 1.0], 5)[0]["text"] == "a2"
+    index.delete_chunks(["x"])
+    assert len(index) == 0
+
+
+def test_quantized_search_rescores_exactly():
+    rng = np.random.default_rng(3)
+    centers = rng.standard_normal((20, 256)).astype(np.float32)
+    vectors = centers[rng.integers(0, 20, 3000)] + 0.3 * rng.standard_normal((3000, 256)).astype(np.float32)
+    chunks = [{"text": str(i), "document_id": i % 7 + 1, "chunk_id": f"c{i}"} for i in range(3000)]
+    exact = VectorIndex()
+    exact.add(vectors, chunks)
+    for mode in ("int8", "binary"):
+        index = VectorIndex(mode, rescore=8)
+        index.add(vectors, chunks)
+        assert index.nbytes < exact.nbytes / (3 if mode == "int8" else 10)
+        recall = []
+        for q in vectors[:50] + 0.1 * rng.standard_normal((50, 256)).astype(np.float32):
+            want = [r["chunk_id"] for r in exact.search(q, 10)]
+            got = index.search(q, 10)
+            recall.append(len({r["chunk_id"] for r in got} & set(want)) / 10)
+            # Hits carry exact cosine scores, so shared hits score identically.
+            assert abs(got[0]["score"] - exact.search(q, 1)[0]["score"]) < 1e-4 or got[0]["chunk_id"] != want[0]
+        assert np.mean(recall) > (0.95 if mode == "int8" else 0.8)
+        assert {r["document_id"] for r in index.search(vectors[0], 10, document_ids=[3])} == {3}
+        index.delete_document(3)
+        assert len(index) == len(exact) - sum(1 for c in chunks if c["document_id"] == 3)
+        assert all(r["document_id"] != 3 for r in index.search(vectors[0], 50))
+
+
+def _clustered(rng, n, dim=128, clusters=40):
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    return centers[rng.integers(0, clusters, n)] + 0.4 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def test_ivf_search_filters_deletes_and_survives_a_snapshot(tmp_path):
+    rng = np.random.default_rng(4)
+    vectors = _clustered(rng, 6000)
+    chunks = [{"text": f"t{i}", "document_id": i % 50 + 1, "page": i % 3, "chunk_id": f"c{i}"} for i in range(6000)]
+    exact = VectorIndex()
+    exact.add(vectors, chunks)
+    index = VectorIndex(ann_min_rows=4000, ann_probes=8)
+    index.add(vectors[:3000], chunks[:3000])
+    index.add(vectors[3000:], chunks[3000:])  # crosses ann_min_rows: lists are trained, later rows assigned on insert
+    queries = vectors[:40] + 0.1 * rng.standard_normal((40, 128)).astype(np.float32)
+    recall = [len({h["chunk_id"] for h in index.search(q, 10)} & {h["chunk_id"] for h in exact.search(q, 10)}) / 10
+              for q in queries]
+    assert np.mean(recall) > 0.9
+    assert {h["document_id"] for h in index.search(queries[0], 10, document_ids=[7])} == {7}
+    assert len(index.search(queries[0], 200, document_ids=[7])) == 120  # narrow filter: every row of the document
+
+    index.write(str(tmp_path / "v1"))
+    loaded = VectorIndex(ann_min_rows=4000, ann_probes=8)
+    loaded.load(str(tmp_path / "v1"))
+    assert len(loaded) == 6000
+    assert [h["chunk_id"] for h in loaded.search(queries[1], 10)] == [h["chunk_id"] for h in index.search(queries[1], 10)]
+    loaded.add([vectors[5]], [{"text": "replaced", "document_id": 1, "chunk_id": "c5"}])
+    loaded.delete_document(2)
+    loaded.update_pages({"c9": 7})
+    assert len(loaded) == 6000 - 120
+    assert loaded.search(vectors[5], 1)[0]["text"] == "replaced"
+    assert loaded.search(vectors[9], 1)[0]["page"] == 7
+    assert all(h["document_id"] != 2 for h in loaded.search(vectors[1], 50))
+    # The snapshot itself is untouched by changes to the mapped copy.
+    again = VectorIndex(ann_min_rows=4000)
+    again.load(str(tmp_path / "v1"))
+    assert len(again) == 6000 and again.search(vectors[5], 1)[0]["text"] == "t5"
+
+
+def test_frozen_view_ignores_mutations_made_while_it_is_written(tmp_path):
+    rng = np.random.default_rng(5)
+    vectors = rng.standard_normal((300, 16)).astype(np.float32)
+    chunks = [{"text": f"t{i}", "document_id": i % 3 + 1, "page": 0, "chunk_id": f"c{i}"} for i in range(300)]
+    for quantization in ("none", "int8"):
+        index = VectorIndex(quantization)
+        index.add(vectors[:200], chunks[:200])
+        with index.frozen() as view:
+            index.delete_document(1)
+            index.update_pages({"c2": 9})
+            index.add(vectors[200:], chunks[200:])
+            index.delete_chunks(["c5"])
+            view.write(str(tmp_path / quantization))
+        assert len(index) == 232 and index.search(vectors[2], 1)[0]["page"] == 9
+        assert index.search(vectors[250], 1)[0]["text"] == "t250"
+        loaded = VectorIndex(quantization)
+        loaded.load(str(tmp_path / quantization))
+        assert len(loaded) == 200
+        assert {loaded.search(vectors[i], 1)[0]["text"] for i in (0, 3, 5)} == {"t0", "t3", "t5"}
+        assert loaded.search(vectors[2], 1)[0]["page"] == 0
+
+
+def test_restore_maps_the_last_snapshot_and_drops_deleted_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_sync.settings, "vector_index_dir", str(tmp_path))
+    kept = [str(uuid.uuid4()) for _ in range(3)]
+
+    async def run():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with SessionLocal() as session:
+            session.add(models.Document(id=9201, filename="x.txt", content_type="text/plain", status="ingested"))
+            for i, cid in enumerate(kept):
+                session.add(models.Chunk(document_id=9201, chunk_id=cid, page=i, text=f"kept {i}"))
+            await session.commit()
+        index = VectorIndex()
+        index.add(np.eye(4, dtype=np.float32), [{"text": f"kept {i}", "document_id": 9201, "chunk_id": c} for i, c in enumerate(kept)]
+                  + [{"text": "gone", "document_id": 9201, "chunk_id": str(uuid.uuid4())}])
+        path = await vector_sync.save(index)
+        unchanged = await vector_sync.save(index)
+        restored = VectorIndex()
+        stats = await vector_sync.restore(restored)
+        return path, unchanged, stats, restored
+
+    path, unchanged, stats, restored = asyncio.run(run())
+    assert path and unchanged is None
+    assert stats["mode"] == "mapped" and stats["removed"] == 1 and len(restored) == 3
+    assert restored.search([0.0, 0.0, 1.0, 0.0], 1)[0]["text"] == "kept 2"
+    assert restored.search([0.0, 0.0, 0.0, 1.0], 3)[0]["text"] != "gone"
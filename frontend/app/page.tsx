@@ -59,7 +59,7 @@ export default function HomeUnified() {
 		const body = JSON.stringify({question:q, document_ids: selectedDocs.length? selectedDocs: undefined});
 		let reader:ReadableStreamDefaultReader<Uint8Array>|undefined;
 		try { setStreaming(true); const resp = await fetch(`${backend}/ask/stream`, {method:'POST', headers:{'Content-Type':'application/json'}, body}); reader = resp.body?.getReader(); const decoder = new TextDecoder(); let partial='';
-			while(reader){ const {done,value} = await reader.read(); if(done) break; const txt = decoder.decode(value); txt.split('\n\n').forEach(block=>{ if(!block.startsWith('data:')) return; const jsonPart = block.replace(/^data:\s*/,''); try { const obj = JSON.parse(jsonPart); if(obj.partial){ partial=obj.partial; setMessages(m=>{ const filtered = m.filter(x=>!(x as any)._streamingTemp); return [...filtered,{role:'assistant',content:partial,answer_type:'stream', _streamingTemp:true} as any]; }); } else if(obj.answer){ setMessages(m=>[...m.filter(x=>!(x as any)._streamingTemp), {role:'assistant', content:obj.answer, sources:obj.sources, answer_type: obj.answer_type, document_ids_used: obj.document_ids_used}]); setActiveAnswerDocs(obj.document_ids_used||[]); } } catch{} }); }
+			while(reader){ const {done,value} = await reader.read(); if(done) break; const txt = decoder.decode(value); txt.split('\n\n').forEach(block=>{ if(!block.startsWith('data:')) return; const jsonPart = block.replace(/^data:\s*/,''); try { const obj = JSON.parse(jsonPart); if(typeof obj.delta === 'string'){ partial+=obj.delta; setMessages(m=>{ const filtered = m.filter(x=>!(x as any)._streamingTemp); return [...filtered,{role:'assistant',content:partial,answer_type:'stream', _streamingTemp:true} as any]; }); } else if(obj.answer){ setMessages(m=>[...m.filter(x=>!(x as any)._streamingTemp), {role:'assistant', content:obj.answer, sources:obj.sources, answer_type: obj.answer_type, document_ids_used: obj.document_ids_used}]); setActiveAnswerDocs(obj.document_ids_used||[]); } } catch{} }); }
 		} catch { push({message:'Stream failed', type:'error'}); } finally { setStreaming(false); }
 	};
 